@@ -1,46 +1,103 @@
 # backend/ASR/medical_graphs.py
 
+import os
+import time
+import threading
 from langgraph.graph import StateGraph, END
 from typing import TypedDict, Dict, Any, List
 
-# 导入三个节点
-from backend.nodes.embedding_node import JinaEmbeddingNode
-from backend.nodes.rag_query_node import RAGQueryNode
-from backend.nodes.llm_doctor_node import LLMDoctorAdviceNode
+# 三个节点统一从进程级注册表获取
+from backend.nodes.registry import get_registry
+from backend.serving import metrics
+from backend.serving.result_cache import make_result_cache, result_key
+from backend.rag.multi_query import split_windows
 
 class MedicalState(TypedDict, total=False):
     """定义图的共享状态"""
     texts: List[str]
-    embeddings: List[List[float]]
+    embeddings: Any  # (n, dim) float32 numpy 矩阵；来自会话状态时为 list
     context: str
+    hits: List[Dict[str, Any]]  # RAG 命中列表（带检索分数），供 LLM 节点按 token 预算打包
+    packing: Dict[str, Any]     # 打包报告：预算、打包前后 token 数、节省的 token 数
+    generation: Dict[str, Any]  # 生成报告：生成 / 清洗后保留的 token 数、停止原因
     mode: str
     llm_output: str
+    # 会话相关：transcript 为送给 LLM 的对话（缺省取 texts[0]），
+    # reuse_session=True 表示 embeddings / context 已由会话状态提供，不必重算
+    transcript: str
+    session_id: str
+    reuse_session: bool
 
-def make_nodes():
-    """通用节点"""
-    embed = JinaEmbeddingNode()
-    rag = RAGQueryNode()
-    llm = LLMDoctorAdviceNode()
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """llm_doctor 前的结果缓存（进程内单例，所有图共享）"""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = make_result_cache() or False
+            if _result_cache:
+                metrics.register("llm_result_cache", _result_cache.stats)
+    return _result_cache or None
+
+SUMMARY_WINDOW_CHARS = int(os.getenv("RAG_SUMMARY_WINDOW_CHARS", "300"))
+
+def query_texts(state: MedicalState) -> List[str]:
+    """检索用的文本：报告模式把整段问诊记录切成多个窗口，一次批量向量化"""
+    texts = state["texts"]
+    if state.get("mode") == "final_report":
+        windows = [w for t in texts for w in split_windows(t, SUMMARY_WINDOW_CHARS)]
+        return windows or texts
+    return texts
+
+def make_nodes(nodes=None):
+    """通用节点；默认取注册表中的共享实例，也可传入 {"embed", "rag", "llm"}"""
+    nodes = nodes or get_registry().nodes()
+    embed, rag, llm = nodes["embed"], nodes["rag"], nodes["llm"]
     
     def embedding_node_fn(state: MedicalState) -> Dict[str, Any]:
-        return embed.run({"texts": state["texts"]})
+        emb = state.get("embeddings")
+        if state.get("reuse_session") and emb is not None and len(emb):
+            return {}
+        return embed.run({"texts": query_texts(state)})
     
     def rag_query_node_fn(state: MedicalState) -> Dict[str, Any]:
-        return rag.run({"embeddings": state["embeddings"]})
+        if state.get("reuse_session") and state.get("context"):
+            return {}
+        return rag.run({"embeddings": state["embeddings"], "texts": query_texts(state)})
     
     def llm_node_fn(state: MedicalState) -> Dict[str, Any]:
-        return llm.run({
+        llm_state = llm.pack_state({
             "mode": state.get("mode","realtime_advice"),
-            "transcript": state["texts"][0],
-            "context":state.get("context", "")
+            "transcript": state.get("transcript") or state["texts"][0],
+            "context":state.get("context", ""),
+            "hits": None if state.get("reuse_session") else state.get("hits"),
             })
+        extra = {"packing": llm_state["packing"]} if "packing" in llm_state else {}
+        cache = get_result_cache()
+        if cache is None or not cache.enabled_for(llm_state["mode"]):
+            return {**llm.run(llm_state), **extra}
+
+        # 相同 prompt + 生成参数：直接复用上次的输出
+        prompt = llm.build_prompt(llm_state["mode"], llm_state["transcript"], llm_state["context"])
+        key = result_key(llm.model.name_or_path, prompt, llm.gen_kwargs(llm_state["mode"]))
+        # 命中与未命中返回同样的字段：generation 为生成该输出时的报告，cached 标明是否来自缓存
+        cached = cache.get(key)
+        if cached is not None:
+            output, generation = cached
+            return {"llm_output": output, "generation": dict(generation, cached=True), **extra}
+        started = time.perf_counter()
+        out = llm.run(llm_state)
+        cache.put(key, out["llm_output"], time.perf_counter() - started, out.get("generation"))
+        return {**out, "generation": dict(out.get("generation") or {}, cached=False), **extra}
     
     return embedding_node_fn, rag_query_node_fn, llm_node_fn
 
-def build_realtime_agent():
+def build_realtime_agent(nodes=None):
     """建立实时建议 Agent"""
     builder = StateGraph(MedicalState)
-    embedding_node_fn, rag_query_node_fn, llm_node_fn = make_nodes()
+    embedding_node_fn, rag_query_node_fn, llm_node_fn = make_nodes(nodes)
     
     builder.add_node("embedding", embedding_node_fn)
     builder.add_node("rea_query", rag_query_node_fn)
@@ -53,10 +110,10 @@ def build_realtime_agent():
     
     return builder.compile()
 
-def build_summary_agent():
+def build_summary_agent(nodes=None):
     """问诊总结 Agent"""
     builder = StateGraph(MedicalState)
-    embedding_node_fn, rag_query_node_fn, llm_node_fn = make_nodes()
+    embedding_node_fn, rag_query_node_fn, llm_node_fn = make_nodes(nodes)
     
     builder.add_node("embedding", embedding_node_fn)
     builder.add_node("rea_query", rag_query_node_fn)
@@ -67,4 +124,32 @@ def build_summary_agent():
     builder.add_edge("rea_query", "llm_doctor")
     builder.add_edge("llm_doctor", END)
     
-    return builder.compile()
\ No newline at end of file
+    return builder.compile()
+
+def build_summary_streamer(nodes=None):
+    """问诊总结的流式版本：检索完成后逐 token 产出报告"""
+    nodes = nodes or get_registry().nodes()
+    embed, rag, llm = nodes["embed"], nodes["rag"], nodes["llm"]
+
+    def stream(state: MedicalState, cancel=None):
+        """
+        依次产出 ("context", 检索上下文)、若干 ("token", 增量)、("done", 完整报告)；
+        cancel（threading.Event）被设置后停止生成
+        """
+        if state.get("reuse_session") and state.get("context"):
+            context, hits = state["context"], None
+        else:
+            texts = query_texts(state)
+            embeddings = embed.run({"texts": texts})["embeddings"]
+            retrieved = rag.run({"embeddings": embeddings, "texts": texts})
+            context, hits = retrieved["context"], retrieved.get("hits")
+        llm_state = llm.pack_state({
+            "mode": state.get("mode") or "final_report",
+            "transcript": state.get("transcript") or state["texts"][0],
+            "context": context,
+            "hits": hits,
+        })
+        yield "context", llm_state["context"]
+        yield from llm.stream(llm_state, cancel=cancel)
+
+    return stream
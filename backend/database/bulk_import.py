@@ -0,0 +1,106 @@
+# backend/database/bulk_import.py
+# 医学知识导入：Arrow 列式清洗 + Core executemany / PostgreSQL COPY
+# scripts/init_data.py 的 bulk 与 orm 两种模式共用同一个清洗规则（clean_batch）
+
+from backend.database.models import MedicalKnowledge
+
+COLUMNS = ["title", "content_text", "source_url", "created_at", "source_type"]
+TITLE_MAX = MedicalKnowledge.__table__.c.title.type.length or 255
+
+
+def iter_arrow_batches(split, batch_size, limit=None):
+    """按 Arrow record batch 流式读取数据集（不转成 Python 对象），最多 limit 行"""
+    remaining = limit or len(split)
+    for table in split.with_format("arrow").iter(batch_size=batch_size):
+        if remaining <= 0:
+            return
+        if table.num_rows > remaining:
+            table = table.slice(0, remaining)
+        remaining -= table.num_rows
+        yield table
+
+
+def _first_text(column):
+    """
+    问题 / 回答列可能是 string、list<string> 或 list<list<string>>：
+    逐层取第一个元素，空列表记为 null；再把换行替换成空格并去掉首尾空白
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    while pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+        # list_element 遇到空列表会报错，先把空列表置为 null
+        empty = pc.equal(pc.list_value_length(column), 0)
+        column = pc.list_element(pc.if_else(empty, pa.scalar(None, column.type), column), 0)
+    column = pc.cast(column, pa.string())
+    column = pc.replace_substring(column, "\n", " ")
+    return pc.utf8_trim_whitespace(column)
+
+
+def clean_batch(table, src, created_at):
+    """列式版的 clean_data：过滤空问答并映射成 medical_knowledge 的列，返回 pyarrow.Table"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    names = table.column_names
+    q_name = "question" if "question" in names else "questions"
+    a_name = "answer" if "answer" in names else "answers"
+    q = _first_text(table.column(q_name))
+    a = _first_text(table.column(a_name))
+    keep = pc.and_(pc.greater(pc.utf8_length(pc.fill_null(q, "")), 0),
+                   pc.greater(pc.utf8_length(pc.fill_null(a, "")), 0))
+    q, a = pc.filter(q, keep), pc.filter(a, keep)
+    n = len(q)
+    return pa.table({
+        # title 列是 VARCHAR(255)，PostgreSQL 会拒绝超长值
+        "title": pc.utf8_slice_codeunits(q, 0, TITLE_MAX),
+        "content_text": pc.binary_join_element_wise("问题:", q, "\n回答:", a, ""),
+        "source_url": pa.array([f"huatuo://{src}"] * n, pa.string()),
+        "created_at": pa.array([created_at] * n, pa.timestamp("us")),
+        "source_type": pa.array([src] * n, pa.string()),
+    })
+
+
+class CoreWriter:
+    """SQLAlchemy Core insert + executemany：每批一个事务，绕过 ORM 对象构造"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.insert = MedicalKnowledge.__table__.insert()
+
+    def write(self, table):
+        with self.engine.begin() as conn:
+            conn.execute(self.insert, table.to_pylist())
+
+
+class PostgresCopyWriter:
+    """PostgreSQL：Arrow 直接写成 CSV 流，COPY FROM STDIN 一次导入一批"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.sql = f"COPY medical_knowledge ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+
+    def write(self, table):
+        import io
+        import pyarrow.csv as pa_csv
+
+        buf = io.BytesIO()
+        pa_csv.write_csv(table.select(COLUMNS), buf, pa_csv.WriteOptions(include_header=False))
+        buf.seek(0)
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.copy_expert(self.sql, buf)
+            raw.commit()
+        finally:
+            raw.close()
+
+
+def make_writer(engine, method):
+    if method == "auto":
+        method = "copy" if engine.dialect.name == "postgresql" else "executemany"
+    if method == "copy":
+        if engine.dialect.name != "postgresql":
+            raise ValueError("COPY 只支持 PostgreSQL（DATABASE_URL）")
+        return PostgresCopyWriter(engine), method
+    return CoreWriter(engine), method
@@ -1,5 +1,6 @@
 # backend/database/session.py
 
+import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
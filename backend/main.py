@@ -1,21 +1,65 @@
 # backend/main.py
-import os, sys
+import os, sys, json, time, asyncio, threading
+from contextlib import asynccontextmanager
 from typing import List, Optional
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
+from sse_starlette.sse import EventSourceResponse
 
-# 让 Python 找到 medical_agent/src
+# 让 Python 找到项目根目录下的 backend 包
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.append(ROOT)
 
-from medical_agent.src.agent.graph import graph
 from backend.database.session import SessionLocal
-from backend.database.init_db import init_db
 from backend.database import crud
+from backend.serving import metrics
+from backend.serving.inference_executor import (
+    InferenceExecutor, QueueFullError, ExecutorUnavailableError,
+)
+from backend.serving.session_store import make_session_store, window_transcript, merge_contexts
+from backend.serving.lifecycle import ModelLoader
 
-init_db()
-app = FastAPI(title="Medical Agent (Local)")
+# 图推理专用执行器（realtime / summary 两个独立通道）
+executor = InferenceExecutor()
+
+# 数据库初始化与模型加载都放到后台，进程启动后立即可以绑定端口
+loader = ModelLoader()
+metrics.register("startup", loader.stats)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loader.start()
+    yield
+    executor.shutdown(wait=False)
+
+app = FastAPI(title="Medical Agent (Local)", lifespan=lifespan)
+
+@app.get("/healthz")
+def healthz():
+    """进程存活"""
+    return {"ok": True}
+
+@app.get("/readyz")
+def readyz():
+    """模型全部加载并完成预热后才返回 200；重试全部失败后，下一次探测重新开始一轮加载"""
+    if not loader.ready:
+        stats = loader.stats()
+        if stats["state"] == "failed":
+            loader.start()
+        raise HTTPException(status_code=503, detail=stats)
+    return {"ok": True, **loader.stats()}
+
+def _require_ready():
+    if not loader.ready:
+        raise HTTPException(status_code=503, detail=f"模型尚未就绪（{loader.state}）",
+                            headers={"Retry-After": "5"})
+
+def _admission_error(e: Exception) -> HTTPException:
+    """准入控制异常 -> HTTP 状态码"""
+    if isinstance(e, QueueFullError):
+        return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    return HTTPException(status_code=503, detail=str(e))
 
 class InferenceRequest(BaseModel):
     texts: List[str]
@@ -24,37 +68,187 @@ class InferenceRequest(BaseModel):
     context: Optional[str] = None
     session_id: Optional[str] = None
 
+# 问诊会话状态：带 session_id 时，/realtime 只需发送新增话语，/summary 复用已算好的向量与检索结果
+sessions = make_session_store()
+metrics.register("sessions", sessions.stats)
+REALTIME_WINDOW = int(os.getenv("SESSION_REALTIME_WINDOW", "6"))
+
+def _realtime_with_session(payload):
+    """
+    实时建议：texts 为新增话语，转写取会话最近几句；结束后把向量/上下文写回会话
+    话语在推理前原子地追加并读回，同一会话的并发请求不会互相覆盖或丢句
+    """
+    sid = payload.get("session_id")
+    new_texts = [t for t in payload.get("texts") or [] if t]
+    if sid and new_texts:
+        utterances = sessions.append_utterances(sid, new_texts)
+        payload["texts"] = new_texts
+        payload["transcript"] = payload.get("transcript") or window_transcript(utterances, REALTIME_WINDOW)
+    out = loader.realtime_agent.invoke(payload)
+    if sid and new_texts and isinstance(out, dict):
+        sessions.append(sid, [], out.get("embeddings"), out.get("context"))
+    return out
+
+def _summary_from_session(payload):
+    """总结：有会话时用累积的全文，并复用会话中已有的向量和检索上下文"""
+    sid = payload.get("session_id")
+    sess = sessions.get(sid) if sid else None
+    if not sess:
+        return payload
+    utterances = sess["utterances"] + [t for t in payload.get("texts") or [] if t]
+    transcript = payload.get("transcript") or "\n".join(utterances)
+    payload["texts"] = [transcript]
+    payload["transcript"] = transcript
+    if sess["contexts"]:
+        payload["embeddings"] = sess["embeddings"]
+        payload["context"] = merge_contexts(sess["contexts"])
+        payload["reuse_session"] = True
+    return payload
+
+def _public(out):
+    """返回给前端的图状态：查询向量只在服务端内部使用，不序列化进响应"""
+    if isinstance(out, dict):
+        return {k: v for k, v in out.items() if k != "embeddings"}
+    return out
+
 @app.post("/realtime")
-def realtime(req: InferenceRequest):
+async def realtime(req: InferenceRequest):
+    _require_ready()
+    payload = req.model_dump()
     try:
-        payload = req.model_dump()
-        out = graph.invoke(payload, entry_point="embedding_node")
-        return {"ok": True, "data": out}
+        out = await executor.run("realtime", _realtime_with_session, payload)
+        return {"ok": True, "data": _public(out)}
+    except (QueueFullError, ExecutorUnavailableError) as e:
+        raise _admission_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _run_summary(payload):
+    """总结图推理 + 草稿入库（在 summary 通道的线程中执行）"""
+    payload = _summary_from_session(payload)
+    out = loader.summary_agent.invoke(payload)
+    # 生成草稿：先暂存，医生确认后再入 ConfirmedCase
+    db = SessionLocal()
+    try:
+        draft_id = crud.create_draft(
+            db,
+            session_id=payload.get("session_id"),
+            mode=payload.get("mode", "final_report"),
+            transcript=payload.get("transcript") or (payload.get("texts") or [""])[0],
+            context=out.get("context") if isinstance(out, dict) else None,
+            output=(out.get("llm_output") if isinstance(out, dict) else str(out)),
+        )
+    finally:
+        db.close()
+    return draft_id, out
+
 @app.post("/summary")
-def summary(req: InferenceRequest):
+async def summary(req: InferenceRequest):
+    _require_ready()
+    payload = req.model_dump()
+    payload["mode"] = "final_report"
     try:
-        payload = req.model_dump()
-        out = graph.invoke(payload, entry_point="summary_start")
-        # 生成草稿：先暂存，医生确认后再入 ConfirmedCase
-        db = SessionLocal()
-        try:
-            draft_id = crud.create_draft(
-                db,
-                session_id=payload.get("session_id"),
-                mode=payload.get("mode", "final_report"),
-                transcript=payload.get("transcript") or (payload.get("texts") or [""])[0],
-                context=out.get("context") if isinstance(out, dict) else None,
-                output=(out.get("llm_output") if isinstance(out, dict) else str(out)),
-            )
-        finally:
-            db.close()
-        return {"ok": True, "draft_id": draft_id, "data": out}
+        draft_id, out = await executor.run("summary", _run_summary, payload)
+        return {"ok": True, "draft_id": draft_id, "data": _public(out)}
+    except (QueueFullError, ExecutorUnavailableError) as e:
+        raise _admission_error(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 流式总结：首 token 延迟（从收到请求算起）与总耗时
+stream_ttft = metrics.LatencyStats()
+stream_total = metrics.LatencyStats()
+metrics.register("summary_stream", lambda: {"ttft": stream_ttft.stats(), "total": stream_total.stats()})
+
+@app.post("/summary/stream")
+async def summary_stream(req: InferenceRequest):
+    """
+    SSE：context -> token* -> generation(token 统计) -> done(draft_id, llm_output)；出错时发送 error
+    客户端断开或超过 summary 通道的截止时间时通知生成线程停止，释放 summary 通道
+    """
+    _require_ready()
+    payload = req.model_dump()
+    payload["mode"] = "final_report"  # 流式接口只用于报告生成
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    lane = executor.lane("summary")
+    cancel = threading.Event()
+
+    def emit(event, data):
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    def produce():
+        """在 summary 通道线程中生成，并把事件推回事件循环"""
+        try:
+            if cancel.is_set():
+                return  # 排队期间客户端已断开或已超时
+            state = _summary_from_session(payload)
+            context, report = None, ""
+            for event, data in loader.summary_streamer(state, cancel=cancel):
+                if event == "context":
+                    context = data
+                elif event == "done":
+                    report = data
+                    continue
+                emit(event, data)
+            if cancel.is_set():
+                return  # 生成被中止，不保存不完整的草稿
+            db = SessionLocal()
+            try:
+                draft_id = crud.create_draft(
+                    db,
+                    session_id=state.get("session_id"),
+                    mode=state["mode"],
+                    transcript=state.get("transcript") or (state.get("texts") or [""])[0],
+                    context=context,
+                    output=report,
+                )
+            finally:
+                db.close()
+            emit("done", {"draft_id": draft_id, "llm_output": report})
+        except Exception as e:
+            emit("error", {"detail": str(e)})
+        finally:
+            emit(None, None)
+
+    try:
+        lane.submit(produce)
+    except (QueueFullError, ExecutorUnavailableError) as e:
+        raise _admission_error(e)
+
+    async def event_source():
+        first_token = True
+        deadline = started + lane.deadline
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout=max(deadline - time.perf_counter(), 0))
+                except asyncio.TimeoutError:
+                    lane.record_timeout()
+                    detail = f"summary 推理超过截止时间 {lane.deadline}s"
+                    yield {"event": "error", "data": json.dumps({"detail": detail}, ensure_ascii=False)}
+                    break
+                if event is None:
+                    break
+                if event == "token" and first_token:
+                    first_token = False
+                    stream_ttft.observe(time.perf_counter() - started)
+                if event == "done":
+                    stream_total.observe(time.perf_counter() - started)
+                if not isinstance(data, str):
+                    data = json.dumps(data, ensure_ascii=False)
+                yield {"event": event, "data": data}
+        finally:
+            # 正常结束时无影响；客户端断开（生成器被取消 / 关闭）或超时则让生成在下一步停止
+            cancel.set()
+
+    return EventSourceResponse(event_source())
+
+@app.get("/metrics")
+def get_metrics():
+    return metrics.snapshot()
+
 from pydantic import BaseModel
 
 class IdReq(BaseModel):
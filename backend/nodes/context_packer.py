@@ -0,0 +1,187 @@
+# backend/nodes/context_packer.py
+
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# 索引构建时相邻 chunk 重叠 80 字，去重时最多向前找这么长的重叠
+MAX_OVERLAP = 200
+
+
+def _overlap(a: str, b: str, limit: int = MAX_OVERLAP) -> int:
+    """a 的结尾与 b 的开头重合的最大长度"""
+    for n in range(min(len(a), len(b), limit), 0, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def dedupe_hits(hits: List[Dict[str, Any]], min_overlap: int = 20) -> List[Dict[str, Any]]:
+    """
+    去掉重复 / 重叠的检索片段（不修改传入的 hits）：
+    - 文本被已选片段完整包含的直接丢弃
+    - 与已选片段首尾重叠（相邻 chunk 的 80 字重叠区）的，只保留不重叠的部分
+    """
+    kept: List[Dict[str, Any]] = []
+    for hit in hits:
+        doc = (hit.get("document") or "").strip()
+        if not doc or any(doc in k["document"] for k in kept):
+            continue
+        for k in kept:
+            n = _overlap(k["document"], doc)
+            if n >= min_overlap:
+                doc = doc[n:]
+            n = _overlap(doc, k["document"])
+            if n >= min_overlap:
+                doc = doc[:-n]
+        doc = doc.strip()
+        if doc:
+            kept.append(dict(hit, document=doc))
+    return kept
+
+
+def format_hit(hit: Dict[str, Any]) -> str:
+    """与 RAGQueryNode 的上下文格式一致：[来源] 标题 → 正文"""
+    if not hit.get("title") and not hit.get("source_type"):
+        return hit["document"]
+    return f"[{hit.get('source_type', '')}] {hit.get('title', '')} → {hit['document']}"
+
+
+def hits_from_context(context: str) -> List[Dict[str, Any]]:
+    """只有拼好的 context 文本时（如会话合并的上下文），按行视为已排好序的片段"""
+    lines = [line for line in (context or "").split("\n") if line.strip()]
+    return [{"document": line, "score": float(len(lines) - i)} for i, line in enumerate(lines)]
+
+
+class ContextPacker:
+    """
+    按 LLM tokenizer 计数，把问诊对话 + 检索片段装进每种模式的 token 预算：
+    - 对话最多占预算的 transcript_share；超出时实时建议保留最近的几句，报告保留开头与结尾
+    - 剩余预算按检索分数从高到低放入去重后的片段，最后一条放不下时截断
+    - 统计每次请求相对"全文 + 全部片段"节省的 token 数
+    """
+
+    def __init__(self, tokenizer, budgets: Dict[str, int], transcript_share: float = 0.6,
+                 min_passage_tokens: int = 32):
+        self.tokenizer = tokenizer
+        self.budgets = budgets
+        self.transcript_share = transcript_share
+        self.min_passage_tokens = min_passage_tokens
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.last: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls, tokenizer) -> Optional["ContextPacker"]:
+        """LLM_CONTEXT_PACKING=0 关闭；预算 LLM_BUDGET_REALTIME / LLM_BUDGET_REPORT（token）"""
+        if os.getenv("LLM_CONTEXT_PACKING", "1") == "0":
+            return None
+        return cls(
+            tokenizer,
+            budgets={
+                "realtime_advice": int(os.getenv("LLM_BUDGET_REALTIME", "768")),
+                "final_report": int(os.getenv("LLM_BUDGET_REPORT", "3072")),
+            },
+            transcript_share=float(os.getenv("LLM_BUDGET_TRANSCRIPT_SHARE", "0.6")),
+        )
+
+    def _ids(self, texts: List[str]) -> List[List[int]]:
+        if not texts:
+            return []
+        return self.tokenizer(texts, add_special_tokens=False)["input_ids"]
+
+    def _fit_transcript(self, transcript: str, budget: int, keep_head: bool) -> Tuple[str, int, int]:
+        """返回 (裁剪后的对话, 原始 token 数, 裁剪后 token 数)"""
+        lines = transcript.split("\n")
+        counts = [len(ids) + 1 for ids in self._ids(lines)]  # +1 近似换行符
+        total = sum(counts)
+        if total <= budget:
+            return transcript, total, total
+        # 从最近一句往前保留；报告模式先保住开头（主诉通常在最前面）
+        head: List[int] = []
+        used = 0
+        if keep_head:
+            for i, c in enumerate(counts):
+                if used + c > budget // 3:
+                    break
+                head.append(i)
+                used += c
+        tail: List[int] = []
+        for i in range(len(lines) - 1, (head[-1] if head else -1), -1):
+            if used + counts[i] > budget:
+                break
+            tail.append(i)
+            used += counts[i]
+        kept = [lines[i] for i in head]
+        if head and tail and tail[-1] != head[-1] + 1:
+            kept.append("……")
+        kept += [lines[i] for i in reversed(tail)]
+        if not kept:
+            # 单句就超出预算：按 token 截断这一句
+            ids = self._ids([lines[-1]])[0][-budget:]
+            kept = [self.tokenizer.decode(ids, skip_special_tokens=True)]
+            used = len(ids)
+        return "\n".join(kept), total, used
+
+    def pack(self, mode: str, transcript: str, hits: List[Dict[str, Any]]) -> Tuple[str, str, Dict[str, Any]]:
+        """返回 (对话, 上下文, 打包报告)"""
+        budget = self.budgets.get(mode)
+        passages = dedupe_hits(sorted(hits, key=lambda h: h.get("score", 0.0), reverse=True))
+        texts = [format_hit(h) for h in passages]
+        passage_ids = self._ids(texts)
+        raw_context_tokens = sum(len(ids) + 1 for ids in self._ids([format_hit(h) for h in hits]))
+
+        if budget is None:
+            t_tokens = sum(len(ids) + 1 for ids in self._ids(transcript.split("\n")))
+            packed_t, before_t, after_t = transcript, t_tokens, t_tokens
+            remaining = None
+        else:
+            packed_t, before_t, after_t = self._fit_transcript(
+                transcript, int(budget * self.transcript_share), keep_head=(mode == "final_report"))
+            remaining = budget - after_t
+
+        chosen, used = [], 0
+        for text, ids in zip(texts, passage_ids):
+            cost = len(ids) + 1
+            if remaining is None or used + cost <= remaining:
+                chosen.append(text)
+                used += cost
+                continue
+            # 放不下的第一条在剩余预算足够时截断放入；后面的片段分数更低，不再尝试
+            left = remaining - used
+            if left >= self.min_passage_tokens:
+                chosen.append(self.tokenizer.decode(ids[:left - 1], skip_special_tokens=True) + "…")
+                used += left
+            break
+        dropped = len(texts) - len(chosen)
+
+        report = {
+            "budget": budget,
+            "tokens_before": before_t + raw_context_tokens,
+            "tokens_after": after_t + used,
+            "passages": len(chosen),
+            "passages_dropped": dropped,
+            "duplicates_removed": len(hits) - len(passages),
+        }
+        report["tokens_saved"] = report["tokens_before"] - report["tokens_after"]
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += report["tokens_before"]
+            self.tokens_after += report["tokens_after"]
+            self.last = report
+        return packed_t, "\n".join(chosen), report
+
+    def stats(self):
+        with self._lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                "budgets": dict(self.budgets),
+                "requests": self.requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved": saved,
+                "avg_tokens_saved": round(saved / self.requests, 1) if self.requests else 0.0,
+                "last": dict(self.last),
+            }
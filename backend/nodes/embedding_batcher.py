@@ -0,0 +1,131 @@
+# backend/nodes/embedding_batcher.py
+
+import queue
+import threading
+import time
+from typing import Callable, List
+
+import numpy as np
+
+
+class _EmbedRequest:
+    """一次 encode 调用：等待后台线程把结果写回"""
+
+    __slots__ = ("texts", "enqueued", "done", "result", "error")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """
+    动态微批处理：
+    收集 max_wait_ms 时间窗口内（或凑满 max_batch_size 条文本）到达的请求，
+    合并成一次 encode 调用，再把向量按顺序分发回各个调用方。
+    """
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray],
+                 max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_EmbedRequest]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        # 统计
+        self.requests = 0
+        self.texts = 0
+        self.batches = 0
+        self.max_batch_seen = 0
+        self.total_wait = 0.0
+        self.total_encode = 0.0
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._loop, name="embed-batcher", daemon=True)
+                    self._worker.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """阻塞直到本次 texts 的向量就绪，返回 shape=(len(texts), dim)"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._ensure_worker()
+        req = _EmbedRequest(list(texts))
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _collect(self) -> List[_EmbedRequest]:
+        """取第一个请求后，在时间窗口内继续收集，直到凑满一批"""
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            texts = [t for req in batch for t in req.texts]
+            started = time.perf_counter()
+            try:
+                vecs = np.asarray(self.encode_fn(texts))
+                error = None
+                if vecs.ndim != 2 or vecs.shape[0] != len(texts):
+                    # 行数对不上时无法按偏移分发，宁可让这一批全部失败，也不能把别人的向量交给调用方
+                    rows = vecs.shape[0] if vecs.ndim else 0
+                    raise ValueError(f"encode 返回 {rows} 行向量，输入为 {len(texts)} 条文本")
+            except Exception as e:
+                vecs, error = None, e
+            encode_time = time.perf_counter() - started
+
+            # 分发结果
+            offset = 0
+            for req in batch:
+                n = len(req.texts)
+                if error is None:
+                    req.result = vecs[offset:offset + n]
+                else:
+                    req.error = error
+                offset += n
+                req.done.set()
+
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.texts += len(texts)
+                self.max_batch_seen = max(self.max_batch_seen, len(texts))
+                self.total_wait += sum(started - req.enqueued for req in batch)
+                self.total_encode += encode_time
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self.requests,
+                "texts": self.texts,
+                "batches": self.batches,
+                "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "avg_queue_wait_ms": round(self.total_wait / self.requests * 1000, 3) if self.requests else 0.0,
+                "avg_encode_ms": round(self.total_encode / self.batches * 1000, 3) if self.batches else 0.0,
+                "queue_depth": self._queue.qsize(),
+            }
@@ -0,0 +1,245 @@
+# backend/nodes/embedding_cache.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def normalize_text(text: str) -> str:
+    """缓存键归一化：全角/半角统一、去首尾空白、合并连续空白"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    """(模型名, 归一化文本) -> 20 字节 sha1 摘要"""
+    return hashlib.sha1(f"{model_name}\x00{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class DiskEmbeddingTier:
+    """
+    磁盘层：固定容量的内存映射文件
+    - vectors.f32: (capacity, dim) float32 向量
+    - keys.bin:    (capacity, 20) 键的原始字节
+    - ticks.i64:   (capacity,) 最近访问序号（0 表示空槽），满了按最久未用的槽位淘汰
+    同一目录只有一个写入者：打开时对 lock 文件加排他锁（flock，随进程退出释放），
+    拿到锁的实例可读写；其他进程（多个 uvicorn worker 等）的实例只读，不分配槽位、不写访问序号。
+    写入一个槽位时先清空键、再写向量、最后写键；只读实例读向量前后各核对一次槽位中的键，
+    槽位被改写过就当作未命中。只读实例只看得到打开时已有的条目
+    """
+
+    KEY_BYTES = 20
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.dim = None
+        self._slots = {}
+        self._tick = 0
+        self._free = []
+        self.evictions = 0
+        os.makedirs(path, exist_ok=True)
+        self.writable = self._lock_writer()
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("capacity") == capacity:
+                self._open(meta["dim"], create=False)
+                # meta 只在 flush 时更新；崩溃后以文件中实际的最大访问序号为准
+                self._tick = max(int(meta.get("tick", 0)), int(self.ticks.max()))
+
+    def _lock_writer(self) -> bool:
+        """对目录加写入锁，成功返回 True（不支持 flock 的平台不加锁，视为唯一写入者）"""
+        if fcntl is None:
+            return True
+        self._lock_file = open(os.path.join(self.path, "lock"), "a+")
+        try:
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def _open(self, dim: int, create: bool):
+        mode = "r+" if self.writable else "r"
+        if create:
+            # 新文件先写到临时名再原子替换：只读实例仍映射着旧文件，不会读到截断中的文件
+            specs = {"vectors.f32": (np.float32, (self.capacity, dim)),
+                     "keys.bin": (np.uint8, (self.capacity, self.KEY_BYTES)),
+                     "ticks.i64": (np.int64, (self.capacity,))}
+            for name, (dtype, shape) in specs.items():
+                tmp = os.path.join(self.path, name + ".tmp")
+                np.memmap(tmp, dtype=dtype, mode="w+", shape=shape).flush()
+                os.replace(tmp, os.path.join(self.path, name))
+        self.dim = dim
+        self.vectors = np.memmap(os.path.join(self.path, "vectors.f32"), dtype=np.float32,
+                                 mode=mode, shape=(self.capacity, dim))
+        self.keys = np.memmap(os.path.join(self.path, "keys.bin"), dtype=np.uint8,
+                              mode=mode, shape=(self.capacity, self.KEY_BYTES))
+        self.ticks = np.memmap(os.path.join(self.path, "ticks.i64"), dtype=np.int64,
+                               mode=mode, shape=(self.capacity,))
+        # 重建 key -> slot 索引
+        used = np.flatnonzero(self.ticks > 0)
+        self._slots = {self.keys[i].tobytes(): int(i) for i in used}
+        self._free = sorted(set(range(self.capacity)) - set(self._slots.values()), reverse=True)
+        if create:
+            self._tick = 0
+            self._write_meta()
+
+    def _write_meta(self):
+        """写临时文件后原子替换，中途崩溃不会留下半个 meta.json"""
+        tmp = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "tick": self._tick}, f)
+        os.replace(tmp, os.path.join(self.path, "meta.json"))
+
+    def __len__(self):
+        return len(self._slots)
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        if self.dim is None:
+            return None
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        if not self.writable:
+            # 写入者可能已改写这个槽位：读向量前后键都一致才算命中
+            if self.keys[slot].tobytes() != key:
+                return None
+            vec = np.array(self.vectors[slot])
+            return vec if self.keys[slot].tobytes() == key else None
+        self._tick += 1
+        self.ticks[slot] = self._tick
+        return np.array(self.vectors[slot])
+
+    def put(self, key: bytes, vec: np.ndarray):
+        if not self.writable:
+            return
+        if self.dim != len(vec):
+            # 首次写入，或模型维度变化：整个磁盘层（重新）创建
+            self._open(len(vec), create=True)
+        slot = self._slots.get(key)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = int(np.argmin(self.ticks))
+                del self._slots[self.keys[slot].tobytes()]
+                self.evictions += 1
+            self._slots[key] = slot
+            self.keys[slot] = 0
+            self.vectors[slot] = vec
+            self.keys[slot] = np.frombuffer(key, dtype=np.uint8)
+        else:
+            self.vectors[slot] = vec
+        self._tick += 1
+        self.ticks[slot] = self._tick
+
+    def flush(self):
+        if self.dim is None or not self.writable:
+            return
+        self.vectors.flush()
+        self.keys.flush()
+        self.ticks.flush()
+        self._write_meta()
+
+
+class EmbeddingCache:
+    """
+    内容寻址的向量缓存：内存 LRU 层 + 磁盘 mmap 层
+    命中则完全跳过模型
+    """
+
+    def __init__(self, model_name: str, memory_items: int = 4096,
+                 disk_dir: Optional[str] = None, disk_items: int = 200000,
+                 flush_every: int = 256):
+        self.model_name = model_name
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._disk = None
+        if disk_dir and disk_items > 0:
+            slug = re.sub(r"[^\w.-]", "_", model_name)
+            self._disk = DiskEmbeddingTier(os.path.join(disk_dir, slug), disk_items)
+        self.flush_every = flush_every
+        self._dirty = 0
+        self._lock = threading.Lock()
+        # 统计
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_evictions = 0
+
+    def _remember(self, key: bytes, vec: np.ndarray):
+        self._memory[key] = vec
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.memory_evictions += 1
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """逐条查缓存，未命中的位置为 None"""
+        out = []
+        with self._lock:
+            for text in texts:
+                key = cache_key(self.model_name, text)
+                vec = self._memory.get(key)
+                if vec is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                elif self._disk is not None and (vec := self._disk.get(key)) is not None:
+                    self._remember(key, vec)
+                    self.disk_hits += 1
+                else:
+                    self.misses += 1
+                out.append(vec)
+        return out
+
+    def put_many(self, texts: List[str], vecs):
+        with self._lock:
+            for text, vec in zip(texts, vecs):
+                key = cache_key(self.model_name, text)
+                vec = np.asarray(vec, dtype=np.float32)
+                self._remember(key, vec)
+                if self._disk is not None:
+                    self._disk.put(key, vec)
+                    self._dirty += 1
+            if self._disk is not None and self._dirty >= self.flush_every:
+                self._disk.flush()
+                self._dirty = 0
+
+    def flush(self):
+        with self._lock:
+            if self._disk is not None:
+                self._disk.flush()
+            self._dirty = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "memory_capacity": self.memory_items,
+                "memory_evictions": self.memory_evictions,
+                "disk_items": len(self._disk) if self._disk is not None else 0,
+                "disk_capacity": self._disk.capacity if self._disk is not None else 0,
+                "disk_evictions": self._disk.evictions if self._disk is not None else 0,
+                "disk_writable": self._disk.writable if self._disk is not None else False,
+            }
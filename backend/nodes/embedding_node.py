@@ -1,7 +1,13 @@
 # backend/nodes/embedding_node.py
 
 import os
-from sentence_transformers import SentenceTransformer
+import atexit
+import numpy as np
+
+from backend.nodes.embedding_batcher import EmbeddingBatcher
+from backend.nodes.embedding_cache import EmbeddingCache
+from backend.rag.quantization import embed_dim, truncate
+from backend.serving import metrics
 
 os.environ["HUGGINGFACE_HUB_CACHE"] = ".cache/hf"
 
@@ -10,17 +16,86 @@ class JinaEmbeddingNode:
     
     # 全局缓存
     _model = None
+    _batcher = None
+    _cache = None
     
     def __init__(self, model_name="jinaai/jina-embeddings-v3"):
         """初始化模型"""
         cache_dir = ".cache/hf"
         os.environ["HUGGINGFACE_HUB_CACHE"] = cache_dir
 
+        # 推理后端：EMBED_BACKEND=torch（默认，SentenceTransformer）| onnx（ONNX Runtime，默认 int8 量化模型）
+        backend = os.getenv("EMBED_BACKEND", "torch")
         if JinaEmbeddingNode._model is None:
-            print(f"正在加载嵌入模型：{model_name}")
-            JinaEmbeddingNode._model = SentenceTransformer(model_name, trust_remote_code=True)
+            print(f"正在加载嵌入模型：{model_name}（后端：{backend}）")
+            if backend == "onnx":
+                from backend.nodes.onnx_embedder import OnnxEmbeddingEncoder
+                JinaEmbeddingNode._model = OnnxEmbeddingEncoder(
+                    os.getenv("EMBED_ONNX_DIR", ".cache/onnx/jina-embeddings-v3"),
+                    quant=os.getenv("EMBED_ONNX_QUANT", "int8"),
+                    threads=int(os.getenv("EMBED_ONNX_THREADS", "0")),
+                )
+            elif backend == "torch":
+                from sentence_transformers import SentenceTransformer
+                JinaEmbeddingNode._model = SentenceTransformer(model_name, trust_remote_code=True)
+            else:
+                raise ValueError(f"未知嵌入后端: {backend}")
             print("嵌入模型加载完成（仅首次）")
         self.model = JinaEmbeddingNode._model
+        # ONNX 量化模型的向量与 PyTorch 略有差异，缓存按后端分开
+        quant = getattr(self.model, "quant", None)
+        cache_name = f"{model_name}@onnx-{quant}" if quant else model_name
+
+        # 微批处理：EMBED_BATCHING=0 关闭，窗口与批大小可配置
+        if JinaEmbeddingNode._batcher is None and os.getenv("EMBED_BATCHING", "1") != "0":
+            max_batch = int(os.getenv("EMBED_MAX_BATCH", "32"))
+            model = JinaEmbeddingNode._model
+            JinaEmbeddingNode._batcher = EmbeddingBatcher(
+                lambda texts: model.encode(texts, normalize_embeddings=True, batch_size=max_batch),
+                max_batch_size=max_batch,
+                max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "5")),
+            )
+            metrics.register("embedding_batcher", JinaEmbeddingNode._batcher.stats)
+        self.batcher = JinaEmbeddingNode._batcher
+
+        # 向量缓存：内存 LRU + 磁盘 mmap，EMBED_CACHE=0 关闭
+        if JinaEmbeddingNode._cache is None and os.getenv("EMBED_CACHE", "1") != "0":
+            JinaEmbeddingNode._cache = EmbeddingCache(
+                cache_name,
+                memory_items=int(os.getenv("EMBED_CACHE_MEM_ITEMS", "4096")),
+                disk_dir=os.getenv("EMBED_CACHE_DIR", ".cache/embeddings"),
+                disk_items=int(os.getenv("EMBED_CACHE_DISK_ITEMS", "200000")),
+            )
+            metrics.register("embedding_cache", JinaEmbeddingNode._cache.stats)
+            atexit.register(JinaEmbeddingNode._cache.flush)
+        self.cache = JinaEmbeddingNode._cache
+        # Matryoshka 截断维度（EMBED_DIM），缓存里仍保存完整维度，改维度不必重算
+        self.dim = embed_dim()
+
+    def _encode_model(self, texts):
+        """真正调用模型（经过微批处理，若已启用）"""
+        if self.batcher is not None:
+            return self.batcher.encode(texts)
+        return self.model.encode(texts, normalize_embeddings=True,
+                                 batch_size=int(os.getenv("EMBED_MAX_BATCH", "32")))
+
+    def encode(self, texts):
+        """向量化：返回 (len(texts), dim) float32 矩阵，按 EMBED_DIM 截断并重新归一化"""
+        return truncate(self._encode_full(texts), self.dim)
+
+    def _encode_full(self, texts):
+        """先查缓存，只对未命中的文本调用模型"""
+        if self.cache is None:
+            return self._encode_model(texts)
+        cached = self.cache.get_many(texts)
+        miss_idx = [i for i, v in enumerate(cached) if v is None]
+        if miss_idx:
+            miss_texts = [texts[i] for i in miss_idx]
+            fresh = self._encode_model(miss_texts)
+            self.cache.put_many(miss_texts, fresh)
+            for i, vec in zip(miss_idx, fresh):
+                cached[i] = vec
+        return np.stack(cached).astype(np.float32, copy=False)
     
     def run(self, state):
         """
@@ -28,12 +103,12 @@ class JinaEmbeddingNode:
         state["texts"] 是要转成向量的文本列表
         """
         texts = state["texts"]
-        embeddings = self.model.encode(texts, normalize_embeddings=True)
-        return {"embeddings": embeddings.tolist()}
+        # 保持 numpy 矩阵，不再转成 Python list
+        return {"embeddings": self.encode(texts)}
 
 if __name__ == "__main__":
     node = JinaEmbeddingNode()
     sample = {"texts": ["发烧两天，咳嗽，是否需要使用抗生素？"]}
     result = node.run(sample)
-    print(f"生成向量维度:{len(result['embeddings'][0])}")
+    print(f"生成向量维度:{result['embeddings'].shape[1]}")
     print(f"前10个数值示例:{result['embeddings'][0][:10]}")
\ No newline at end of file
@@ -0,0 +1,206 @@
+# backend/nodes/generation_control.py
+
+import os
+import re
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+from transformers import LogitsProcessor, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+
+# Qwen3 思考块的标记，在词表中是单个 token
+THINK_TOKENS = ("<think>", "</think>")
+
+
+def visible_prefix(raw: str) -> str:
+    """去掉已闭合的 think / 代码块 / JSON（清洗时也会删掉）；未闭合的之后的内容还会变化，先截掉"""
+    text = re.sub(r"<think>.*?</think>", "", raw, flags=re.S)
+    text = re.sub(r"```.*?```", "", text, flags=re.S)
+    text = re.sub(r"\{.*?\}", "", text, flags=re.S)
+    for opener in ("<think>", "```", "{"):
+        idx = text.find(opener)
+        if idx != -1:
+            text = text[:idx]
+    return text
+
+
+def think_token_ids(tokenizer) -> List[int]:
+    """词表中存在的思考标记 id（非 Qwen3 分词器返回空列表）"""
+    vocab = tokenizer.get_vocab()
+    return [vocab[t] for t in THINK_TOKENS if t in vocab]
+
+
+class SuppressTokensProcessor(LogitsProcessor):
+    """把指定 token 的 logits 置为 -inf：模型不会再进入 <think> 块，省下整段思考的解码"""
+
+    def __init__(self, token_ids: List[int]):
+        self.token_ids = list(token_ids)
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self.token_ids:
+            scores[:, self.token_ids] = -float("inf")
+        return scores
+
+
+class StopChecker:
+    """
+    单条序列的提前停止判断：逐 token 增量解码，每得到完整的字符就用 find_end 检查原文。
+    find_end 返回原文中输出已完整的截断位置（之后的内容不影响清洗结果），未完整时返回 None
+    """
+
+    def __init__(self, tokenizer, find_end: Callable[[str], Optional[int]], ignore_ids=()):
+        self.tokenizer = tokenizer
+        self.find_end = find_end
+        self.ignore_ids = set(ignore_ids)
+        self.text = ""
+        self.generated = 0
+        self.end: Optional[int] = None
+        self._pending: List[int] = []
+
+    @property
+    def stopped(self) -> bool:
+        return self.end is not None
+
+    def result(self) -> str:
+        """已解码的原文；提前停止时截到完整输出为止（去掉同一个 token 里多出来的字符）"""
+        return self.text[:self.end] if self.stopped else self.text
+
+    def feed(self, token_id: int) -> bool:
+        self.generated += 1
+        if self.stopped:
+            return True
+        if token_id in self.ignore_ids:
+            return False
+        self._pending.append(token_id)
+        piece = self.tokenizer.decode(self._pending, skip_special_tokens=True)
+        if piece.endswith("\ufffd"):
+            return False  # 多字节字符还没解码完整
+        self._pending = []
+        self.text += piece
+        if piece:
+            self.end = self.find_end(self.text)
+        return self.stopped
+
+
+class CompletionStoppingCriteria(StoppingCriteria):
+    """model.generate 用的适配器：batch 中每一行一个 StopChecker"""
+
+    def __init__(self, make_checker: Callable[[], StopChecker], prompt_len: int):
+        self.make_checker = make_checker
+        self.seen = prompt_len
+        self.checkers: List[StopChecker] = []
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        while len(self.checkers) < input_ids.shape[0]:
+            self.checkers.append(self.make_checker())
+        new = input_ids[:, self.seen:].tolist()
+        self.seen = input_ids.shape[1]
+        done = [any([c.feed(t) for t in row]) or c.stopped for c, row in zip(self.checkers, new)]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """调用方设置 event 后（客户端断开、超过截止时间等），下一个解码步整个 batch 停止"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+class GenerationControl:
+    """
+    按模式控制生成：
+    - 屏蔽 <think> 标记（LLM_SUPPRESS_THINK=0 关闭）
+    - 清洗后的输出已完整时提前停止（LLM_EARLY_STOP=0 关闭）：
+      实时建议在第一句结束时停止，报告在【医嘱】段结束时停止
+    - 统计每次请求生成的 token 数与清洗后保留的 token 数
+    """
+
+    def __init__(self, tokenizer, completions: Dict[str, Callable[[str], Optional[int]]],
+                 suppress_think: bool = True, early_stop: bool = True, eos_ids=()):
+        self.tokenizer = tokenizer
+        self.completions = completions
+        self.early_stop = early_stop
+        self.suppress_ids = think_token_ids(tokenizer) if suppress_think else []
+        self.eos_ids = {i for i in eos_ids if i is not None}
+        self._lock = threading.Lock()
+        self.by_mode: Dict[str, Dict[str, Any]] = {}
+        self.last: Dict[str, Any] = {}
+
+    @classmethod
+    def from_env(cls, tokenizer, completions, eos_ids=()) -> "GenerationControl":
+        return cls(
+            tokenizer, completions,
+            suppress_think=os.getenv("LLM_SUPPRESS_THINK", "1") != "0",
+            early_stop=os.getenv("LLM_EARLY_STOP", "1") != "0",
+            eos_ids=eos_ids,
+        )
+
+    def processors(self) -> List[LogitsProcessor]:
+        return [SuppressTokensProcessor(self.suppress_ids)] if self.suppress_ids else []
+
+    def checker(self, mode: str) -> Optional[StopChecker]:
+        """单条序列的停止判断（连续批处理调度器逐 token 调用）；关闭或未知模式时为 None"""
+        if not self.early_stop or mode not in self.completions:
+            return None
+        return StopChecker(self.tokenizer, self.completions[mode], ignore_ids=self.eos_ids)
+
+    def generate_kwargs(self, mode: str, prompt_len: int, cancel: Optional[threading.Event] = None):
+        """
+        传给 model.generate 的 logits_processor / stopping_criteria，以及用于事后统计的 criteria。
+        传入 cancel 时额外加一个停止条件：event 被设置后生成在下一步结束
+        """
+        kwargs = {}
+        if self.suppress_ids:
+            kwargs["logits_processor"] = LogitsProcessorList(self.processors())
+        criteria = None
+        stops = []
+        if self.early_stop and mode in self.completions:
+            criteria = CompletionStoppingCriteria(lambda: self.checker(mode), prompt_len)
+            stops.append(criteria)
+        if cancel is not None:
+            stops.append(CancelStoppingCriteria(cancel))
+        if stops:
+            kwargs["stopping_criteria"] = StoppingCriteriaList(stops)
+        return kwargs, criteria
+
+    def report(self, mode: str, generated_ids: List[int], clean: str, stopped: bool,
+               max_new_tokens: int) -> Dict[str, Any]:
+        """单次请求：生成的 token 数、清洗后保留的 token 数、停止原因"""
+        generated = len(generated_ids)
+        kept = len(self.tokenizer(clean, add_special_tokens=False)["input_ids"]) if clean else 0
+        if stopped:
+            reason = "complete"
+        elif generated >= max_new_tokens and generated_ids[-1] not in self.eos_ids:
+            reason = "max_new_tokens"
+        else:
+            reason = "eos"
+        out = {"generated_tokens": generated, "kept_tokens": kept,
+               "discarded_tokens": max(generated - kept, 0), "stop_reason": reason}
+        with self._lock:
+            agg = self.by_mode.setdefault(mode, {"requests": 0, "generated_tokens": 0, "kept_tokens": 0,
+                                                 "stop_reasons": {}})
+            agg["requests"] += 1
+            agg["generated_tokens"] += generated
+            agg["kept_tokens"] += kept
+            agg["stop_reasons"][reason] = agg["stop_reasons"].get(reason, 0) + 1
+            self.last = dict(out, mode=mode)
+        return out
+
+    def stats(self):
+        with self._lock:
+            modes = {}
+            for mode, agg in self.by_mode.items():
+                n = agg["requests"]
+                modes[mode] = dict(agg, stop_reasons=dict(agg["stop_reasons"]),
+                                   avg_generated=round(agg["generated_tokens"] / n, 1) if n else 0.0,
+                                   keep_ratio=round(agg["kept_tokens"] / agg["generated_tokens"], 3)
+                                   if agg["generated_tokens"] else 0.0)
+            return {
+                "suppress_think": bool(self.suppress_ids),
+                "early_stop": self.early_stop,
+                "modes": modes,
+                "last": dict(self.last),
+            }
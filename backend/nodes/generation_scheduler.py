@@ -0,0 +1,296 @@
+# backend/nodes/generation_scheduler.py
+
+import queue
+import threading
+import time
+from typing import List
+
+import torch
+import torch.nn.functional as F
+from transformers import (
+    DynamicCache,
+    LogitsProcessorList,
+    RepetitionPenaltyLogitsProcessor,
+    TemperatureLogitsWarper,
+    TopPLogitsWarper,
+)
+
+
+class _GenRequest:
+    """一条待生成的序列"""
+
+    __slots__ = ("prompt_ids", "generated", "enqueued", "done", "result", "error", "checker")
+
+    def __init__(self, prompt_ids: List[int], checker=None):
+        self.prompt_ids = prompt_ids
+        self.checker = checker  # 可选的 StopChecker：清洗后的输出完整时提前结束
+        self.generated: List[int] = []
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _select_cache(past, idx: torch.Tensor):
+    """按 batch 维度裁剪 KV cache（去掉已完成的序列）"""
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(idx)
+        return past
+    return tuple(tuple(t[idx] for t in layer) for layer in past)
+
+
+def _merge_caches(a, b, a_len: int, b_len: int):
+    """
+    两份 KV cache 沿 batch 维拼接：序列较短的一方在左侧补零，
+    与左填充一致（补出的位置 attention mask 为 0，不参与计算）
+    """
+    dynamic = hasattr(a, "to_legacy_cache")
+    legacy_a = a.to_legacy_cache() if dynamic else a
+    legacy_b = b.to_legacy_cache() if hasattr(b, "to_legacy_cache") else b
+    width = max(a_len, b_len)
+
+    def pad(t, n):
+        # (batch, heads, seq, head_dim)：在 seq 维左侧补 n 个位置
+        return F.pad(t, (0, 0, n, 0)) if n else t
+
+    layers = tuple(
+        tuple(torch.cat([pad(ta, width - a_len), pad(tb, width - b_len)]) for ta, tb in zip(la, lb))
+        for la, lb in zip(legacy_a, legacy_b)
+    )
+    return DynamicCache.from_legacy_cache(layers) if dynamic else layers
+
+
+def _pad_left(t: torch.Tensor, width: int, value: int) -> torch.Tensor:
+    return F.pad(t, (width - t.shape[1], 0), value=value) if t.shape[1] < width else t
+
+
+class GenerationScheduler:
+    """
+    短文本生成的连续批处理调度器（用于 realtime_advice）：
+    - 把时间窗口内到达的多个 prompt 左填充成一个 batch，一起 prefill / decode
+    - 每个 decode step 之后，已结束的序列立即返回并移出 batch
+    - 每隔 admit_interval 步检查等待队列，有新请求且 batch 未满时，只对新请求 prefill
+      （prompt 去掉最后一个 token），其 KV cache 左侧补齐后并入运行中的 batch；
+      新请求的最后一个 prompt token 与运行中序列的下一个 token 在同一个 decode step 里送入，
+      运行中序列已有的 cache 不重算
+    - 重复惩罚只作用于真实 token，不含左填充的 pad
+    - processors 为额外的 logits 处理（如屏蔽 <think>），在重复惩罚 / 采样参数之前执行
+    """
+
+    def __init__(self, model, tokenizer, device, gen_kwargs,
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0, admit_interval: int = 8,
+                 processors=None):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_new_tokens = gen_kwargs.get("max_new_tokens", 80)
+        self.do_sample = gen_kwargs.get("do_sample", False)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.admit_interval = admit_interval
+
+        self.pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        eos = getattr(model.generation_config, "eos_token_id", None)
+        eos = eos if isinstance(eos, (list, tuple)) else [eos]
+        self.eos_ids = {i for i in list(eos) + [tokenizer.eos_token_id] if i is not None}
+
+        self.processors = LogitsProcessorList(processors or [])
+        if gen_kwargs.get("repetition_penalty", 1.0) != 1.0:
+            self.processors.append(RepetitionPenaltyLogitsProcessor(gen_kwargs["repetition_penalty"]))
+        if self.do_sample:
+            if gen_kwargs.get("temperature", 1.0) != 1.0:
+                self.processors.append(TemperatureLogitsWarper(gen_kwargs["temperature"]))
+            if gen_kwargs.get("top_p", 1.0) < 1.0:
+                self.processors.append(TopPLogitsWarper(gen_kwargs["top_p"]))
+
+        self._queue: "queue.Queue[_GenRequest]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+        # 统计
+        self.requests = 0
+        self.prefills = 0
+        self.decode_steps = 0
+        self.generated_tokens = 0
+        self.early_stops = 0
+        self.batch_rows = 0
+        self.max_batch_seen = 0
+
+    # 对外接口
+    def generate(self, prompt: str, checker=None) -> str:
+        """阻塞直到该 prompt 生成结束，返回解码后的原始文本"""
+        return self.generate_ids(prompt, checker)[0]
+
+    def generate_ids(self, prompt: str, checker=None):
+        """同 generate，另外返回生成的 token id（含结束符）"""
+        ids = self.tokenizer(prompt)["input_ids"]
+        req = _GenRequest(ids, checker)
+        self._ensure_worker()
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result, list(req.generated)
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._loop, name="gen-scheduler", daemon=True)
+                    self._worker.start()
+
+    def _drain(self, limit: int, block: bool) -> List[_GenRequest]:
+        """从等待队列取请求：block=True 时至少等到一个，并在窗口内继续凑批"""
+        out = []
+        if block:
+            out.append(self._queue.get())
+            deadline = time.perf_counter() + self.max_wait
+            while len(out) < limit:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    out.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        else:
+            while len(out) < limit:
+                try:
+                    out.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+        return out
+
+    # 调度主循环
+    def _loop(self):
+        while True:
+            running = self._drain(self.max_batch_size, block=True)
+            try:
+                self._run_batch(running)
+            except Exception as e:
+                for req in running:
+                    if not req.done.is_set():
+                        req.error = e
+                        req.done.set()
+
+    def _sample(self, all_ids: torch.Tensor, mask: torch.Tensor, logits: torch.Tensor) -> torch.Tensor:
+        # pad 位置换成该行最后一个 token（一定是真实 token）：重复惩罚只看到真实 token，
+        # 同一 token 出现多次与 generate 中的处理相同
+        ids = torch.where(mask.bool(), all_ids, all_ids[:, -1:])
+        scores = self.processors(ids, logits.float())
+        if self.do_sample:
+            probs = torch.softmax(scores, dim=-1)
+            return torch.multinomial(probs, num_samples=1).squeeze(1)
+        return torch.argmax(scores, dim=-1)
+
+    def _prefill(self, reqs: List[_GenRequest], hold_last: bool = False):
+        """
+        左填充后整体 prefill，返回解码所需的状态。
+        hold_last=True 时不 prefill 最后一个 prompt token（由下一个 decode step 送入），用于批间准入
+        """
+        seqs = [r.prompt_ids[:-1] if hold_last else r.prompt_ids for r in reqs]
+        width = max(len(s) for s in seqs)
+        input_ids = torch.full((len(seqs), width), self.pad_id, dtype=torch.long)
+        mask = torch.zeros((len(seqs), width), dtype=torch.long)
+        for i, s in enumerate(seqs):
+            input_ids[i, width - len(s):] = torch.tensor(s, dtype=torch.long)
+            mask[i, width - len(s):] = 1
+        input_ids, mask = input_ids.to(self.device), mask.to(self.device)
+        position_ids = (mask.cumsum(-1) - 1).clamp(min=0)
+
+        out = self.model(input_ids=input_ids, attention_mask=mask,
+                         position_ids=position_ids, use_cache=True)
+        with self._lock:
+            self.prefills += 1
+        return out.past_key_values, mask, position_ids[:, -1], input_ids, out.logits[:, -1, :]
+
+    def _run_batch(self, running: List[_GenRequest]):
+        with torch.no_grad():
+            past, mask, positions, all_ids, logits = self._prefill(running)
+            since_admit = 0
+            while running:
+                next_tokens = self._sample(all_ids, mask, logits)
+                with self._lock:
+                    self.decode_steps += 1
+                    self.batch_rows += len(running)
+                    self.max_batch_seen = max(self.max_batch_seen, len(running))
+                    self.generated_tokens += len(running)
+
+                # 记录新 token，找出已结束的序列
+                keep = []
+                for i, (req, tok) in enumerate(zip(running, next_tokens.tolist())):
+                    req.generated.append(tok)
+                    complete = req.checker is not None and req.checker.feed(tok)
+                    if complete:
+                        with self._lock:
+                            self.early_stops += 1
+                    if complete or tok in self.eos_ids or len(req.generated) >= self.max_new_tokens:
+                        self._finish(req)
+                    else:
+                        keep.append(i)
+
+                if len(keep) < len(running):
+                    running = [running[i] for i in keep]
+                    if not running:
+                        break
+                    idx = torch.tensor(keep, dtype=torch.long, device=mask.device)
+                    past = _select_cache(past, idx)
+                    mask, positions, all_ids = mask[idx], positions[idx], all_ids[idx]
+                    next_tokens = next_tokens[idx]
+
+                # 批间准入：有等待的请求且 batch 未满，只 prefill 新请求，cache 并入当前 batch
+                since_admit += 1
+                if since_admit >= self.admit_interval and len(running) < self.max_batch_size \
+                        and not self._queue.empty():
+                    new = self._drain(self.max_batch_size - len(running), block=False)
+                    if new:
+                        past, mask, positions, all_ids, next_tokens = self._admit(
+                            new, past, mask, positions, all_ids, next_tokens)
+                        running = running + new
+                        since_admit = 0
+
+                # decode 一步
+                mask = torch.cat([mask, mask.new_ones((mask.shape[0], 1))], dim=-1)
+                positions = positions + 1
+                step_ids = next_tokens.unsqueeze(1).to(all_ids.device)
+                all_ids = torch.cat([all_ids, step_ids], dim=-1)
+                out = self.model(input_ids=step_ids, attention_mask=mask,
+                                 position_ids=positions.unsqueeze(1),
+                                 past_key_values=past, use_cache=True)
+                past, logits = out.past_key_values, out.logits[:, -1, :]
+
+    def _admit(self, new: List[_GenRequest], past, mask, positions, all_ids, next_tokens):
+        """
+        新请求并入运行中的 batch：prefill 新请求的 prompt（不含最后一个 token），
+        cache / mask / 已有 token 左侧补齐到相同宽度后拼接；
+        返回合并后的状态，next_tokens 末尾追加新请求的最后一个 prompt token，由下一个 decode step 送入
+        """
+        new_past, new_mask, new_last, new_ids, _ = self._prefill(new, hold_last=True)
+        width = max(mask.shape[1], new_mask.shape[1])
+        past = _merge_caches(past, new_past, mask.shape[1], new_mask.shape[1])
+        mask = torch.cat([_pad_left(mask, width, 0), _pad_left(new_mask, width, 0)])
+        all_ids = torch.cat([_pad_left(all_ids, width, self.pad_id), _pad_left(new_ids, width, self.pad_id)])
+        # 留下的 prompt token 位于 prefill 最后一个位置之后；prompt 只有一个 token 时该行全是 pad，从 0 开始
+        positions = torch.cat([positions, torch.where(new_mask[:, -1].bool(), new_last, new_last - 1)])
+        last = torch.tensor([r.prompt_ids[-1] for r in new], dtype=next_tokens.dtype, device=next_tokens.device)
+        return past, mask, positions, all_ids, torch.cat([next_tokens, last])
+
+    def _finish(self, req: _GenRequest):
+        ids = [t for t in req.generated if t not in self.eos_ids]
+        req.result = self.tokenizer.decode(ids, skip_special_tokens=True).strip()
+        with self._lock:
+            self.requests += 1
+        req.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "requests": self.requests,
+                "prefills": self.prefills,
+                "decode_steps": self.decode_steps,
+                "generated_tokens": self.generated_tokens,
+                "early_stops": self.early_stops,
+                "avg_batch_rows": round(self.batch_rows / self.decode_steps, 2) if self.decode_steps else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "queue_depth": self._queue.qsize(),
+            }
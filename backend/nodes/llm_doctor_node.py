@@ -1,9 +1,24 @@
 # backend/nodes/llm_doctor_node.py
 
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, TextIteratorStreamer
+from threading import Event, Thread, Lock
 import torch
+import os
+import queue
 import re
 
+from backend.nodes.generation_scheduler import GenerationScheduler
+from backend.nodes.prefix_cache import PrefixKVCache
+from backend.nodes.context_packer import ContextPacker, hits_from_context
+from backend.nodes.generation_control import GenerationControl, visible_prefix
+from backend.serving import metrics
+
+# 报告的四段，按输出顺序
+REPORT_TAGS = ("主诉", "诊断", "处方", "医嘱")
+# 医嘱段的结束：另起一行的下一个【…】，或空行后接结束语（医嘱本身可以有多段，空行后接编号等内容不算结束）
+ADVICE_END = r"\n\s*【|\n\s*\n\s*(?:以上|祝|希望|免责|仅供参考|备注|-{3})"
+# 实时建议的字数上限
+REALTIME_MAX_CHARS = 50
 
 class LLMDoctorAdviceNode:
     """
@@ -15,6 +30,11 @@ class LLMDoctorAdviceNode:
     _model = None
     _tokenizer = None
     _device = None
+    _scheduler = None
+    _prefix_cache = None
+    _packer = None
+    _control = None
+    _init_lock = Lock()
 
     def __init__(self):
         """懒加载模型 + 缓存"""
@@ -27,14 +47,11 @@ class LLMDoctorAdviceNode:
 
             # 判断设备
             if torch.backends.mps.is_available():
-                device, dtype = "mps", 
-                torch.float16
+                device, dtype = "mps", torch.float16
             elif torch.cuda.is_available():
-                device, dtype = "cuda", 
-                torch.float16
+                device, dtype = "cuda", torch.float16
             else:
-                device, dtype = "cpu", 
-                torch.float32
+                device, dtype = "cpu", torch.float32
 
             model = AutoModelForCausalLM.from_pretrained(
                 model_name,
@@ -69,8 +86,8 @@ class LLMDoctorAdviceNode:
         # 取第一句中文
         text = re.split(r"[。！？\n]", text)[0]
         text = re.sub(r"[“”\"\'·]", "", text).strip()
-        if len(text) > 50:
-            text = text[:50]
+        if len(text) > REALTIME_MAX_CHARS:
+            text = text[:REALTIME_MAX_CHARS]
         return text
 
     def _clean_report(self, text: str) -> str:
@@ -85,15 +102,7 @@ class LLMDoctorAdviceNode:
         text = re.sub(r"^[^【]*", "", text)
 
         # 捕获四段
-        def grab(tag):
-            pat = rf"【{tag}】[:：]\s*(.*?)(?=\n\s*【|$)"
-            mm = re.search(pat, text, flags=re.S)
-            return mm.group(1).strip() if mm else ""
-
-        chief = grab("主诉")
-        diag = grab("诊断")
-        rx = grab("处方")
-        advice = grab("医嘱")
+        chief, diag, rx, advice = (self._grab_section(text, tag) for tag in REPORT_TAGS)
 
         # 如果模型没输出规范格式，则尝试从内容中推测
         if not any([chief, diag, rx, advice]):
@@ -104,26 +113,65 @@ class LLMDoctorAdviceNode:
             advice = "注意休息，若持续发热及时就诊"
 
         # 每段之间空一行
-        return (
-            f"【主诉】：{chief}\n\n"
-            f"【诊断】：{diag}\n\n"
-            f"【处方】：{rx}\n\n"
-            f"【医嘱】：{advice}"
-        ).strip()
-
-
-    def build_prompt(self, mode, transcript, context):
-        """根据不同模式生成不同的 Prompt"""
+        return self._format_report(zip(REPORT_TAGS, (chief, diag, rx, advice)))
+
+    @staticmethod
+    def _grab_section(text: str, tag: str) -> str:
+        """某一段的内容：到另起一行的下一个【…】或结尾为止；医嘱段另见 ADVICE_END"""
+        end = ADVICE_END if tag == "医嘱" else r"\n\s*【"
+        mm = re.search(rf"【{tag}】[:：]\s*(.*?)(?={end}|$)", text, flags=re.S)
+        return mm.group(1).strip() if mm else ""
+
+    @staticmethod
+    def _format_report(sections) -> str:
+        return "\n\n".join(f"【{tag}】：{body}" for tag, body in sections)
+
+    # 提前停止判断：返回原文中清洗结果已完整的位置，之后的输出都会被清洗掉
+    def _realtime_end(self, raw: str):
+        """第一句已结束（或已达到字数上限），_clean_realtime 的结果不会再变"""
+        text = self._clean_text(visible_prefix(raw))
+        parts = re.split(r"[。！？\n]", text, maxsplit=1)
+        first = re.sub(r"[“”\"\'·]", "", parts[0]).strip()
+        if first and (len(parts) > 1 or len(first) >= REALTIME_MAX_CHARS):
+            return len(raw)
+        return None
+
+    def _report_end(self, raw: str):
+        """
+        【医嘱】有内容后出现医嘱段的结束（ADVICE_END：另起一行的下一个【…】，或空行后接结束语），且前三段都已输出。
+        与 _clean_report 中医嘱段的结束规则一致，停止位置之后的内容都会被清洗掉；否则生成到 EOS 为止
+        """
+        if "【医嘱】" not in raw:
+            return None
+        m = None
+        for m in re.finditer(rf"【医嘱】[:：]?\s*[^\s【].*?(?={ADVICE_END})", raw, flags=re.S):
+            pass
+        if m is None:
+            return None
+        text = self._clean_text(visible_prefix(raw[:m.end()]))
+        advice = re.search(r"【医嘱】[:：]\s*[^\s【]", text)
+        if advice and all(f"【{tag}】" in text[:advice.start()] for tag in ("主诉", "诊断", "处方")):
+            return m.end()
+        return None
+
+
+    def prompt_parts(self, mode, transcript, context):
+        """
+        Prompt 拆成 (静态前缀, 动态后缀)
+        前缀对同一模式的所有请求完全相同，其 KV cache 可以复用
+        """
         if mode == "realtime_advice":
-            return (
+            prefix = (
                 "你是一名专业医生助理，只输出一句不超过50字的医疗建议。\n"
                 "必须自然、口语化、简洁。\n"
                 "禁止输出解释、Markdown、JSON、示例或任何说明文字。\n\n"
+            )
+            suffix = (
                 f"【对话】{transcript}\n【医学知识】{context}\n"
                 "请直接输出一句建议："
             )
         elif mode == "final_report":
-            return (
+            prefix = (
                 "你是一名专业的临床医生助理。根据以下完整的问诊记录，生成一份正式病历报告。\n"
                 "报告应自然流畅、专业清晰，避免过度解释或模板化语句。\n"
                 "必须严格使用以下格式输出，每个部分应尽量详细：\n\n"
@@ -132,11 +180,126 @@ class LLMDoctorAdviceNode:
                 "【处方】：具体药物名称、剂量与使用频率，至少15字。\n"
                 "【医嘱】：日常护理建议、复诊要求等，至少15字。\n\n"
                 "禁止输出除报告内容外的任何说明、准则、抱歉、推测或格式外内容。\n\n"
+            )
+            suffix = (
                 f"【问诊全文】\n{transcript}\n\n【相关医学知识】\n{context}\n"
                 "直接输出报告，从【主诉】开始："
             )
         else:
             raise ValueError("未知模式")
+        return prefix, suffix
+
+
+    def build_prompt(self, mode, transcript, context):
+        """根据不同模式生成不同的 Prompt"""
+        return "".join(self.prompt_parts(mode, transcript, context))
+
+
+    def prefix_cache(self):
+        """指令前缀 KV cache（LLM_PREFIX_CACHE=0 关闭）"""
+        if os.getenv("LLM_PREFIX_CACHE", "1") == "0":
+            return None
+        with LLMDoctorAdviceNode._init_lock:
+            if LLMDoctorAdviceNode._prefix_cache is None:
+                LLMDoctorAdviceNode._prefix_cache = PrefixKVCache(self.model, self.tokenizer, self.device)
+                metrics.register("prefix_kv_cache", LLMDoctorAdviceNode._prefix_cache.stats)
+        return LLMDoctorAdviceNode._prefix_cache
+
+
+    def context_packer(self):
+        """按 token 预算打包对话与检索片段（LLM_CONTEXT_PACKING=0 关闭）"""
+        with LLMDoctorAdviceNode._init_lock:
+            if LLMDoctorAdviceNode._packer is None:
+                LLMDoctorAdviceNode._packer = ContextPacker.from_env(self.tokenizer) or False
+                if LLMDoctorAdviceNode._packer:
+                    metrics.register("context_packer", LLMDoctorAdviceNode._packer.stats)
+        return LLMDoctorAdviceNode._packer or None
+
+
+    def pack_state(self, state):
+        """
+        生成前把 transcript / context 装进该模式的 token 预算。
+        优先使用 RAG 节点给出的带分数命中列表 state["hits"]，没有时把 context 按行当作片段；
+        返回新的 state，附带 packing 报告（节省的 token 数等）
+        """
+        packer = self.context_packer()
+        if packer is None:
+            return state
+        mode = state.get("mode", "realtime_advice")
+        hits = state.get("hits")
+        if hits is None:
+            hits = hits_from_context(state.get("context", ""))
+        transcript, context, report = packer.pack(mode, state.get("transcript", ""), hits)
+        return dict(state, transcript=transcript, context=context, packing=report)
+
+
+    def generation_control(self):
+        """屏蔽 <think> + 按模式提前停止 + 生成 / 保留 token 统计"""
+        with LLMDoctorAdviceNode._init_lock:
+            if LLMDoctorAdviceNode._control is None:
+                eos = getattr(self.model.generation_config, "eos_token_id", None)
+                eos = list(eos) if isinstance(eos, (list, tuple)) else [eos]
+                LLMDoctorAdviceNode._control = GenerationControl.from_env(
+                    self.tokenizer,
+                    {"realtime_advice": self._realtime_end, "final_report": self._report_end},
+                    eos_ids=eos + [self.tokenizer.eos_token_id],
+                )
+                metrics.register("generation_control", LLMDoctorAdviceNode._control.stats)
+        return LLMDoctorAdviceNode._control
+
+
+    def _prepare_inputs(self, mode, transcript, context):
+        """编码 prompt；启用前缀缓存时附带已 prefill 的 past_key_values"""
+        cache = self.prefix_cache()
+        if cache is not None:
+            input_ids, attention_mask, past = cache.prepare(*self.prompt_parts(mode, transcript, context))
+            inputs = dict(input_ids=input_ids, attention_mask=attention_mask)
+            if past is not None:
+                inputs["past_key_values"] = past
+            return inputs
+        inputs = self.tokenizer([self.build_prompt(mode, transcript, context)], return_tensors="pt").to(self.device)
+        return dict(input_ids=inputs["input_ids"], attention_mask=inputs["attention_mask"])
+
+
+    def gen_kwargs(self, mode):
+        """不同模式的生成参数"""
+        if mode == "realtime_advice":
+            return dict(
+                max_new_tokens=80,
+                temperature=0.2, 
+                top_p=0.85,
+                repetition_penalty=1.05,
+                do_sample=True,
+            )
+        return dict(
+            max_new_tokens=1600,       # 长输出用于总结报告
+            temperature=0.35,
+            top_p=0.9,
+            repetition_penalty=1.05,
+            do_sample=True,
+        )
+
+
+    def realtime_scheduler(self):
+        """
+        实时建议的连续批处理调度器（LLM_REALTIME_BATCHING=1 开启）
+        多个诊室同时请求时合并成一个 batch 解码
+        """
+        if os.getenv("LLM_REALTIME_BATCHING", "0") != "1":
+            return None
+        processors = self.generation_control().processors()
+        with LLMDoctorAdviceNode._init_lock:
+            if LLMDoctorAdviceNode._scheduler is None:
+                LLMDoctorAdviceNode._scheduler = GenerationScheduler(
+                    self.model, self.tokenizer, self.device,
+                    self.gen_kwargs("realtime_advice"),
+                    max_batch_size=int(os.getenv("LLM_BATCH_SIZE", "8")),
+                    max_wait_ms=float(os.getenv("LLM_BATCH_WAIT_MS", "10")),
+                    admit_interval=int(os.getenv("LLM_BATCH_ADMIT_INTERVAL", "8")),
+                    processors=processors,
+                )
+                metrics.register("realtime_scheduler", LLMDoctorAdviceNode._scheduler.stats)
+        return LLMDoctorAdviceNode._scheduler
 
 
     # 核心执行
@@ -151,46 +314,187 @@ class LLMDoctorAdviceNode:
         transcript = state.get("transcript", "")
         context = state.get("context", "")
 
-        prompt = self.build_prompt(mode, transcript, context)
-        inputs = self.tokenizer([prompt], return_tensors="pt").to(self.device)
+        control = self.generation_control()
+        gen_kwargs = self.gen_kwargs(mode)
 
-        # 根据模式，建立符合 Chat Template 格式的 messages 列表
-        if mode == "realtime_advice":
-            gen_kwargs = dict(
-                max_new_tokens=80,
-                temperature=0.2, 
-                top_p=0.85,
-                repetition_penalty=1.05,
-                do_sample=True,
-            )
-        else:
-            gen_kwargs = dict(
-                max_new_tokens=1600,       # 长输出用于总结报告
-                temperature=0.35,
-                top_p=0.9,
-                repetition_penalty=1.05,
-                do_sample=True,
-            )
+        # 实时建议：交给连续批处理调度器
+        scheduler = self.realtime_scheduler() if mode == "realtime_advice" else None
+        if scheduler is not None:
+            prompt = self.build_prompt(mode, transcript, context)
+            checker = control.checker(mode)
+            raw, generated = scheduler.generate_ids(prompt, checker)
+            clean = self._clean_realtime(raw)
+            stopped = checker is not None and checker.stopped
+            report = control.report(mode, generated, clean, stopped, gen_kwargs["max_new_tokens"])
+            return {"llm_output": clean, "generation": report}
+
+        inputs = self._prepare_inputs(mode, transcript, context)
+        control_kwargs, criteria = control.generate_kwargs(mode, inputs["input_ids"].shape[1])
 
         # 使用 model.generate 进行推理
         with torch.no_grad():
             output_ids = self.model.generate(
-                input_ids=inputs["input_ids"],
-                attention_mask=inputs["attention_mask"],
+                **inputs,
                 eos_token_id=self.tokenizer.eos_token_id,
                 **gen_kwargs,
+                **control_kwargs,
             )
 
-        # 数据清洗
-        gen_only = output_ids[:, inputs.input_ids.shape[1]:]
-        raw = self.tokenizer.batch_decode(gen_only, skip_special_tokens=True)[0].strip()
+        # 数据清洗；提前停止时只取到输出完整为止
+        gen_only = output_ids[:, inputs["input_ids"].shape[1]:]
+        checker = criteria.checkers[0] if criteria is not None and criteria.checkers else None
+        if checker is not None and checker.stopped:
+            raw = checker.result().strip()
+        else:
+            raw = self.tokenizer.batch_decode(gen_only, skip_special_tokens=True)[0].strip()
 
         if mode == "realtime_advice":
             clean = self._clean_realtime(raw)
         else:
             clean = self._clean_report(raw)
 
-        return {"llm_output": clean}
+        report = control.report(mode, gen_only[0].tolist(), clean, checker is not None and checker.stopped,
+                                gen_kwargs["max_new_tokens"])
+        return {"llm_output": clean, "generation": report}
+
+
+    def stream(self, state, cancel=None):
+        """
+        流式生成：边生成边产出 ("token", 文本增量)，结束时产出 ("generation", 生成 / 保留 token 统计)
+        与 ("done", 清洗后的完整结果)。token 增量拼起来与 done 一致（增量清洗偏离最终结果时以 done 为准）。
+        cancel（threading.Event）被设置后生成在下一个解码步停止，不再产出 generation / done
+        """
+        mode = state.get("mode", "final_report")
+        cancel = cancel if cancel is not None else Event()
+        inputs = self._prepare_inputs(mode, state.get("transcript", ""), state.get("context", ""))
+        control = self.generation_control()
+        gen_kwargs = self.gen_kwargs(mode)
+        control_kwargs, criteria = control.generate_kwargs(mode, inputs["input_ids"].shape[1], cancel=cancel)
+
+        # 两个 token 之间最长等待时间：generate 卡住时不会一直占着 summary 通道
+        timeout = float(os.getenv("LLM_STREAM_TIMEOUT", "60"))
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+        kwargs = dict(
+            **inputs,
+            eos_token_id=self.tokenizer.eos_token_id,
+            streamer=streamer,
+            **gen_kwargs,
+            **control_kwargs,
+        )
+        output = {}
+
+        def generate():
+            # generate 出错（OOM、参数错误等）时不会结束 streamer：记下异常并手动结束，由调用方线程重新抛出
+            try:
+                with torch.no_grad():
+                    output["ids"] = self.model.generate(**kwargs)
+            except BaseException as e:
+                output["error"] = e
+            finally:
+                streamer.end()
+
+        worker = Thread(target=generate, name="llm-stream", daemon=True)
+        worker.start()
+
+        cleaner = IncrementalCleaner(self, mode)
+        finished = False
+        try:
+            for piece in streamer:
+                if cancel.is_set():
+                    break
+                delta = cleaner.feed(piece)
+                if delta:
+                    yield "token", delta
+            finished = True
+        except queue.Empty:
+            raise TimeoutError(f"生成超过 {timeout:g}s 没有新输出")
+        finally:
+            # 超时、调用方提前关闭生成器（GeneratorExit）时也让 generate 线程在下一步结束
+            if not finished:
+                cancel.set()
+        worker.join()
+        if cancel.is_set():
+            return
+        if "error" in output:
+            raise output["error"]
+
+        checker = criteria.checkers[0] if criteria is not None and criteria.checkers else None
+        stopped = checker is not None and checker.stopped
+        clean = cleaner.finish(checker.result() if stopped else None)
+        rest = cleaner.rest(clean)
+        if rest:
+            yield "token", rest
+        generated = output["ids"][0, inputs["input_ids"].shape[1]:].tolist() if "ids" in output else []
+        yield "generation", control.report(mode, generated, clean, stopped, gen_kwargs["max_new_tokens"])
+        yield "done", clean
+
+
+class IncrementalCleaner:
+    """
+    对流式输出做增量清洗：
+    - 丢弃已闭合的 <think> 块，未闭合时暂不输出
+    - 报告模式从【主诉】开始输出
+    - 末尾保留几个字符不输出，避免把 ** / <think> 之类的标记切成两半
+    - 一旦清洗结果与已输出内容不再是前缀关系（例如命中截断规则），停止增量输出
+    """
+
+    HOLD_BACK = 8
+
+    def __init__(self, node, mode):
+        self.node = node
+        self.mode = mode
+        self.raw = ""
+        self.emitted = ""
+        self.stopped = False
+
+    def _visible(self):
+        text = re.sub(r"<think>.*?</think>", "", self.raw, flags=re.S)
+        # 未闭合的 think / 代码块 / JSON 先不展示
+        for opener in ("<think>", "```", "{"):
+            idx = text.find(opener)
+            if idx != -1:
+                text = text[:idx]
+        text = self.node._clean_text(text)
+        if self.mode == "final_report":
+            # 与 _clean_report 相同的分段格式，只输出已经开始的段
+            m = re.search(r"【主诉】[:：]", text)
+            if not m:
+                return ""
+            text = text[m.start():]
+            sections = []
+            for tag in REPORT_TAGS:
+                if not re.search(rf"【{tag}】[:：]", text):
+                    break
+                sections.append((tag, self.node._grab_section(text, tag)))
+            return self.node._format_report(sections)
+        # 实时建议只取第一句
+        text = re.split(r"[。！？\n]", text)[0]
+        return re.sub(r"[“”\"\'·]", "", text).strip()[:REALTIME_MAX_CHARS]
+
+    def feed(self, piece: str) -> str:
+        """追加新生成的文本，返回可以安全输出的增量"""
+        self.raw += piece
+        if self.stopped:
+            return ""
+        visible = self._visible()
+        safe = visible[:-self.HOLD_BACK] if len(visible) > self.HOLD_BACK else ""
+        if not safe.startswith(self.emitted):
+            self.stopped = True
+            return ""
+        delta = safe[len(self.emitted):]
+        self.emitted = safe
+        return delta
+
+    def finish(self, raw=None) -> str:
+        """生成结束：对完整原文（提前停止时为截断后的原文）做与 run() 相同的清洗"""
+        raw = (self.raw if raw is None else raw).strip()
+        if self.mode == "realtime_advice":
+            return self.node._clean_realtime(raw)
+        return self.node._clean_report(raw)
+
+    def rest(self, clean: str) -> str:
+        """最终结果中还没输出的部分；已输出的增量与最终结果对不上时返回空串（以 done 为准）"""
+        return clean[len(self.emitted):] if clean.startswith(self.emitted) else ""
 
 
 # 测试用例
@@ -0,0 +1,70 @@
+# backend/nodes/onnx_embedder.py
+
+import json
+import os
+from typing import List
+
+import numpy as np
+
+# 导出目录中的文件（见 scripts/export_onnx_embedder.py）
+MODEL_FILES = {"int8": "model.int8.onnx", "fp32": "model.onnx"}
+
+
+class OnnxEmbeddingEncoder:
+    """
+    ONNX Runtime 版嵌入模型，encode 接口与 SentenceTransformer 一致，可直接替换 JinaEmbeddingNode 的模型。
+    导出目录包含：
+    - model.onnx / model.int8.onnx  输出 last_hidden_state 的 transformer（int8 为动态量化版本）
+    - tokenizer 文件                 与 PyTorch 模型相同的分词器
+    - meta.json                      {"model_name", "pooling", "max_seq_length", "dim"}
+    池化与归一化在 numpy 中完成，和 SentenceTransformer 的结果在同一向量空间，可直接查询现有索引
+    """
+
+    def __init__(self, model_dir: str, quant: str = "int8", threads: int = 0):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        path = os.path.join(model_dir, MODEL_FILES[quant])
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"未找到 ONNX 嵌入模型 {path}，请先运行 scripts/export_onnx_embedder.py")
+        with open(os.path.join(model_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.name_or_path = self.meta["model_name"]
+        self.quant = quant
+        self.pooling = self.meta.get("pooling", "mean")
+        self.max_seq_length = int(self.meta.get("max_seq_length", 512))
+        self.nbytes = os.path.getsize(path)
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    def _pool(self, hidden: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        if self.pooling == "cls":
+            return hidden[:, 0]
+        mask = mask[:, :, None].astype(np.float32)
+        return (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+
+    def encode(self, texts: List[str], normalize_embeddings: bool = True, batch_size: int = 32, **_) -> np.ndarray:
+        """按长度排序分批，减少 padding；返回与输入顺序一致的 (n, dim) float32 矩阵"""
+        if not texts:
+            return np.zeros((0, int(self.meta.get("dim", 0))), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            enc = self.tokenizer([texts[i] for i in idx], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            vecs = self._pool(hidden, enc["attention_mask"])
+            for i, vec in zip(idx, vecs):
+                out[i] = vec
+        vecs = np.stack(out).astype(np.float32)
+        if normalize_embeddings:
+            vecs /= np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+        return vecs
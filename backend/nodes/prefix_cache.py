@@ -0,0 +1,78 @@
+# backend/nodes/prefix_cache.py
+
+import threading
+
+import torch
+from transformers import DynamicCache
+
+
+def fork_cache(past):
+    """
+    给一个请求用的前缀 cache：新建 DynamicCache，各层直接引用前缀的 K/V 张量，不拷贝。
+    DynamicCache.update 用 torch.cat 生成新张量替换层中的引用，不会原地改写前缀张量，
+    所以多个请求可以同时从同一份前缀继续生成
+    """
+    legacy = past.to_legacy_cache() if hasattr(past, "to_legacy_cache") else past
+    return DynamicCache.from_legacy_cache(legacy)
+
+
+class PrefixKVCache:
+    """
+    固定指令前缀的 KV cache 复用：
+    每种模式的静态前缀只 prefill 一次，之后每个请求拿到一份共享张量的新 cache，
+    generate 时只需对 transcript / context 部分做 prefill。
+    输入始终是完整 prompt 的分词结果；只有其开头与单独分词的前缀完全一致时才复用
+    （前后缀交界处 BPE 合并方式不同则退回普通 prefill），模型看到的 token 与不缓存时相同
+    """
+
+    def __init__(self, model, tokenizer, device):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self._entries = {}   # prefix 文本 -> (prefix_ids, past_key_values)
+        self._lock = threading.Lock()
+        # 统计
+        self.builds = 0
+        self.reuses = 0
+        self.fallbacks = 0
+        self.tokens_saved = 0
+
+    def _build(self, prefix: str):
+        ids = self.tokenizer(prefix, return_tensors="pt")["input_ids"].to(self.device)
+        with torch.no_grad():
+            out = self.model(input_ids=ids, use_cache=True)
+        self.builds += 1
+        return ids, out.past_key_values
+
+    def prepare(self, prefix: str, suffix: str):
+        """
+        返回 (input_ids, attention_mask, past_key_values)：
+        input_ids 为 前缀 + 后缀 整体分词的完整 token，past_key_values 已覆盖前缀部分；
+        无法按 token 对齐时 past_key_values 为 None
+        """
+        input_ids = self.tokenizer(prefix + suffix, return_tensors="pt")["input_ids"].to(self.device)
+        attention_mask = torch.ones_like(input_ids)
+        with self._lock:
+            entry = self._entries.get(prefix)
+            hit = entry is not None
+            if not hit:
+                entry = self._entries[prefix] = self._build(prefix)
+            prefix_ids, past = entry
+            n = prefix_ids.shape[1]
+            if n >= input_ids.shape[1] or not torch.equal(input_ids[:, :n], prefix_ids):
+                self.fallbacks += 1
+                return input_ids, attention_mask, None
+            if hit:
+                self.reuses += 1
+                self.tokens_saved += n
+        return input_ids, attention_mask, fork_cache(past)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "prefixes": {p[:16] + "...": ids.shape[1] for p, (ids, _) in self._entries.items()},
+                "builds": self.builds,
+                "reuses": self.reuses,
+                "fallbacks": self.fallbacks,
+                "prefill_tokens_saved": self.tokens_saved,
+            }
@@ -1,48 +1,133 @@
 # backend/nodes/rag_query_node.py
 
-import chromadb
 from typing import Dict, Any
 import os
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
+from backend.rag.vector_store import get_vector_store, open_store_count
+from backend.rag.multi_query import fuse_results, mmr
+from backend.rag.bm25_index import get_bm25_index, hybrid_fuse
+from backend.rag.retrieval_cache import RetrievalCache, index_version, query_key, shared_watch
+from backend.serving import metrics
+
 class RAGQueryNode:
     """
     RAG 检索节点
-    根据 embedding 从 Chroma 查询医学知识
+    根据 embedding 从向量库查询医学知识（后端由 VECTOR_BACKEND 选择：chroma / numpy / snapshot）
     """
+
+    # 检索结果缓存（进程内共享，随索引版本自动失效）
+    _cache = None
     
     def __init__(self, chroma_dir="rag_store"):
-        # 初始化 Chroma 数据库
-        chroma_dir = os.getenv("CHROMA_PERSIST", "rag_store")
-        self.client = chromadb.PersistentClient(path=chroma_dir)
-        self.collection = self.client.get_or_create_collection("medical_knowledge")
-        print(f"RAGQueryNode 已连接向量库(路径：{chroma_dir})")
+        # 多查询向量（长问诊记录切窗）时：每个窗口取几条、合并后保留几条、MMR 权重
+        self.window_k = int(os.getenv("RAG_WINDOW_K", "4"))
+        self.multi_top_k = int(os.getenv("RAG_MULTI_TOP_K", "5"))
+        self.mmr_lambda = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+        # 混合检索：BM25 倒排索引存在时启用，两路各取若干候选后按权重融合
+        self.hybrid = os.getenv("RAG_HYBRID", "1") != "0"
+        self.hybrid_candidates = int(os.getenv("RAG_HYBRID_CANDIDATES", "10"))
+        self.hybrid_alpha = float(os.getenv("RAG_HYBRID_ALPHA", "0.6"))
+        if RAGQueryNode._cache is None and os.getenv("RAG_CACHE", "1") != "0":
+            RAGQueryNode._cache = RetrievalCache(
+                max_bytes=int(os.getenv("RAG_CACHE_MAX_MB", "32")) * 1024 * 1024,
+                watch=shared_watch(),
+            )
+            metrics.register("retrieval_cache", RAGQueryNode._cache.stats)
+        self.cache = RAGQueryNode._cache
+        self.cache_quant = float(os.getenv("RAG_CACHE_QUANT", "64"))
+        print(f"RAGQueryNode 已连接向量库(后端：{self.store.backend}，路径：{self.store.path})")
+
+    @property
+    def store(self):
+        """同一后端 + 路径在进程内只打开一次；numpy / snapshot 在索引版本变化后重新打开"""
+        return get_vector_store()
+
+    @classmethod
+    def client_count(cls):
+        return open_store_count()
 
     def run(self, state: Dict[str, Any]):
         """
         输入: state["embeddings"](来自上游 Embedding Node)
         输出: state["context"] (供 LLM 节点使用的文本上下文)
+              state["hits"]    (带检索分数的完整命中列表，供 LLM 节点按 token 预算打包)
         """
         query_emb = state.get("embeddings")
-        if not query_emb:
+        if query_emb is None or len(query_emb) == 0:
             print("RAG Query Node: 没收到 embedding 输入")
-            return {"context": ""}
+            return {"context": "", "hits": []}
+
+        # 本次检索全程使用同一个向量库实例
+        store = self.store
+        key = None
+        if self.cache is not None:
+            mode = "multi" if len(query_emb) > 1 else ("hybrid" if self.hybrid and get_bm25_index() else "vector")
+            n = self.multi_top_k if len(query_emb) > 1 else 3
+            # 混合检索的词法一侧取决于原文，原文也要进入缓存键
+            text = "\n".join(state.get("texts") or []) if mode == "hybrid" else ""
+            key = query_key(query_emb, n, f"{store.backend}|{index_version()}|{mode}|{text}", self.cache_quant)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return dict(cached)
         
-        # 向量检索
-        results = self.collection.query(
-            query_embeddings=query_emb, 
-            n_results=3
-        )
+        # 多条查询向量：一次批量检索，合并去重 + 融合打分 + MMR 多样性
+        if len(query_emb) > 1:
+            results = store.query(query_emb, n_results=self.window_k, include_embeddings=True)
+            hits = mmr(fuse_results(results), self.multi_top_k, self.mmr_lambda)
+            rows = [(h["id"], h["score"], h["metadata"], h["document"]) for h in hits]
+        else:
+            bm25 = get_bm25_index() if self.hybrid else None
+            query_text = "\n".join(state.get("texts") or [])
+            if bm25 is not None and query_text:
+                rows = self._hybrid_query(store, bm25, query_emb, query_text, 3)
+            else:
+                # 向量检索
+                results = store.query(query_emb, n_results=3)
+                rows = [(cid, 1.0 - dist / 2.0, meta, doc) for cid, dist, meta, doc in zip(
+                    results["ids"][0], results["distances"][0], results["metadatas"][0], results["documents"][0])]
         
         # 格式化结果为可读文本
         docs = []
-        for meta, doc in zip(results["metadatas"][0], results["documents"][0]):
+        for _, _, meta, doc in rows:
             docs.append(f"[{meta['source_type']}] {meta['title']} → {doc[:500]}...")
             # print(f"[{meta['source_type']}] {meta['title']} → {doc[:300]}...")
         
-        context_text = "\n".join(docs)
-        return {"context": context_text}
+        out = {
+            "context": "\n".join(docs),
+            "hits": [{
+                "id": cid,
+                "score": float(score),
+                "title": meta.get("title", ""),
+                "source_type": meta.get("source_type", ""),
+                "chunk_index": meta.get("chunk_index"),
+                "document": doc,
+            } for cid, score, meta, doc in rows],
+        }
+        if key is not None:
+            self.cache.put(key, out)
+        return out
+
+    def _hybrid_query(self, store, bm25, query_emb, query_text, k):
+        """向量 + BM25 融合，返回 [(id, 融合分数, metadata, document)]"""
+        results = store.query(query_emb, n_results=self.hybrid_candidates)
+        known = {}
+        vec_hits = []
+        for cid, dist, meta, doc in zip(results["ids"][0], results["distances"][0],
+                                        results["metadatas"][0], results["documents"][0]):
+            known[cid] = (meta, doc)
+            vec_hits.append((cid, 1.0 - dist / 2.0))
+        lex_hits = bm25.search(query_text, self.hybrid_candidates)
+        fused = hybrid_fuse(vec_hits, lex_hits, self.hybrid_alpha)[:k]
+
+        # 只被 BM25 命中的 chunk 需要回向量库取原文
+        missing = [cid for cid, _ in fused if cid not in known]
+        if missing:
+            got = store.get(missing)
+            for cid, meta, doc in zip(got["ids"], got["metadatas"], got["documents"]):
+                known[cid] = (meta, doc)
+        return [(cid, score) + known[cid] for cid, score in fused if cid in known]
     
 
 if __name__ == "__main__":
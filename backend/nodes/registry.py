@@ -0,0 +1,89 @@
+# backend/nodes/registry.py
+
+import threading
+
+from backend.serving import metrics
+
+
+def _param_bytes(module) -> int:
+    """torch 模块参数 + buffer 占用的字节数"""
+    total = 0
+    for t in list(module.parameters()) + list(module.buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+def _rss_bytes() -> int:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        import resource
+        # Linux 上 ru_maxrss 单位是 KB（峰值）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class NodeRegistry:
+    """
+    进程级节点注册表：
+    嵌入模型、向量库连接、LLM 各只构建一次，所有编译出的图、所有线程共享同一份实例。
+    每种资源有自己的锁，可以并行加载不同资源，同一资源不会被重复构建。
+    """
+
+    def __init__(self):
+        self._nodes = {}
+        self._locks = {name: threading.Lock() for name in ("embed", "rag", "llm")}
+
+    def _get(self, name, factory):
+        node = self._nodes.get(name)
+        if node is not None:
+            return node
+        with self._locks[name]:
+            if name not in self._nodes:
+                self._nodes[name] = factory()
+            return self._nodes[name]
+
+    def embedder(self):
+        from backend.nodes.embedding_node import JinaEmbeddingNode
+        return self._get("embed", JinaEmbeddingNode)
+
+    def rag(self):
+        from backend.nodes.rag_query_node import RAGQueryNode
+        return self._get("rag", RAGQueryNode)
+
+    def llm(self):
+        from backend.nodes.llm_doctor_node import LLMDoctorAdviceNode
+        return self._get("llm", LLMDoctorAdviceNode)
+
+    def nodes(self):
+        """{"embed", "rag", "llm"}，未加载的会在此加载"""
+        return {"embed": self.embedder(), "rag": self.rag(), "llm": self.llm()}
+
+    def loaded(self):
+        return sorted(self._nodes)
+
+    def memory_footprint(self):
+        """各资源的内存占用估计（MB）以及进程 RSS"""
+        mb = lambda b: round(b / 1024 / 1024, 1)
+        out = {"rss_mb": mb(_rss_bytes()), "loaded": self.loaded()}
+        embed = self._nodes.get("embed")
+        if embed is not None:
+            # ONNX 后端没有 torch 参数，按模型文件大小估计
+            nbytes = embed.model.nbytes if hasattr(embed.model, "nbytes") else _param_bytes(embed.model)
+            out["embedding_model_mb"] = mb(nbytes)
+        llm = self._nodes.get("llm")
+        if llm is not None:
+            out["llm_mb"] = mb(_param_bytes(llm.model))
+        rag = self._nodes.get("rag")
+        if rag is not None:
+            out["vector_stores_open"] = rag.client_count()
+            out["vector_store"] = rag.store.stats()
+        return out
+
+
+_registry = NodeRegistry()
+metrics.register("node_registry", _registry.memory_footprint)
+
+
+def get_registry() -> NodeRegistry:
+    return _registry
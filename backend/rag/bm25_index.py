@@ -0,0 +1,210 @@
+# backend/rag/bm25_index.py
+
+import json
+import math
+import os
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from backend.rag.retrieval_cache import index_version
+
+DICT_DIR = os.path.join(os.path.dirname(__file__), "..", "ASR", "dict")
+
+
+class JiebaTokenizer:
+    """
+    jieba 分词 + 项目自带词典：
+    user.dict.utf8 作为用户词典，stop_words.utf8 过滤停用词。
+    （hmm_model.utf8 是 cppjieba 格式，python jieba 用自带的 HMM 模型处理未登录词）
+    """
+
+    _lock = threading.Lock()
+    _shared = None
+
+    def __init__(self, dict_dir: str = DICT_DIR):
+        import jieba
+        self.jieba = jieba.Tokenizer()
+        user_dict = os.path.join(dict_dir, "user.dict.utf8")
+        if os.path.exists(user_dict):
+            self.jieba.load_userdict(user_dict)
+        self.stop_words = set()
+        stop_path = os.path.join(dict_dir, "stop_words.utf8")
+        if os.path.exists(stop_path):
+            with open(stop_path, encoding="utf-8") as f:
+                self.stop_words = {line.strip() for line in f if line.strip()}
+
+    @classmethod
+    def shared(cls):
+        with cls._lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def tokenize(self, text: str) -> List[str]:
+        return [
+            t.lower() for t in self.jieba.lcut(text or "", HMM=True)
+            if t.strip() and t not in self.stop_words
+        ]
+
+
+class BM25IndexBuilder:
+    """收集 (chunk_id, 文本)，写成紧凑的倒排索引目录"""
+
+    def __init__(self, tokenizer: Optional[JiebaTokenizer] = None):
+        self.tokenizer = tokenizer or JiebaTokenizer.shared()
+        self.doc_ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+
+    def add(self, chunk_id: str, text: str):
+        doc = len(self.doc_ids)
+        tokens = self.tokenizer.tokenize(text)
+        self.doc_ids.append(chunk_id)
+        self.doc_lens.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self.postings.setdefault(term, []).append((doc, tf))
+
+    def write(self, out_dir: str, k1: float = 1.5, b: float = 0.75):
+        """
+        目录结构：
+        - terms.json         词表（按字典序），下标即 term id
+        - offsets.i64.npy    (V+1,) 每个词的倒排表在 postings 中的起止位置
+        - post_docs.u32.npy  倒排表：文档序号（每个词内升序）
+        - post_tf.u16.npy    倒排表：词频
+        - doc_len.u32.npy    每个文档的词数
+        - doc_ids.json       文档序号 -> chunk id
+        - meta.json          N / avgdl / k1 / b
+        """
+        os.makedirs(out_dir, exist_ok=True)
+        terms = sorted(self.postings)
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        for i, term in enumerate(terms):
+            offsets[i + 1] = offsets[i] + len(self.postings[term])
+        docs = np.empty(int(offsets[-1]), dtype=np.uint32)
+        tfs = np.empty(int(offsets[-1]), dtype=np.uint16)
+        for i, term in enumerate(terms):
+            plist = self.postings[term]
+            docs[offsets[i]:offsets[i + 1]] = [d for d, _ in plist]
+            tfs[offsets[i]:offsets[i + 1]] = [min(tf, 65535) for _, tf in plist]
+
+        np.save(os.path.join(out_dir, "offsets.i64.npy"), offsets)
+        np.save(os.path.join(out_dir, "post_docs.u32.npy"), docs)
+        np.save(os.path.join(out_dir, "post_tf.u16.npy"), tfs)
+        np.save(os.path.join(out_dir, "doc_len.u32.npy"), np.asarray(self.doc_lens, dtype=np.uint32))
+        with open(os.path.join(out_dir, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(out_dir, "doc_ids.json"), "w", encoding="utf-8") as f:
+            json.dump(self.doc_ids, f, ensure_ascii=False)
+        n = len(self.doc_ids)
+        with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"N": n, "avgdl": (sum(self.doc_lens) / n) if n else 0.0, "k1": k1, "b": b}, f)
+
+
+class BM25Index:
+    """mmap 加载的 BM25 倒排索引，查询只触碰命中词的倒排表"""
+
+    def __init__(self, path: str, tokenizer: Optional[JiebaTokenizer] = None):
+        self.path = path
+        self.tokenizer = tokenizer or JiebaTokenizer.shared()
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(path, "terms.json"), encoding="utf-8") as f:
+            self.term_ids = {t: i for i, t in enumerate(json.load(f))}
+        with open(os.path.join(path, "doc_ids.json"), encoding="utf-8") as f:
+            self.doc_ids = json.load(f)
+        load = lambda name: np.load(os.path.join(path, name), mmap_mode="r")
+        self.offsets = load("offsets.i64.npy")
+        self.post_docs = load("post_docs.u32.npy")
+        self.post_tf = load("post_tf.u16.npy")
+
+        k1, b, avgdl = self.meta["k1"], self.meta["b"], max(self.meta["avgdl"], 1e-9)
+        self.k1 = k1
+        # 预先算好每个文档的长度归一项 k1·(1 - b + b·dl/avgdl)
+        doc_len = np.asarray(load("doc_len.u32.npy"), dtype=np.float32)
+        self._norm = (k1 * (1 - b + b * doc_len / avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    def search(self, text: str, k: int = 10) -> List[Tuple[str, float]]:
+        """返回 [(chunk_id, bm25 分数)]，按分数降序"""
+        n = len(self.doc_ids)
+        terms = Counter(t for t in self.tokenizer.tokenize(text) if t in self.term_ids)
+        if not terms or not n:
+            return []
+        scores = np.zeros(n, dtype=np.float32)
+        for term, qtf in terms.items():
+            tid = self.term_ids[term]
+            start, end = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = self.post_docs[start:end]
+            tf = np.asarray(self.post_tf[start:end], dtype=np.float32)
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            # 同一个词的倒排表中文档不重复，可以直接按下标累加
+            scores[docs] += qtf * idf * tf * (self.k1 + 1) / (tf + self._norm[docs])
+        k = min(k, n)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def build_from_store(store, out_dir: str, batch_size: int = 2000) -> int:
+    """对向量库中现有的全部 chunk 重建倒排索引，返回文档数"""
+    builder = BM25IndexBuilder()
+    if hasattr(store, "collection"):
+        offset = 0
+        while True:
+            page = store.collection.get(include=["documents"], limit=batch_size, offset=offset)
+            if not page["ids"]:
+                break
+            for cid, doc in zip(page["ids"], page["documents"]):
+                builder.add(cid, doc)
+            offset += len(page["ids"])
+    else:
+        for cid, doc in zip(store.ids, store.documents):
+            builder.add(cid, doc)
+    builder.write(out_dir)
+    return len(builder.doc_ids)
+
+
+def hybrid_fuse(vector_hits: List[Tuple[str, float]], lexical_hits: List[Tuple[str, float]],
+                alpha: float = 0.6, floor: float = 0.05) -> List[Tuple[str, float]]:
+    """
+    向量分数与 BM25 分数各自 min-max 归一化后加权：alpha·向量 + (1-alpha)·BM25
+    只在一侧出现的结果，另一侧记 0；出现过的最低分归一化为 floor 而不是 0，与"未出现"区分开。
+    分数相同时依次按向量分数、id 排序，结果与进程的 hash 种子无关
+    """
+    def normalize(hits):
+        if not hits:
+            return {}
+        vals = [s for _, s in hits]
+        lo, hi = min(vals), max(vals)
+        span = hi - lo
+        return {cid: (floor + (1 - floor) * (s - lo) / span if span > 0 else 1.0) for cid, s in hits}
+
+    vec, lex = normalize(vector_hits), normalize(lexical_hits)
+    fused = {cid: alpha * vec.get(cid, 0.0) + (1 - alpha) * lex.get(cid, 0.0) for cid in set(vec) | set(lex)}
+    return sorted(fused.items(), key=lambda x: (-x[1], -vec.get(x[0], 0.0), x[0]))
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_bm25_index() -> Optional[BM25Index]:
+    """进程内共享的 BM25 索引（BM25_INDEX_DIR，不存在时返回 None）；索引版本变化后重新打开"""
+    global _index, _index_version
+    version = index_version()
+    with _index_lock:
+        if _index is not None and _index_version != version:
+            _index = None
+        if _index is None:
+            path = os.getenv("BM25_INDEX_DIR", "rag_store_bm25")
+            if not os.path.exists(os.path.join(path, "meta.json")):
+                return None
+            _index, _index_version = BM25Index(path), version
+        return _index
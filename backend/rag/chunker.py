@@ -0,0 +1,145 @@
+# backend/rag/chunker.py
+
+import hashlib
+import os
+import re
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 句末标点：chunk 尽量在这些字符之后断开
+SENTENCE_END = "。！？!?；;\n"
+_SENTENCE_CODES = np.array([ord(c) for c in SENTENCE_END], dtype=np.uint32)
+
+
+def chunk_text_chars(text, chunk_size=500, overlap=80):
+    """原有的按字符切块：按标点分句，每块不超过 chunk_size 字符，重叠 overlap 字符"""
+    sents = re.split(r'(?<=[。！？\n])', text)
+    chunks, current = [], ""
+    for sent in sents:
+        if len(current) + len(sent) > chunk_size:
+            chunks.append(current.strip())
+            current = current[-overlap:].strip() + sent  # 保留重叠部分
+        else:
+            current += sent
+    if current:
+        chunks.append(current.strip())
+    # 丢掉太短的块
+    return [(i, c) for i, c in enumerate(chunks) if len(c) > 10]
+
+
+def stable_chunk_id(source_type: str, title: str, text: str) -> str:
+    """
+    按内容生成 chunk id：同一文档前面插入 / 删除内容时，未变的 chunk id 不变，
+    增量构建只需处理真正变化的块
+    """
+    doc = hashlib.md5(f"{title}_{source_type}".encode("utf-8")).hexdigest()[:8]
+    body = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+    return f"{source_type}-{doc}-{body}"
+
+
+class TokenChunker:
+    """
+    按嵌入模型的 token 数切块：
+    - 一批文档一次性交给 fast tokenizer（带 offset_mapping），不逐字拼接字符串
+    - 每块最多 chunk_tokens 个 token；在后半段内找最后一个句末标点处断开，找不到则硬切
+    - 相邻块重叠 overlap_tokens 个 token；块文本直接按 offset 从原文切片
+    """
+
+    def __init__(self, tokenizer, chunk_tokens: int = 320, overlap_tokens: int = 48, min_chars: int = 10):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens 必须小于 chunk_tokens")
+        self.tokenizer = tokenizer
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_chars = min_chars
+
+    @classmethod
+    def from_env(cls, model_name: str = "jinaai/jina-embeddings-v3") -> "TokenChunker":
+        """只加载嵌入模型的分词器；CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS 可调"""
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        if not getattr(tokenizer, "is_fast", False):
+            raise ValueError(f"{model_name} 没有 fast tokenizer，无法取得 offset_mapping")
+        return cls(
+            tokenizer,
+            chunk_tokens=int(os.getenv("CHUNK_TOKENS", "320")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "48")),
+        )
+
+    def _spans(self, text: str, offsets: np.ndarray) -> List[Tuple[int, int]]:
+        """单篇文档：token 偏移 (n, 2) -> 每块的 [起始 token, 结束 token)"""
+        n = len(offsets)
+        if n == 0:
+            return []
+        # 以句末标点结尾的 token 位置（向量化判断）
+        codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+        ends = np.clip(offsets[:, 1] - 1, 0, max(len(codes) - 1, 0))
+        boundary = np.flatnonzero(np.isin(codes[ends], _SENTENCE_CODES)) + 1 if len(codes) else np.array([], int)
+
+        spans, start = [], 0
+        while start < n:
+            end = min(start + self.chunk_tokens, n)
+            if end < n:
+                # (start + chunk_tokens/2, end] 内最后一个句末边界
+                i = np.searchsorted(boundary, end, side="right") - 1
+                if i >= 0 and boundary[i] > start + self.chunk_tokens // 2:
+                    end = int(boundary[i])
+            spans.append((start, end))
+            if end >= n:
+                break
+            start = max(end - self.overlap_tokens, start + 1)
+        return spans
+
+    def chunk_many(self, texts: Sequence[str]) -> List[List[Tuple[int, str]]]:
+        """一批文档 -> 每篇的 [(块序号, 块文本)]，与 chunk_text_chars 的输出格式一致"""
+        enc = self.tokenizer(list(texts), add_special_tokens=False, return_offsets_mapping=True,
+                             return_attention_mask=False, return_token_type_ids=False)
+        out = []
+        for text, offsets in zip(texts, enc["offset_mapping"]):
+            offsets = np.asarray(offsets, dtype=np.int64).reshape(-1, 2)
+            chunks = []
+            for start, end in self._spans(text, offsets):
+                piece = text[offsets[start, 0]:offsets[end - 1, 1]].strip()
+                if len(piece) > self.min_chars:
+                    chunks.append(piece)
+            out.append(list(enumerate(chunks)))
+        return out
+
+    def chunk(self, text: str) -> List[Tuple[int, str]]:
+        return self.chunk_many([text])[0]
+
+    def token_counts(self, texts: Sequence[str]) -> np.ndarray:
+        """每段文本的 token 数（基准脚本统计块大小用）"""
+        if not texts:
+            return np.zeros(0, dtype=np.int64)
+        ids = self.tokenizer(list(texts), add_special_tokens=False)["input_ids"]
+        return np.array([len(x) for x in ids], dtype=np.int64)
+
+
+# 原有按字符切块（chunk_text_chars 默认参数、按序号编号的 id）的签名；没有记录切块签名的旧清单按此处理
+CHAR_CHUNK_SIGNATURE = "char|500/80|id=index"
+
+
+def chunk_signature(chunker: Optional[TokenChunker]) -> str:
+    """
+    切块配置签名（make_chunker 的返回值 -> 字符串）：切块方式、参数或 id 规则变化时，
+    chunk 边界和 id 全部改变，清单无法增量比对，build_rag_index.py 要求加 --full
+    """
+    if chunker is None:
+        return CHAR_CHUNK_SIGNATURE
+    name = getattr(chunker.tokenizer, "name_or_path", type(chunker.tokenizer).__name__)
+    return f"token|{name}|{chunker.chunk_tokens}/{chunker.overlap_tokens}|min={chunker.min_chars}|id=content"
+
+
+def make_chunker(kind: Optional[str] = None):
+    """
+    CHUNKER=token（默认，按 token 切块）| char（原有按字符切块）
+    两者的 chunk id 规则不同：已有按字符切块的索引切换到 token 需要 --full 全量重建（见 chunk_signature）
+    """
+    kind = kind or os.getenv("CHUNKER", "token")
+    if kind == "token":
+        return TokenChunker.from_env()
+    if kind == "char":
+        return None
+    raise ValueError(f"未知切块方式: {kind}")
@@ -0,0 +1,120 @@
+# backend/rag/index_manifest.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def manifest_path() -> str:
+    """索引清单文件：与向量库目录并列，记录每个 chunk id 已写入内容的 hash"""
+    return os.getenv("RAG_MANIFEST", "rag_store.manifest.sqlite")
+
+
+def chunk_hash(document: str, metadata: Dict) -> str:
+    """chunk 内容 hash：正文或元数据任一变化都视为变更"""
+    raw = json.dumps({"doc": document, "meta": metadata}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class IndexManifest:
+    """
+    增量构建清单（SQLite）：
+    - chunks(id, hash)：向量已成功写入向量库的 chunk 及其内容 hash
+    - state(key, value)：嵌入模型签名等
+    每批向量写入成功后立即提交对应的清单记录，构建被中断时已提交的部分不会重算，
+    重跑即从中断处继续；写入成功但清单未提交的那一批会被重新 upsert，结果相同。
+    流式构建时用 diff() 逐批比对，本次见过的 id 记在临时表里，结束后 unseen_ids() 即为要删除的 chunk；
+    只扫描了部分源数据（如 --limit）时没见到不代表已删除，unseen_ids() 返回空列表。
+    内存占用与 chunk 总数无关。连接由流水线各线程共享，所有访问都经过同一把锁
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or manifest_path()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self.begin_scan()
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get_state(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, key: str, value: str):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def record(self, items: Iterable[Tuple[str, str]]):
+        """一批 (id, hash) 已写入向量库"""
+        items = list(items)
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO chunks (id, hash) VALUES (?, ?)", items)
+
+    def forget(self, ids: Iterable[str]):
+        """一批 id 已从向量库删除"""
+        with self._lock, self.conn:
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", [(i,) for i in ids])
+
+    def reset(self):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM chunks")
+
+    def begin_scan(self, partial: bool = False):
+        """开始一次比对：清空"本次见过的 id"与计数；partial=True 表示本次只扫描部分源数据"""
+        self.partial = partial
+        with self._lock, self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (id TEXT PRIMARY KEY)")
+            self.conn.execute("DELETE FROM seen")
+        self.delta = {"total": 0, "new": 0, "changed": 0, "unchanged": 0, "duplicates": 0}
+
+    def diff(self, chunks: Iterable[Dict]) -> List[Dict]:
+        """
+        一批 chunk 与清单比对，返回需要嵌入写入的（附带 "hash" 字段）。
+        本次扫描中重复出现的 id 只取第一次
+        """
+        out = []
+        with self._lock, self.conn:
+            for chunk in chunks:
+                cid = chunk["id"]
+                if self.conn.execute("INSERT OR IGNORE INTO seen (id) VALUES (?)", (cid,)).rowcount == 0:
+                    self.delta["duplicates"] += 1
+                    continue
+                self.delta["total"] += 1
+                h = chunk_hash(chunk["doc"], chunk["meta"])
+                row = self.conn.execute("SELECT hash FROM chunks WHERE id = ?", (cid,)).fetchone()
+                if row is None:
+                    self.delta["new"] += 1
+                elif row[0] != h:
+                    self.delta["changed"] += 1
+                else:
+                    self.delta["unchanged"] += 1
+                    continue
+                out.append(dict(chunk, hash=h))
+        return out
+
+    def unseen_ids(self) -> List[str]:
+        """清单中有、本次扫描没见到的 id（源数据已删除）；部分扫描时无法判断，返回空列表"""
+        if self.partial:
+            return []
+        with self._lock:
+            return [r[0] for r in self.conn.execute(
+                "SELECT id FROM chunks WHERE id NOT IN (SELECT id FROM seen) ORDER BY id")]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+def batched(items: List, size: int) -> Iterator[List]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,183 @@
+# backend/rag/ingest_pipeline.py
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_END = object()
+
+
+class _StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0       # 除去等待上下游队列之外的耗时
+        self.started = None
+        self.finished = None
+
+    def snapshot(self, in_q: Optional[queue.Queue]) -> Dict[str, Any]:
+        end = self.finished or time.perf_counter()
+        elapsed = max(end - (self.started or end), 1e-9)
+        return {
+            "in": self.items_in,
+            "out": self.items_out,
+            "out_per_s": round(self.items_out / elapsed, 1),
+            "busy_s": round(self.busy, 2),
+            "busy_ratio": round(min(self.busy / elapsed, 1.0), 3),
+            "queue_depth": in_q.qsize() if in_q is not None else None,
+        }
+
+
+class StreamPipeline:
+    """
+    多阶段流式流水线：每个阶段一个线程，阶段之间用有界队列连接。
+    - 阶段是 transform(iterable) -> iterable：可以一进多出，也可以在内部攒批，输入结束时再输出尾批
+    - 队列满时上游阻塞，内存占用只取决于队列长度 × 每项大小，与总数据量无关
+    - 任一阶段出错时整条流水线停止，run() 抛出该异常
+    统计：各阶段输入 / 输出条数、吞吐、忙碌占比，以及队列的当前 / 最大深度
+    """
+
+    def __init__(self, source: Iterable, queue_size: int = 8):
+        self.source = source
+        self.queue_size = queue_size
+        self.stages: List[Tuple[str, Callable[[Iterable], Iterable]]] = []
+        self._stats: List[_StageStats] = []
+        self._queues: List[queue.Queue] = []
+        self._max_depth: List[int] = []
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def stage(self, name: str, transform: Callable[[Iterable], Iterable]) -> "StreamPipeline":
+        self.stages.append((name, transform))
+        return self
+
+    def _put(self, q: queue.Queue, idx: int, item, stats: _StageStats):
+        t0 = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.busy -= time.perf_counter() - t0
+        self._max_depth[idx] = max(self._max_depth[idx], q.qsize())
+
+    def _drain(self, q: queue.Queue, stats: _StageStats) -> Iterator:
+        """从上游队列逐项取出，等待时间不计入本阶段忙碌时间"""
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                stats.busy -= time.perf_counter() - t0
+                continue
+            stats.busy -= time.perf_counter() - t0
+            if item is _END:
+                return
+            stats.items_in += 1
+            yield item
+
+    def _run_stage(self, idx: int, items: Iterable, out_q: Optional[queue.Queue], stats: _StageStats):
+        stats.started = time.perf_counter()
+        t0 = stats.started
+        try:
+            for out in items:
+                stats.items_out += 1
+                if out_q is not None:
+                    self._put(out_q, idx, out, stats)
+                if self._stop.is_set():
+                    break
+        except BaseException as e:  # noqa: B902 传回主线程
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+        finally:
+            stats.finished = time.perf_counter()
+            stats.busy += stats.finished - t0
+            if out_q is not None:
+                # 结束标记必须送达，下游才能输出尾批并退出
+                while True:
+                    try:
+                        out_q.put(_END, timeout=0.1)
+                        break
+                    except queue.Full:
+                        if self._stop.is_set():
+                            break
+
+    def run(self, report_every: float = 0.0, report: Callable[[Dict[str, Any]], None] = print) -> Dict[str, Any]:
+        """运行到源数据耗尽；report_every > 0 时定期输出一次统计"""
+        names = ["source"] + [name for name, _ in self.stages]
+        self._stats = [_StageStats(n) for n in names]
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self._max_depth = [0] * len(self.stages)
+
+        threads = []
+        for i, stats in enumerate(self._stats):
+            if i == 0:
+                items = self.source
+            else:
+                items = self.stages[i - 1][1](self._drain(self._queues[i - 1], stats))
+            out_q = self._queues[i] if i < len(self._queues) else None
+            threads.append(threading.Thread(target=self._run_stage, args=(i, items, out_q, stats),
+                                            name=f"pipeline-{names[i]}", daemon=True))
+        for t in threads:
+            t.start()
+        last = time.perf_counter()
+        while any(t.is_alive() for t in threads):
+            threads[-1].join(timeout=0.2)
+            if report_every and time.perf_counter() - last >= report_every:
+                last = time.perf_counter()
+                report(self.stats())
+        for t in threads:
+            t.join()
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for i, stats in enumerate(self._stats):
+            in_q = self._queues[i - 1] if i > 0 else None
+            snap = stats.snapshot(in_q)
+            if in_q is not None:
+                snap["queue_max"] = self._max_depth[i - 1]
+            out[stats.name] = snap
+        return out
+
+
+def batches(items: Iterable, size: int) -> Iterator[List]:
+    """把逐条输入攒成固定大小的批，输入结束时输出不足一批的尾批"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def length_sorted_batches(texts: List[str], size: int) -> List[List[int]]:
+    """按文本长度排序后切批，返回每批的下标：同一批内长度相近，padding 最少"""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    return [order[i:i + size] for i in range(0, len(order), size)]
+
+
+def embed_length_sorted(chunks: List[Dict[str, Any]], encode_batches: Callable[[List[List[str]]], Iterable],
+                        size: int) -> List[Dict[str, Any]]:
+    """
+    按长度排序分批嵌入，结果按输入顺序返回（每条附上 "emb"）。
+    encode_batches(批次列表) 须按提交顺序返回每批的向量（如 ProcessPoolExecutor.map）
+    """
+    texts = [c["doc"] for c in chunks]
+    index_batches = length_sorted_batches(texts, size)
+    out: List[Optional[Dict[str, Any]]] = [None] * len(chunks)
+    results = encode_batches([[texts[i] for i in idx] for idx in index_batches])
+    for idx, embeddings in zip(index_batches, results):
+        if len(embeddings) != len(idx):
+            raise ValueError(f"嵌入结果 {len(embeddings)} 行，与批次 {len(idx)} 条不一致")
+        for i, emb in zip(idx, embeddings):
+            out[i] = dict(chunks[i], emb=emb)
+    return out
@@ -0,0 +1,86 @@
+# backend/rag/multi_query.py
+
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+def split_windows(transcript: str, window_chars: int = 300, overlap_lines: int = 1) -> List[str]:
+    """
+    长问诊记录按行（话语）切成若干窗口，每个窗口（含行间换行符）不超过 window_chars 个字符，
+    相邻窗口重叠 overlap_lines 行，避免一个症状描述被切断
+    """
+    lines = []
+    for line in (transcript or "").split("\n"):
+        line = line.strip()
+        # 单行超长时按字符切开
+        lines.extend(line[i:i + window_chars] for i in range(0, len(line), window_chars))
+    if not lines:
+        return []
+    def joined(ls):
+        # 窗口按 "\n" 连接，分隔符也计入长度
+        return sum(len(l) for l in ls) + max(len(ls) - 1, 0)
+
+    windows, current = [], []
+    for line in lines:
+        if current and joined(current) + 1 + len(line) > window_chars:
+            windows.append("\n".join(current))
+            current = current[-overlap_lines:] if overlap_lines else []
+            # 带上重叠行后放不下新的一行时，从前往后丢掉重叠行
+            while current and joined(current) + 1 + len(line) > window_chars:
+                current.pop(0)
+        current.append(line)
+    if current:
+        windows.append("\n".join(current))
+    return windows
+
+
+def fuse_results(results: Dict[str, List[List[Any]]], rrf_k: int = 60) -> List[Dict[str, Any]]:
+    """
+    多个查询窗口的检索结果合并：
+    - 按 chunk id 去重
+    - 融合分数用 RRF：sum(1 / (rrf_k + rank))，被多个窗口命中的 chunk 排名更靠前
+    - 同时保留各窗口中的最高余弦相似度（由 l2 距离换算）
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    has_emb = results.get("embeddings") is not None
+    for q in range(len(results["ids"])):
+        for rank, cid in enumerate(results["ids"][q]):
+            sim = 1.0 - results["distances"][q][rank] / 2.0
+            hit = merged.get(cid)
+            if hit is None:
+                hit = merged[cid] = {
+                    "id": cid,
+                    "document": results["documents"][q][rank],
+                    "metadata": results["metadatas"][q][rank],
+                    "embedding": np.asarray(results["embeddings"][q][rank], dtype=np.float32) if has_emb else None,
+                    "score": 0.0,
+                    "similarity": sim,
+                    "windows": 0,
+                }
+            hit["score"] += 1.0 / (rrf_k + rank + 1)
+            hit["similarity"] = max(hit["similarity"], sim)
+            hit["windows"] += 1
+    return sorted(merged.values(), key=lambda h: h["score"], reverse=True)
+
+
+def mmr(hits: List[Dict[str, Any]], k: int, lambda_mult: float = 0.7) -> List[Dict[str, Any]]:
+    """
+    MMR 多样性筛选：每次选 λ·相关度 - (1-λ)·与已选结果的最大相似度 最高的一条
+    没有向量时退化为按融合分数取前 k
+    """
+    if len(hits) <= k or any(h["embedding"] is None for h in hits):
+        return hits[:k]
+    emb = np.stack([h["embedding"] for h in hits])
+    emb = emb / np.maximum(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12)
+    rel = np.array([h["score"] for h in hits], dtype=np.float32)
+    rel = (rel - rel.min()) / max(rel.max() - rel.min(), 1e-12)
+    sim = emb @ emb.T
+
+    chosen = [0]
+    remaining = list(range(1, len(hits)))
+    while remaining and len(chosen) < k:
+        penalty = sim[np.ix_(remaining, chosen)].max(axis=1)
+        best = int(np.argmax(lambda_mult * rel[remaining] - (1 - lambda_mult) * penalty))
+        chosen.append(remaining.pop(best))
+    return [hits[i] for i in chosen]
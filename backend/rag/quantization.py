@@ -0,0 +1,64 @@
+# backend/rag/quantization.py
+# 向量压缩：Matryoshka 维度截断 + float16 / int8（逐向量 scale）量化
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+DTYPES = ("float32", "float16", "int8")
+
+
+def normalize(vecs) -> np.ndarray:
+    """按行 L2 归一化，返回 float32"""
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    return vecs / np.maximum(norms, 1e-12)
+
+
+def truncate(vecs, dim: Optional[int]) -> np.ndarray:
+    """
+    Matryoshka 截断：jina-embeddings-v3 的前 dim 维本身就是一个可用的低维向量，
+    截取后重新归一化即可（dim 为空或不小于原维度时只做归一化）
+    """
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    if dim and dim < vecs.shape[1]:
+        vecs = vecs[:, :dim]
+    return normalize(vecs)
+
+
+def quantize_int8(vecs) -> Tuple[np.ndarray, np.ndarray]:
+    """对称 int8 量化：每行一个 scale = max|x| / 127，返回 (codes int8, scales float32)"""
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    scales = np.abs(vecs).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(vecs / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize_int8(codes, scales) -> np.ndarray:
+    return np.asarray(codes, dtype=np.float32) * np.asarray(scales, dtype=np.float32)[:, None]
+
+
+def compress(vecs, dim: Optional[int] = None, dtype: str = "float16"):
+    """
+    截断 + 量化，返回 (矩阵, scales)；非 int8 时 scales 为 None。
+    输入先截断再归一化，量化后的向量与查询做内积即近似余弦相似度
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f"不支持的向量精度: {dtype}（可选 {', '.join(DTYPES)}）")
+    vecs = truncate(vecs, dim)
+    if dtype == "int8":
+        return quantize_int8(vecs)
+    return vecs.astype(dtype), None
+
+
+def bytes_per_vector(dim: int, dtype: str) -> int:
+    """单条向量的存储字节数（int8 额外 4 字节 scale）"""
+    return dim * np.dtype(dtype).itemsize + (4 if dtype == "int8" else 0)
+
+
+def embed_dim() -> Optional[int]:
+    """EMBED_DIM：嵌入截断维度，未设置或为 0 表示保留模型完整维度"""
+    dim = int(os.getenv("EMBED_DIM", "0"))
+    return dim or None
@@ -0,0 +1,166 @@
+# backend/rag/retrieval_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+
+def version_file() -> str:
+    """索引版本文件：build_rag_index.py 每次写入后更新"""
+    return os.getenv("RAG_INDEX_VERSION_FILE", "rag_store.version")
+
+
+def read_index_version(path: Optional[str] = None) -> str:
+    try:
+        with open(path or version_file(), encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return ""
+
+
+def bump_index_version(path: Optional[str] = None) -> str:
+    """写入新版本号（原子替换），返回新版本"""
+    path = path or version_file()
+    version = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(tmp, path)
+    return version
+
+
+class IndexVersionWatch:
+    """
+    索引版本号的节流读取：check_interval 秒内重复调用直接返回上次读到的版本。
+    检索缓存与进程内的 numpy / snapshot 向量库、BM25 索引共用同一个版本判断，
+    版本变化后缓存作废的同时这些索引也会重新打开，不会用旧索引的结果重新填满缓存
+    """
+
+    def __init__(self, check_interval: float = 5.0, version_path: Optional[str] = None):
+        self.check_interval = check_interval
+        self.version_path = version_path
+        self._lock = threading.Lock()
+        self.version = read_index_version(version_path)
+        self._checked = time.monotonic()
+
+    def current(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked >= self.check_interval:
+                self._checked = now
+                self.version = read_index_version(self.version_path)
+            return self.version
+
+
+_watch: Optional[IndexVersionWatch] = None
+_watch_lock = threading.Lock()
+
+
+def shared_watch() -> IndexVersionWatch:
+    """进程内共享的版本读取（RAG_VERSION_CHECK_INTERVAL 秒内最多读一次版本文件）"""
+    global _watch
+    with _watch_lock:
+        if _watch is None:
+            _watch = IndexVersionWatch(float(os.getenv("RAG_VERSION_CHECK_INTERVAL", "5")))
+        return _watch
+
+
+def index_version() -> str:
+    """进程内共享的当前索引版本"""
+    return shared_watch().current()
+
+
+def query_key(embeddings, n_results: int, extra: str = "", quant: float = 64.0) -> str:
+    """
+    查询向量量化到 1/quant 的网格后取 hash：
+    几乎相同的向量落在同一格子里，命中同一条缓存
+    """
+    q = np.round(np.asarray(embeddings, dtype=np.float32) * quant).astype(np.int16)
+    h = hashlib.sha1(q.tobytes())
+    h.update(f"|{q.shape}|{n_results}|{extra}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class RetrievalCache:
+    """
+    检索结果缓存：量化查询向量 + 检索参数 -> 检索结果（context 文本 / 命中列表等可 JSON 序列化的值）
+    - 条目带索引版本，watch.current() 变化（索引重建）后全部作废；
+      调用方把 index_version() 放进缓存键，版本切换的间隙里旧索引的结果也不会被新版本命中
+    - LRU 淘汰，总字节数不超过 max_bytes
+    watch 默认按 check_interval / version_path 新建；传入 shared_watch() 时与向量库、BM25 索引共用同一个版本判断
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024, check_interval: float = 5.0,
+                 version_path: Optional[str] = None, watch: Optional[IndexVersionWatch] = None):
+        self.max_bytes = max_bytes
+        self.watch = watch or IndexVersionWatch(check_interval, version_path)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (value, 字节数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.version = self.watch.current()
+        # 统计
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _size(key: str, value: Any) -> int:
+        raw = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        return len(key) + len(raw.encode("utf-8")) + 64
+
+    def _check_version(self):
+        version = self.watch.current()
+        if version != self.version:
+            self.version = version
+            self._data.clear()
+            self._bytes = 0
+            self.invalidations += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            self._check_version()
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, value: Any):
+        size = self._size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "index_version": self.version,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,218 @@
+# backend/rag/snapshot.py
+# 单文件索引快照：构建机导出一个文件，服务端直接 mmap 打开，无需拷贝 / 解析整个向量库目录
+
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from backend.rag.quantization import compress
+from backend.rag.vector_store import NumpyVectorStore, VectorMatrix
+
+MAGIC = b"RAGSNAP1"
+FORMAT_VERSION = 1
+ALIGN = 64            # 每个区段按 64 字节对齐，mmap 出的数组可直接参与计算
+CHECKSUM_BYTES = 32   # 文件末尾的 sha256
+
+
+def _align(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _pack_strings(values) -> Dict[str, np.ndarray]:
+    """字符串列表 -> 连续的 utf-8 字节 + (N+1,) 偏移"""
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    offsets[1:] = np.cumsum(np.fromiter((len(b) for b in encoded), dtype=np.uint64, count=len(encoded)))
+    return {"data": np.frombuffer(b"".join(encoded), dtype=np.uint8), "offsets": offsets}
+
+
+def write_snapshot(path: str, ids, embeddings, documents, metadatas,
+                   dim: Optional[int] = None, dtype: str = "float16",
+                   coarse_dim: Optional[int] = None, coarse_dtype: Optional[str] = None,
+                   index_version: str = "") -> Dict[str, Any]:
+    """
+    写入单文件快照，参数含义与 write_numpy_index 相同。文件布局：
+    MAGIC | 头部长度(uint64) | 头部 JSON | 按 64 字节对齐的各区段 | sha256（覆盖之前的全部字节）
+    区段：vectors / scales（精排），coarse.vectors / coarse.scales（粗排，可选），
+         ids / documents / metadatas 各自的 .data（utf-8）与 .offsets（uint64）
+    先写临时文件再原子替换，正在使用旧快照的进程不受影响。返回头部
+    """
+    sections: Dict[str, np.ndarray] = {}
+
+    def add_matrix(prefix, matrix_dim, matrix_dtype):
+        if len(embeddings):
+            vecs, scales = compress(embeddings, matrix_dim, matrix_dtype)
+        else:
+            vecs = np.zeros((0, matrix_dim or 0), dtype=matrix_dtype)
+            scales = np.zeros(0, np.float32) if matrix_dtype == "int8" else None
+        sections[prefix + "vectors"] = vecs
+        if scales is not None:
+            sections[prefix + "scales"] = scales
+        return {"dim": int(vecs.shape[1]), "dtype": matrix_dtype}
+
+    fine = add_matrix("", dim, dtype)
+    coarse = None
+    if coarse_dim or coarse_dtype:
+        coarse = add_matrix("coarse.", min(coarse_dim or 256, fine["dim"] or 256), coarse_dtype or "int8")
+    for name, values in (("ids", ids), ("documents", documents),
+                         ("metadatas", (json.dumps(m, ensure_ascii=False) for m in metadatas))):
+        for part, arr in _pack_strings(values).items():
+            sections[f"{name}.{part}"] = arr
+
+    layout, offset = {}, 0
+    for name, arr in sections.items():
+        offset = _align(offset)
+        layout[name] = {"offset": offset, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+        offset += arr.nbytes
+    header = {
+        "format": FORMAT_VERSION,
+        "count": len(ids),
+        "fine": fine,
+        "coarse": coarse,
+        "index_version": index_version,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sections": layout,
+    }
+    raw = json.dumps(header, ensure_ascii=False).encode("utf-8")
+
+    tmp = f"{path}.tmp"
+    digest = hashlib.sha256()
+    with open(tmp, "wb") as f:
+        def put(data):
+            f.write(data)
+            digest.update(data)
+
+        put(MAGIC + struct.pack("<Q", len(raw)) + raw)
+        start = len(MAGIC) + 8 + len(raw)
+        put(b"\0" * (_align(start) - start))
+        written = 0
+        for name, arr in sections.items():
+            put(b"\0" * (layout[name]["offset"] - written))
+            put(np.ascontiguousarray(arr).reshape(-1).view(np.uint8))
+            written = layout[name]["offset"] + arr.nbytes
+        f.write(digest.digest())
+    os.replace(tmp, path)
+    return header
+
+
+class PackedStrings:
+    """快照中的字符串列：按下标取时才解码，打开快照不需要逐条解析"""
+
+    def __init__(self, data: np.ndarray, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode(self, raw: bytes):
+        return raw.decode("utf-8")
+
+    def __getitem__(self, i: int):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self._decode(self.data[int(self.offsets[i]):int(self.offsets[i + 1])].tobytes())
+
+    def __iter__(self) -> Iterator:
+        for i in range(len(self)):
+            yield self[i]
+
+
+class PackedJSON(PackedStrings):
+    def _decode(self, raw: bytes):
+        return json.loads(raw)
+
+
+class Snapshot:
+    """只读打开快照文件：整个文件 mmap 一次，各区段是其上的数组视图"""
+
+    def __init__(self, path: str, verify: bool = False):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} 不是索引快照文件")
+            (length,) = struct.unpack("<Q", f.read(8))
+            self.header = json.loads(f.read(length))
+        if self.header.get("format") != FORMAT_VERSION:
+            raise ValueError(f"不支持的快照格式版本: {self.header.get('format')}")
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        self.data_start = _align(len(MAGIC) + 8 + length)
+        if verify:
+            self.verify()
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.buffer.shape[0])
+
+    def verify(self, block: int = 64 * 1024 * 1024):
+        """重新计算 sha256 并与文件末尾的值比对，不一致时抛 ValueError"""
+        digest = hashlib.sha256()
+        end = self.nbytes - CHECKSUM_BYTES
+        for start in range(0, end, block):
+            digest.update(self.buffer[start:min(start + block, end)])
+        if digest.digest() != self.buffer[end:].tobytes():
+            raise ValueError(f"快照校验失败（文件损坏或未传输完整）: {self.path}")
+
+    def array(self, name: str) -> Optional[np.ndarray]:
+        info = self.header["sections"].get(name)
+        if info is None:
+            return None
+        dtype = np.dtype(info["dtype"])
+        start = self.data_start + info["offset"]
+        size = int(np.prod(info["shape"], dtype=np.int64)) * dtype.itemsize
+        return self.buffer[start:start + size].view(dtype).reshape(info["shape"])
+
+    def strings(self, name: str, cls=PackedStrings) -> PackedStrings:
+        return cls(self.array(f"{name}.data"), self.array(f"{name}.offsets"))
+
+
+class SnapshotVectorStore(NumpyVectorStore):
+    """
+    从单文件快照提供检索，检索逻辑与 NumpyVectorStore 完全相同（含两阶段检索）。
+    打开时只读头部并建立 mmap 视图：向量按需换页，文档与元数据在命中时才解码，
+    id -> 行号的索引在第一次按 id 取文档时才建立，因此加载时间几乎与索引规模无关
+    """
+
+    backend = "snapshot"
+
+    def __init__(self, path: str, two_stage: bool = True, candidates: int = 100, verify: bool = False):
+        started = time.perf_counter()
+        self.path = path
+        self.snapshot = Snapshot(path, verify=verify)
+        self.meta = self.snapshot.header
+        self.dtype = self.meta["fine"]["dtype"]
+        self.fine = VectorMatrix.from_arrays(self.snapshot.array("vectors"), self.snapshot.array("scales"), self.dtype)
+        self.vectors, self.scales, self.dim = self.fine.vectors, self.fine.scales, self.fine.dim
+        self.coarse = None
+        coarse_meta = self.meta.get("coarse")
+        if two_stage and coarse_meta:
+            self.coarse = VectorMatrix.from_arrays(self.snapshot.array("coarse.vectors"),
+                                                   self.snapshot.array("coarse.scales"), coarse_meta["dtype"])
+        self.candidates = candidates
+        self.ids = self.snapshot.strings("ids")
+        self.documents = self.snapshot.strings("documents")
+        self.metadatas = self.snapshot.strings("metadatas", PackedJSON)
+        self._pos: Optional[Dict[str, int]] = None
+        self._pos_lock = threading.Lock()
+        self.load_seconds = time.perf_counter() - started
+
+    def get(self, ids: List[str]):
+        if self._pos is None:
+            with self._pos_lock:
+                if self._pos is None:
+                    self._pos = {cid: i for i, cid in enumerate(self.ids)}
+        return super().get(ids)
+
+    def stats(self):
+        out = super().stats()
+        out.update(snapshot_mb=round(self.snapshot.nbytes / 1024 / 1024, 1),
+                   load_ms=round(self.load_seconds * 1000, 2),
+                   created_at=self.meta.get("created_at"),
+                   index_version=self.meta.get("index_version"))
+        return out
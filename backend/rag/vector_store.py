@@ -0,0 +1,410 @@
+# backend/rag/vector_store.py
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from backend.rag.quantization import compress, dequantize_int8, truncate
+from backend.rag.retrieval_cache import index_version
+
+# 与 Chroma query 返回一致的结果结构：
+# {"ids": [[...]], "documents": [[...]], "metadatas": [[...]], "distances": [[...]]}
+QueryResult = Dict[str, List[List[Any]]]
+
+
+def _as_rows(vecs):
+    """numpy 矩阵 / 向量列表 -> list of list（Chroma 接口要求）"""
+    if vecs is None:
+        return None
+    return [v.tolist() if hasattr(v, "tolist") else list(v) for v in vecs]
+
+
+class ReadOnlyStoreError(PermissionError):
+    """对只读后端（numpy / snapshot，由构建脚本离线导出）调用了写入或删除"""
+
+
+class VectorStore(ABC):
+    """向量库接口：RAGQueryNode 只依赖这几个方法"""
+
+    backend = "base"
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results: int = 3, include_embeddings: bool = False) -> QueryResult:
+        """一次调用可带多条查询向量；include_embeddings=True 时额外返回命中文档的向量"""
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> Dict[str, List[Any]]:
+        """按 id 取文档与元数据：{"ids", "documents", "metadatas"}"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """库中的向量条数"""
+
+    @abstractmethod
+    def upsert(self, ids, documents, embeddings, metadatas):
+        """按 id 写入或覆盖；只读后端抛出 ReadOnlyStoreError"""
+
+    @abstractmethod
+    def delete(self, ids):
+        """按 id 删除；只读后端抛出 ReadOnlyStoreError"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "count": self.count()}
+
+
+class ChromaVectorStore(VectorStore):
+    """现有的 Chroma 持久化后端（HNSW，l2 距离）"""
+
+    backend = "chroma"
+
+    def __init__(self, path: str, collection: str = "medical_knowledge"):
+        import chromadb
+        self.path = path
+        self.client = chromadb.PersistentClient(path=path)
+        self.name = collection
+        self.collection = self.client.get_or_create_collection(collection)
+
+    def query(self, query_embeddings, n_results: int = 3, include_embeddings: bool = False) -> QueryResult:
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        return self.collection.query(query_embeddings=_as_rows(query_embeddings), n_results=n_results, include=include)
+
+    def get(self, ids):
+        return self.collection.get(ids=list(ids), include=["documents", "metadatas"])
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=_as_rows(embeddings), metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=list(ids))
+
+    def reset(self):
+        """删除并重建集合（全量重建前清掉旧嵌入配置的全部向量）"""
+        self.client.delete_collection(self.name)
+        self.collection = self.client.get_or_create_collection(self.name)
+
+
+class VectorMatrix:
+    """
+    一份 mmap 向量矩阵（及 int8 的 scale），NumpyVectorStore 的精排 / 粗排两级各用一份。
+    目录中的文件：vectors.{f32,f16,i8}.npy、scales.f32.npy（仅 int8），精度与维度记在 meta.json
+    """
+
+    FILES = {"float32": "vectors.f32.npy", "float16": "vectors.f16.npy", "int8": "vectors.i8.npy"}
+    BLOCK_ROWS = 8192
+
+    def __init__(self, path: str, dtype: str):
+        self.dtype = dtype
+        self.vectors = np.load(os.path.join(path, self.FILES[dtype]), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.f32.npy")) if dtype == "int8" else None
+        self.dim = int(self.vectors.shape[1])
+
+    @classmethod
+    def from_arrays(cls, vectors: np.ndarray, scales: Optional[np.ndarray], dtype: str) -> "VectorMatrix":
+        """直接包装已打开的数组（如快照文件中 mmap 出的区段）"""
+        matrix = cls.__new__(cls)
+        matrix.dtype, matrix.vectors, matrix.scales = dtype, vectors, scales
+        matrix.dim = int(vectors.shape[1])
+        return matrix
+
+    def __len__(self):
+        return int(self.vectors.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def rows(self, rows) -> np.ndarray:
+        """按行号取 float32 向量（int8 时反量化）"""
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block = dequantize_int8(block, self.scales[rows])
+        return block
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """(m, dim) 查询 -> (m, N) 余弦相似度，分块转成 float32 计算；int8 先算内积再乘 scale"""
+        out = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start in range(0, len(self), self.BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + self.BLOCK_ROWS], dtype=np.float32)
+            sims = queries @ block.T
+            if self.scales is not None:
+                sims *= self.scales[start:start + block.shape[0]]
+            out[:, start:start + block.shape[0]] = sims
+        return out
+
+    @classmethod
+    def write(cls, out_dir: str, embeddings, dim: Optional[int], dtype: str) -> int:
+        """截断 / 量化后写入 out_dir，返回实际维度"""
+        os.makedirs(out_dir, exist_ok=True)
+        if len(embeddings):
+            vecs, scales = compress(embeddings, dim, dtype)
+        else:
+            vecs, scales = np.zeros((0, dim or 0), dtype=dtype), (np.zeros(0, np.float32) if dtype == "int8" else None)
+        # 清掉其他精度的旧文件，目录里只留当前这一份
+        for name in list(cls.FILES.values()) + ["scales.f32.npy"]:
+            if os.path.exists(os.path.join(out_dir, name)):
+                os.remove(os.path.join(out_dir, name))
+        np.save(os.path.join(out_dir, cls.FILES[dtype]), vecs)
+        if scales is not None:
+            np.save(os.path.join(out_dir, "scales.f32.npy"), scales)
+        return int(vecs.shape[1])
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """一行分数中最高的 k 个下标，按分数降序"""
+    top = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+    return top[np.argsort(-scores[top])]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    进程内检索：向量矩阵以 mmap 方式打开，按块做矩阵乘法。
+    多个 worker 进程打开同一目录时共享操作系统的页缓存。
+    path 下的 CURRENT 指向当前版本子目录（见 write_numpy_index），没有 CURRENT 时为原有的平铺布局。
+    版本目录结构：
+    - vectors.{f32,f16,i8}.npy  (N, dim)，已归一化，精度见 meta["dtype"]
+    - scales.f32.npy            (N,) int8 的逐向量 scale
+    - coarse/                   可选的粗排矩阵（截断维度 + 低精度），同样的文件布局
+    - records.jsonl             每行 {"id", "document", "metadata"}
+    - meta.json                 {"count", "dim", "dtype", "coarse": {"dim", "dtype"} | null}
+    存在粗排矩阵且 two_stage 开启时两阶段检索：先在粗排矩阵上全量打分取 candidates 条，
+    再只对这些行用精排矩阵重新打分取前 k；否则直接在精排矩阵上精确检索。
+    查询向量维度高于索引时按 Matryoshka 方式截断到索引维度。
+    距离与 Chroma 默认的 l2 一致：对归一化向量 d = 2 - 2·cos
+    """
+
+    backend = "numpy"
+    VECTOR_FILES = VectorMatrix.FILES
+
+    def __init__(self, path: str, two_stage: bool = True, candidates: int = 100):
+        self.path = path
+        path = numpy_index_dir(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.dtype = self.meta.get("dtype", "float16")
+        self.fine = VectorMatrix(path, self.dtype)
+        self.vectors, self.scales, self.dim = self.fine.vectors, self.fine.scales, self.fine.dim
+        self.coarse = None
+        coarse_meta = self.meta.get("coarse")
+        if two_stage and coarse_meta:
+            self.coarse = VectorMatrix(os.path.join(path, "coarse"), coarse_meta["dtype"])
+        self.candidates = candidates
+        self.ids, self.documents, self.metadatas = [], [], []
+        with open(os.path.join(path, "records.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                self.ids.append(rec["id"])
+                self.documents.append(rec["document"])
+                self.metadatas.append(rec["metadata"])
+        self._pos = {cid: i for i, cid in enumerate(self.ids)}
+
+    def embeddings(self, rows) -> np.ndarray:
+        """按行号取精排精度的 float32 向量"""
+        return self.fine.rows(rows)
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """(m, dim) 查询 -> (m, N) 精排矩阵上的余弦相似度"""
+        return self.fine.scores(queries)
+
+    def search(self, queries: np.ndarray, k: int):
+        """返回每条查询的 (行号, 相似度)，行号按相似度降序"""
+        out = []
+        if self.coarse is None or self.candidates <= k:
+            for row in self.scores(queries):
+                top = _top(row, k)
+                out.append((top, row[top]))
+            return out
+
+        # 阶段一：粗排矩阵全量打分取候选；阶段二：只取候选行的精排向量重新打分
+        coarse_q = truncate(queries, self.coarse.dim)
+        for q, row in zip(queries, self.coarse.scores(coarse_q)):
+            cand = np.sort(_top(row, self.candidates))  # 按行号顺序读 mmap，访问更连续
+            sims = self.fine.rows(cand) @ q
+            order = _top(sims, k)
+            out.append((cand[order], sims[order]))
+        return out
+
+    def query(self, query_embeddings, n_results: int = 3, include_embeddings: bool = False) -> QueryResult:
+        queries = truncate(query_embeddings, self.dim)
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if include_embeddings:
+            result["embeddings"] = []
+        if not len(self.ids):
+            for key in result:
+                result[key] = [[] for _ in range(len(queries))]
+            return result
+
+        for top, sims in self.search(queries, min(n_results, len(self.ids))):
+            result["ids"].append([self.ids[i] for i in top])
+            result["documents"].append([self.documents[i] for i in top])
+            result["metadatas"].append([self.metadatas[i] for i in top])
+            result["distances"].append([float(2.0 - 2.0 * s) for s in sims])
+            if include_embeddings:
+                result["embeddings"].append(self.embeddings(top))
+        return result
+
+    def get(self, ids):
+        pos = [self._pos[i] for i in ids if i in self._pos]
+        return {
+            "ids": [self.ids[p] for p in pos],
+            "documents": [self.documents[p] for p in pos],
+            "metadatas": [self.metadatas[p] for p in pos],
+        }
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        raise ReadOnlyStoreError(f"{self.backend} 后端只读，请重新导出索引")
+
+    def delete(self, ids):
+        raise ReadOnlyStoreError(f"{self.backend} 后端只读，请重新导出索引")
+
+    def stats(self):
+        out = {"backend": self.backend, "count": self.count(), "dim": self.dim, "dtype": self.dtype,
+               "vector_mb": round(self.fine.nbytes / 1024 / 1024, 1)}
+        if self.coarse is not None:
+            out.update(coarse_dim=self.coarse.dim, coarse_dtype=self.coarse.dtype, candidates=self.candidates,
+                       coarse_mb=round(self.coarse.nbytes / 1024 / 1024, 1))
+        return out
+
+
+INDEX_POINTER = "CURRENT"
+
+
+def numpy_index_dir(path: str) -> str:
+    """CURRENT 指向的版本子目录；没有 CURRENT 时为原有的平铺布局（path 本身）"""
+    try:
+        with open(os.path.join(path, INDEX_POINTER), encoding="utf-8") as f:
+            return os.path.join(path, f.read().strip())
+    except FileNotFoundError:
+        return path
+
+
+def write_numpy_index(out_dir: str, ids, embeddings, documents, metadatas,
+                      dim: Optional[int] = None, dtype: str = "float16",
+                      coarse_dim: Optional[int] = None, coarse_dtype: Optional[str] = None):
+    """
+    把 (ids, 向量, 文档, 元数据) 写成 NumpyVectorStore 可直接打开的目录。
+    dim 为 Matryoshka 截断维度（默认保留原维度），dtype 为 float32 / float16 / int8；
+    给出 coarse_dim 或 coarse_dtype 时额外写一份两阶段检索用的粗排矩阵（默认 256 维 int8）。
+    与快照相同，不原地覆盖：先写到 out_dir 下的临时目录，改名为新的版本目录后原子替换 CURRENT。
+    其他进程仍 mmap 着的上一版本保留到下一次写入，更早的版本删除
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    previous = numpy_index_dir(out_dir)
+    name = f"gen-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    tmp = os.path.join(out_dir, f".{name}.tmp")
+    os.makedirs(tmp)
+    fine_dim = VectorMatrix.write(tmp, embeddings, dim, dtype)
+    coarse = None
+    if coarse_dim or coarse_dtype:
+        coarse_dtype = coarse_dtype or "int8"
+        coarse_dim = VectorMatrix.write(os.path.join(tmp, "coarse"), embeddings,
+                                        min(coarse_dim or 256, fine_dim or 256), coarse_dtype)
+        coarse = {"dim": coarse_dim, "dtype": coarse_dtype}
+    with open(os.path.join(tmp, "records.jsonl"), "w", encoding="utf-8") as f:
+        for cid, doc, meta in zip(ids, documents, metadatas):
+            f.write(json.dumps({"id": cid, "document": doc, "metadata": meta}, ensure_ascii=False) + "\n")
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": len(ids), "dim": fine_dim, "dtype": dtype, "coarse": coarse}, f)
+    os.replace(tmp, os.path.join(out_dir, name))
+    pointer = os.path.join(out_dir, INDEX_POINTER + ".tmp")
+    with open(pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(pointer, os.path.join(out_dir, INDEX_POINTER))
+    _prune_generations(out_dir, keep={name, os.path.basename(previous)}, keep_flat=previous == out_dir)
+
+
+def _prune_generations(out_dir: str, keep, keep_flat: bool):
+    """删除更早的版本目录与中断留下的临时目录；上一版本是平铺布局时保留平铺的文件，否则一并删除"""
+    flat = set(VectorMatrix.FILES.values()) | {"scales.f32.npy", "coarse", "records.jsonl", "meta.json"}
+    for entry in os.listdir(out_dir):
+        stale = (entry.startswith(("gen-", ".gen-")) and entry not in keep) or (entry in flat and not keep_flat)
+        if not stale:
+            continue
+        target = os.path.join(out_dir, entry)
+        try:
+            if os.path.isdir(target):
+                shutil.rmtree(target)
+            else:
+                os.remove(target)
+        except OSError:
+            pass  # 仍被占用（如 Windows 上的 mmap）时留到下一次写入再删
+
+
+def iter_chroma(collection, batch_size: int = 1000, include=("embeddings", "documents", "metadatas")):
+    """分页读出 Chroma 集合中的全部记录"""
+    offset = 0
+    while True:
+        page = collection.get(include=list(include), limit=batch_size, offset=offset)
+        if not page["ids"]:
+            return
+        yield page
+        offset += len(page["ids"])
+
+
+_stores: Dict[tuple, VectorStore] = {}
+_store_versions: Dict[tuple, str] = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(backend: Optional[str] = None, path: Optional[str] = None) -> VectorStore:
+    """
+    按环境变量选择后端（进程内每个 (后端, 路径) 只打开一次）：
+    VECTOR_BACKEND=chroma（默认，路径 CHROMA_PERSIST）| numpy（路径 NUMPY_INDEX_DIR）
+                  | snapshot（单文件快照，路径 RAG_SNAPSHOT；RAG_SNAPSHOT_VERIFY=1 时打开前校验 checksum）
+    numpy 后端索引带粗排矩阵时默认两阶段检索：VECTOR_TWO_STAGE=0 关闭，VECTOR_CANDIDATES 为候选数。
+    numpy / snapshot 是打开时 mmap 的只读文件，索引版本变化（重建或导入快照）后重新打开；
+    正在使用旧实例的查询不受影响
+    """
+    backend = backend or os.getenv("VECTOR_BACKEND", "chroma")
+    if path is None:
+        if backend == "numpy":
+            path = os.getenv("NUMPY_INDEX_DIR", "rag_store_np")
+        elif backend == "snapshot":
+            path = os.getenv("RAG_SNAPSHOT", "rag_store.snap")
+        else:
+            path = os.getenv("CHROMA_PERSIST", "rag_store")
+    version = index_version() if backend in ("numpy", "snapshot") else None
+    with _stores_lock:
+        key = (backend, path)
+        if key in _stores and _store_versions.get(key) != version:
+            del _stores[key]
+        if key not in _stores:
+            _store_versions[key] = version
+            if backend == "numpy":
+                _stores[key] = NumpyVectorStore(
+                    path,
+                    two_stage=os.getenv("VECTOR_TWO_STAGE", "1") != "0",
+                    candidates=int(os.getenv("VECTOR_CANDIDATES", "100")),
+                )
+            elif backend == "snapshot":
+                from backend.rag.snapshot import SnapshotVectorStore
+                _stores[key] = SnapshotVectorStore(
+                    path,
+                    two_stage=os.getenv("VECTOR_TWO_STAGE", "1") != "0",
+                    candidates=int(os.getenv("VECTOR_CANDIDATES", "100")),
+                    verify=os.getenv("RAG_SNAPSHOT_VERIFY", "0") == "1",
+                )
+            elif backend == "chroma":
+                _stores[key] = ChromaVectorStore(path)
+            else:
+                raise ValueError(f"未知向量库后端: {backend}")
+        return _stores[key]
+
+
+def open_store_count() -> int:
+    with _stores_lock:
+        return len(_stores)
@@ -0,0 +1,170 @@
+# backend/serving/inference_executor.py
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from backend.serving import metrics
+
+
+class QueueFullError(Exception):
+    """排队请求数已达上限（-> 429）"""
+
+
+class ExecutorUnavailableError(Exception):
+    """执行器已关闭，或请求超过截止时间（-> 503）"""
+
+
+class InferenceLane:
+    """
+    单个模式的推理通道：
+    - 固定大小的线程池，只跑图推理，不占用 Starlette 的线程池
+    - max_pending 限制 "运行中 + 排队中" 的请求数，超出直接拒绝
+    - deadline 秒内未完成则返回超时（仍在排队的请求会被取消）
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int, deadline: float):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.deadline = deadline
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"infer-{name}")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._closed = False
+        # 统计
+        self.accepted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.completed = 0
+        self.total_latency = 0.0
+
+    def _acquire(self):
+        with self._lock:
+            if self._closed:
+                raise ExecutorUnavailableError(f"{self.name} 推理通道已关闭")
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} 推理队列已满（{self._pending}/{self.max_pending}）")
+            self._pending += 1
+            self.accepted += 1
+
+    def _release(self, started: float, ok: bool):
+        with self._lock:
+            self._pending -= 1
+            if ok:
+                self.completed += 1
+                self.total_latency += time.perf_counter() - started
+            else:
+                self.failed += 1
+
+    def _submit(self, fn: Callable[..., Any], *args, **kwargs):
+        self._acquire()
+        started = time.perf_counter()
+
+        def task():
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self._release(started, ok)
+
+        try:
+            cfut = self._pool.submit(task)
+        except RuntimeError:
+            # 线程池已 shutdown
+            self._release(started, False)
+            raise ExecutorUnavailableError(f"{self.name} 推理通道已关闭")
+
+        return cfut, started
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> "asyncio.Future":
+        """
+        准入检查后提交到线程池，返回 asyncio Future（不等待结果，也不施加截止时间）。
+        截止时间由调用方负责：超时后通知 fn 停止，并调用 record_timeout 计数
+        """
+        cfut, _ = self._submit(fn, *args, **kwargs)
+        return asyncio.wrap_future(cfut)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在本通道的线程池中执行 fn，带准入控制和截止时间"""
+        cfut, started = self._submit(fn, *args, **kwargs)
+        fut = asyncio.wrap_future(cfut)
+        try:
+            # shield：超时只放弃等待，不强行打断正在执行的推理线程
+            return await asyncio.wait_for(asyncio.shield(fut), timeout=self.deadline)
+        except asyncio.TimeoutError:
+            # 若还在排队则直接取消，避免空跑
+            if cfut.cancel():
+                self._release(started, False)
+            self.record_timeout()
+            raise ExecutorUnavailableError(f"{self.name} 推理超过截止时间 {self.deadline}s")
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            done = self.completed
+            return {
+                "max_workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "deadline_s": self.deadline,
+                "pending": self._pending,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "failed": self.failed,
+                "completed": done,
+                "avg_latency_s": round(self.total_latency / done, 4) if done else 0.0,
+            }
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+
+def _lane_from_env(name: str, workers: int, pending: int, deadline: float) -> InferenceLane:
+    """按环境变量构建通道，例如 INFER_REALTIME_WORKERS / INFER_REALTIME_QUEUE / INFER_REALTIME_DEADLINE"""
+    key = name.upper()
+    return InferenceLane(
+        name,
+        max_workers=int(os.getenv(f"INFER_{key}_WORKERS", workers)),
+        max_pending=int(os.getenv(f"INFER_{key}_QUEUE", pending)),
+        deadline=float(os.getenv(f"INFER_{key}_DEADLINE", deadline)),
+    )
+
+
+class InferenceExecutor:
+    """
+    按模式拆分的推理执行器：
+    realtime 与 summary 各自独立排队，长时间的 final_report 不会拖住实时建议
+    """
+
+    def __init__(self):
+        self.lanes = {
+            "realtime": _lane_from_env("realtime", workers=2, pending=8, deadline=30.0),
+            "summary": _lane_from_env("summary", workers=1, pending=4, deadline=300.0),
+        }
+        metrics.register("inference_executor", self.stats)
+
+    def lane(self, name: str) -> InferenceLane:
+        return self.lanes[name]
+
+    async def run(self, lane: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await self.lanes[lane].run(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self, wait: bool = False):
+        for lane in self.lanes.values():
+            lane.shutdown(wait=wait)
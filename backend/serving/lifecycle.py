@@ -0,0 +1,127 @@
+# backend/serving/lifecycle.py
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ModelLoader:
+    """
+    后台加载模型，让 API 进程先绑定端口：
+    1. 并行：初始化数据库 / 嵌入模型 / 向量库 / LLM
+    2. 用加载好的节点构建两个 Agent
+    3. 用一次假推理预热
+    各阶段耗时记录在 phases 中，全部完成后 ready 置位。
+    加载失败（模型下载超时、显存暂时不足等）时等待 retry_delay 秒（每次翻倍）后重试，
+    最多 max_attempts 次（MODEL_LOAD_ATTEMPTS / MODEL_LOAD_RETRY_DELAY）；已构建好的节点由注册表保留，不重复加载。
+    全部失败后 state 为 failed，再次调用 start() 重新开始一轮
+    """
+
+    WARMUP_TEXT = "患者发烧两天并有轻微咳嗽。"
+
+    def __init__(self, registry=None, max_attempts=None, retry_delay=None):
+        from backend.nodes.registry import get_registry
+        self.registry = registry or get_registry()
+        self.max_attempts = max(1, max_attempts or int(os.getenv("MODEL_LOAD_ATTEMPTS", "3")))
+        self.retry_delay = retry_delay if retry_delay is not None else float(os.getenv("MODEL_LOAD_RETRY_DELAY", "5"))
+        self.state = "pending"
+        self.error = None
+        self.attempts = 0
+        self.phases = {}
+        self.nodes = {}
+        self.realtime_agent = None
+        self.summary_agent = None
+        self.summary_streamer = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self):
+        """启动后台加载；上一轮重试全部失败时重新开始一轮，加载中或已就绪时不做任何事"""
+        with self._start_lock:
+            if self._thread is not None and (self._thread.is_alive() or self.state != "failed"):
+                return
+            self.state = "loading"
+            self._thread = threading.Thread(target=self._load, name="model-loader", daemon=True)
+            self._thread.start()
+
+    def wait(self, timeout=None) -> bool:
+        return self._ready.wait(timeout)
+
+    def _timed(self, phase, fn):
+        started = time.perf_counter()
+        result = fn()
+        self.phases[phase] = round(time.perf_counter() - started, 3)
+        print(f"[startup] {phase} 完成，用时 {self.phases[phase]}s")
+        return result
+
+    # 模块在线程内导入，避免 import main 时就拉起 torch / chromadb
+    @staticmethod
+    def _init_db():
+        from backend.database.init_db import init_db
+        init_db()
+
+    def _build_graphs(self):
+        from backend.ASR.medical_graphs import (
+            build_realtime_agent, build_summary_agent, build_summary_streamer,
+        )
+        self.realtime_agent = build_realtime_agent(self.nodes)
+        self.summary_agent = build_summary_agent(self.nodes)
+        self.summary_streamer = build_summary_streamer(self.nodes)
+
+    def _warmup(self):
+        """跑一次实时建议全链路，并预先 prefill 报告模式的指令前缀"""
+        self.realtime_agent.invoke({"texts": [self.WARMUP_TEXT], "mode": "realtime_advice"})
+        llm = self.nodes["llm"]
+        cache = llm.prefix_cache()
+        if cache is not None:
+            cache.prepare(*llm.prompt_parts("final_report", self.WARMUP_TEXT, ""))
+
+    def _load(self):
+        delay = self.retry_delay
+        for attempt in range(1, self.max_attempts + 1):
+            self.attempts = attempt
+            if self._load_once():
+                return
+            if attempt < self.max_attempts:
+                print(f"[startup] {delay:g}s 后重试（第 {attempt + 1}/{self.max_attempts} 次）")
+                time.sleep(delay)
+                delay *= 2
+        self.state = "failed"
+
+    def _load_once(self) -> bool:
+        self.state = "loading"
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=4, thread_name_prefix="loader") as pool:
+                futures = {
+                    "init_db": pool.submit(self._timed, "init_db", self._init_db),
+                    "embed": pool.submit(self._timed, "embedding_model", self.registry.embedder),
+                    "rag": pool.submit(self._timed, "vector_store", self.registry.rag),
+                    "llm": pool.submit(self._timed, "llm", self.registry.llm),
+                }
+                results = {name: fut.result() for name, fut in futures.items()}
+            self.phases["parallel_load"] = round(time.perf_counter() - started, 3)
+            self.nodes = {k: results[k] for k in ("embed", "rag", "llm")}
+
+            self._timed("build_graphs", self._build_graphs)
+            self._timed("warmup", self._warmup)
+            self.phases["total"] = round(time.perf_counter() - started, 3)
+            self.state = "ready"
+            self.error = None
+            self._ready.set()
+            print(f"[startup] 模型全部就绪，总用时 {self.phases['total']}s")
+            return True
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[startup] 模型加载失败（第 {self.attempts}/{self.max_attempts} 次）: {self.error}")
+            return False
+
+    def stats(self):
+        return {"state": self.state, "attempts": self.attempts, "max_attempts": self.max_attempts,
+                "phases": dict(self.phases), "error": self.error}
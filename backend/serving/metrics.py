@@ -0,0 +1,63 @@
+# backend/serving/metrics.py
+
+import threading
+from typing import Any, Callable, Dict
+
+# 各组件注册的指标回调：name -> 返回 dict 的函数
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, provider: Callable[[], Dict[str, Any]]):
+    """注册一个指标提供者，同名会覆盖"""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot() -> Dict[str, Any]:
+    """汇总所有组件的当前指标（供 /metrics 使用）"""
+    with _lock:
+        items = list(_providers.items())
+    out = {}
+    for name, provider in items:
+        try:
+            out[name] = provider()
+        except Exception as e:
+            out[name] = {"error": str(e)}
+    return out
+
+
+class LatencyStats:
+    """简单的耗时统计：次数 / 平均 / 最近一次 / 最大 / 近期 p50、p99"""
+
+    def __init__(self, window: int = 512):
+        self.window = window
+        self._recent = []
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            self.max = max(self.max, seconds)
+            self._recent.append(seconds)
+            if len(self._recent) > self.window:
+                del self._recent[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))], 4) if recent else 0.0
+            return {
+                "count": self.count,
+                "avg_s": round(self.total / self.count, 4) if self.count else 0.0,
+                "last_s": round(self.last, 4),
+                "max_s": round(self.max, 4),
+                "p50_s": pick(0.5),
+                "p99_s": pick(0.99),
+            }
@@ -0,0 +1,151 @@
+# backend/serving/result_cache.py
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+def result_key(model_name: str, prompt: str, gen_kwargs: Dict[str, Any]) -> str:
+    """(模型, 完整 prompt, 生成参数) -> sha256"""
+    raw = json.dumps({"model": model_name, "prompt": prompt, "gen": gen_kwargs},
+                     ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryResultBackend:
+    """进程内 LRU + TTL；每条为 (输出, 原始生成耗时, 生成报告)"""
+
+    def __init__(self, ttl: int, max_items: int):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._data: "OrderedDict[str, Tuple[float, str, float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, output, gen_time, generation = item
+            if expires <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return output, gen_time, generation
+
+    def set(self, key: str, output: str, gen_time: float, generation: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, output, gen_time, dict(generation or {}))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class RedisResultBackend:
+    """Redis：{prefix}llm_result:{key} -> JSON，依赖 Redis 自身的过期"""
+
+    def __init__(self, client, prefix: str, ttl: int):
+        self.r = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Tuple[str, float, Dict[str, Any]]]:
+        raw = self.r.get(f"{self.prefix}llm_result:{key}")
+        if raw is None:
+            return None
+        item = json.loads(raw)
+        return item["output"], item["gen_time"], item.get("generation") or {}
+
+    def set(self, key: str, output: str, gen_time: float, generation: Optional[Dict[str, Any]] = None):
+        self.r.set(f"{self.prefix}llm_result:{key}",
+                   json.dumps({"output": output, "gen_time": gen_time, "generation": generation or {}},
+                              ensure_ascii=False),
+                   ex=self.ttl)
+
+    def size(self) -> int:
+        return -1
+
+
+class ResultCache:
+    """
+    LLM 结果精确匹配缓存：同样的 prompt + 生成参数直接返回上次的输出，以及生成它时的生成报告
+    统计命中率，以及命中所省下的生成时间（按原始生成耗时累计）
+    """
+
+    def __init__(self, backend, modes):
+        self.backend = backend
+        self.modes = set(modes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.errors = 0
+
+    def enabled_for(self, mode: str) -> bool:
+        return mode in self.modes
+
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """命中时返回 (输出, 生成报告)"""
+        try:
+            item = self.backend.get(key)
+        except Exception:
+            # 缓存不可用时退化为直接生成
+            with self._lock:
+                self.errors += 1
+            item = None
+        with self._lock:
+            if item is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += item[1]
+        return item[0], item[2]
+
+    def put(self, key: str, output: str, gen_time: float, generation: Optional[Dict[str, Any]] = None):
+        try:
+            self.backend.set(key, output, gen_time, generation)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "modes": sorted(self.modes),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "saved_generation_s": round(self.saved_seconds, 3),
+                "errors": self.errors,
+                "size": self.backend.size(),
+            }
+
+
+def make_result_cache() -> Optional[ResultCache]:
+    """
+    按环境变量构建：RESULT_CACHE_BACKEND=memory|redis|off，RESULT_CACHE_TTL 秒，
+    RESULT_CACHE_MAX_ITEMS（仅内存），RESULT_CACHE_MODES（逗号分隔，默认只缓存实时建议）
+    """
+    backend_name = os.getenv("RESULT_CACHE_BACKEND", "memory")
+    if backend_name == "off":
+        return None
+    ttl = int(os.getenv("RESULT_CACHE_TTL", "600"))
+    if backend_name == "redis":
+        import redis
+        client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        backend = RedisResultBackend(client, os.getenv("APP_REDIS_PREFIX", "app:"), ttl)
+    else:
+        backend = MemoryResultBackend(ttl, int(os.getenv("RESULT_CACHE_MAX_ITEMS", "2048")))
+    modes = [m.strip() for m in os.getenv("RESULT_CACHE_MODES", "realtime_advice").split(",") if m.strip()]
+    return ResultCache(backend, modes)
@@ -0,0 +1,170 @@
+# backend/serving/session_store.py
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+def _as_list(vec):
+    """numpy 向量 -> list，便于序列化"""
+    return vec.tolist() if hasattr(vec, "tolist") else list(vec)
+
+
+class InMemorySessionStore:
+    """
+    进程内问诊会话状态：session_id -> 已累积的话语、每句的向量、每次检索到的上下文
+    每次访问刷新过期时间，超过 ttl 秒未访问的会话被清除
+    _lock 只保护会话表本身，会话内容的读写由各会话自己的锁串行化，不同会话互不阻塞
+    """
+
+    FIELDS = ("utterances", "embeddings", "contexts")
+
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for sid in [k for k, v in self._data.items() if v["expires"] <= now]:
+            del self._data[sid]
+
+    def _session(self, session_id: str, create: bool) -> Optional[Dict[str, Any]]:
+        """取出会话并刷新过期时间；已过期视为不存在，create=True 时新建"""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            sess = self._data.get(session_id)
+            if sess is not None and sess["expires"] <= now:
+                del self._data[session_id]
+                sess = None
+            if sess is None and create:
+                sess = self._data[session_id] = {
+                    "utterances": [], "embeddings": [], "contexts": [], "lock": threading.Lock(),
+                }
+            if sess is not None:
+                sess["expires"] = now + self.ttl
+            return sess
+
+    def get(self, session_id: str) -> Optional[Dict[str, List]]:
+        sess = self._session(session_id, create=False)
+        if sess is None:
+            return None
+        with sess["lock"]:
+            return {k: list(sess[k]) for k in self.FIELDS}
+
+    def append(self, session_id: str, utterances: List[str], embeddings=None, context: Optional[str] = None):
+        sess = self._session(session_id, create=True)
+        with sess["lock"]:
+            sess["utterances"].extend(utterances)
+            sess["embeddings"].extend(_as_list(e) for e in (embeddings if embeddings is not None else []))
+            if context:
+                sess["contexts"].append(context)
+
+    def append_utterances(self, session_id: str, utterances: List[str]) -> List[str]:
+        """追加话语并返回追加后的全部话语，两步在同一把会话锁内完成，并发请求不会丢句或读到半截状态"""
+        sess = self._session(session_id, create=True)
+        with sess["lock"]:
+            sess["utterances"].extend(utterances)
+            return list(sess["utterances"])
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._data.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "sessions": len(self._data), "ttl_s": self.ttl}
+
+
+class RedisSessionStore:
+    """
+    Redis 版会话状态：每个字段一个 list（只追加），整体共享同一个过期时间
+    key 形如 {prefix}session:{session_id}:utterances
+    """
+
+    FIELDS = ("utterances", "embeddings", "contexts")
+
+    def __init__(self, client, prefix: str = "app:", ttl: int = 3600):
+        self.r = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, session_id: str, field: str) -> str:
+        return f"{self.prefix}session:{session_id}:{field}"
+
+    def get(self, session_id: str) -> Optional[Dict[str, List]]:
+        with self.r.pipeline() as pipe:
+            for field in self.FIELDS:
+                pipe.lrange(self._key(session_id, field), 0, -1)
+            for field in self.FIELDS:
+                pipe.expire(self._key(session_id, field), self.ttl)
+            res = pipe.execute()
+        utterances, embeddings, contexts = res[:3]
+        if not utterances and not contexts:
+            return None
+        return {
+            "utterances": list(utterances),
+            "embeddings": [json.loads(e) for e in embeddings],
+            "contexts": list(contexts),
+        }
+
+    def append(self, session_id: str, utterances: List[str], embeddings=None, context: Optional[str] = None):
+        with self.r.pipeline(transaction=True) as pipe:
+            if utterances:
+                pipe.rpush(self._key(session_id, "utterances"), *utterances)
+            if embeddings is not None and len(embeddings):
+                pipe.rpush(self._key(session_id, "embeddings"), *[json.dumps(_as_list(e)) for e in embeddings])
+            if context:
+                pipe.rpush(self._key(session_id, "contexts"), context)
+            for field in self.FIELDS:
+                pipe.expire(self._key(session_id, field), self.ttl)
+            pipe.execute()
+
+    def append_utterances(self, session_id: str, utterances: List[str]) -> List[str]:
+        """RPUSH 与 LRANGE 放在同一个 MULTI/EXEC 里：多个 worker 同时追加时各自看到的话语序列都一致且不丢句"""
+        key = self._key(session_id, "utterances")
+        with self.r.pipeline(transaction=True) as pipe:
+            pipe.rpush(key, *utterances)
+            pipe.lrange(key, 0, -1)
+            for field in self.FIELDS:
+                pipe.expire(self._key(session_id, field), self.ttl)
+            res = pipe.execute()
+        return list(res[1])
+
+    def delete(self, session_id: str):
+        self.r.delete(*[self._key(session_id, f) for f in self.FIELDS])
+
+    def stats(self):
+        return {"backend": "redis", "prefix": self.prefix, "ttl_s": self.ttl}
+
+
+def make_session_store():
+    """按环境变量选择后端：SESSION_BACKEND=memory|redis，SESSION_TTL 秒"""
+    ttl = int(os.getenv("SESSION_TTL", "3600"))
+    if os.getenv("SESSION_BACKEND", "memory") == "redis":
+        import redis
+        client = redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), decode_responses=True)
+        return RedisSessionStore(client, prefix=os.getenv("APP_REDIS_PREFIX", "app:"), ttl=ttl)
+    return InMemorySessionStore(ttl=ttl)
+
+
+def window_transcript(utterances: List[str], last_n: int) -> str:
+    """实时建议只看最近几句对话"""
+    return "\n".join(utterances[-last_n:]) if last_n > 0 else "\n".join(utterances)
+
+
+def merge_contexts(contexts: List[str]) -> str:
+    """合并一个会话内多次检索的上下文，按行去重并保持首次出现顺序"""
+    seen, lines = set(), []
+    for ctx in contexts:
+        for line in (ctx or "").split("\n"):
+            if line and line not in seen:
+                seen.add(line)
+                lines.append(line)
+    return "\n".join(lines)
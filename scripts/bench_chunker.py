@@ -0,0 +1,114 @@
+# scripts/bench_chunker.py
+# 切块基准：原有按字符切块（chunk_text_chars）与按 token 切块（TokenChunker）在 huatuo 数据上的对比
+# 指标：吞吐（篇/s、块/s）、块的 token 数分布与超出模型长度的比例、文档开头插入一句后 chunk id 的保留率
+
+import sys
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from datasets import load_from_disk
+from datetime import datetime
+
+from backend.rag.chunker import TokenChunker, chunk_text_chars, stable_chunk_id
+from scripts.init_data import clean_batch, iter_arrow_batches
+
+
+def load_docs(data_dir, limit):
+    """与 init_data 相同的清洗规则，取百科 + 知识图谱共 limit 篇 (title, source_type, content_text)"""
+    docs = []
+    for src, name in (("ency", "huatuo_encyclopedia"), ("kg", "huatuo_knowledge_graph")):
+        split = load_from_disk(os.path.join(data_dir, name))["train"]
+        for table in iter_arrow_batches(split, 10000, limit - len(docs)):
+            rows = clean_batch(table, src, datetime.now()).select(["title", "source_type", "content_text"])
+            docs.extend(zip(*(rows.column(c).to_pylist() for c in rows.column_names)))
+        if len(docs) >= limit:
+            break
+    return docs[:limit]
+
+
+def run_char(texts):
+    return [chunk_text_chars(t) for t in texts]
+
+
+def run_token(chunker, texts, batch_size):
+    out = []
+    for i in range(0, len(texts), batch_size):
+        out.extend(chunker.chunk_many(texts[i:i + batch_size]))
+    return out
+
+
+def char_ids(docs, pieces):
+    """原有 id：标题 + 来源 + 块序号"""
+    import hashlib
+    ids = set()
+    for (title, src, _), chunks in zip(docs, pieces):
+        h = hashlib.md5(f"{title}_{src}".encode("utf-8")).hexdigest()[:8]
+        ids.update((f"{src}-{h}-{i}", c) for i, c in chunks)
+    return ids
+
+
+def token_ids(docs, pieces):
+    return {(stable_chunk_id(src, title, c), c) for (title, src, _), chunks in zip(docs, pieces) for _, c in chunks}
+
+
+def retained(before, after):
+    """插入前后 id 相同且正文相同的块占比：这些块增量构建时无需重新嵌入"""
+    return len(before & after) / max(len(before), 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按字符 / 按 token 切块对比")
+    parser.add_argument("--data-dir", default="data/huatuo")
+    parser.add_argument("--limit", type=int, default=20000, help="参与测试的文档数")
+    parser.add_argument("--model", default="jinaai/jina-embeddings-v3", help="分词器来源（嵌入模型）")
+    parser.add_argument("--chunk-tokens", type=int, default=320)
+    parser.add_argument("--overlap-tokens", type=int, default=48)
+    parser.add_argument("--batch-size", type=int, default=64, help="TokenChunker 每次分词的文档数")
+    parser.add_argument("--max-tokens", type=int, default=512, help="嵌入模型的输入上限（EMBED_ONNX 导出的 max_seq_length）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    chunker = TokenChunker(tokenizer, args.chunk_tokens, args.overlap_tokens)
+
+    docs = load_docs(args.data_dir, args.limit)
+    texts = [d[2] for d in docs]
+    print(f"文档 {len(docs)} 篇，平均 {np.mean([len(t) for t in texts]):.0f} 字；分词器 {args.model}（fast={tokenizer.is_fast}）")
+
+    results = {}
+    for name, fn in (("char", lambda: run_char(texts)),
+                     ("token", lambda: run_token(chunker, texts, args.batch_size))):
+        fn()  # 预热（分词器首次调用有初始化开销）
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            pieces = fn()
+            times.append(time.perf_counter() - t0)
+        results[name] = (pieces, min(times))
+
+    # 开头插入一句：模拟文档被编辑，看有多少块的 id 与正文保持不变
+    edited = [(title, src, "【编者按】本条目已根据最新指南更新。\n" + text) for title, src, text in docs]
+    edited_texts = [d[2] for d in edited]
+    id_fns = {"char": char_ids, "token": token_ids}
+    edited_pieces = {"char": run_char(edited_texts), "token": run_token(chunker, edited_texts, args.batch_size)}
+
+    print(f"{'切块方式':<8}{'用时s':>8}{'篇/s':>10}{'块数':>9}{'块/s':>10}"
+          f"{'tok p50':>9}{'tok p95':>9}{'tok max':>9}{'超长%':>8}{'id保留%':>9}")
+    for name, (pieces, elapsed) in results.items():
+        chunks = [c for doc in pieces for _, c in doc]
+        counts = chunker.token_counts(chunks)
+        over = float((counts > args.max_tokens).mean() * 100) if len(counts) else 0.0
+        keep = retained(id_fns[name](docs, pieces), id_fns[name](edited, edited_pieces[name])) * 100
+        print(f"{name:<10}{elapsed:>8.2f}{len(docs) / elapsed:>10.0f}{len(chunks):>9}{len(chunks) / elapsed:>10.0f}"
+              f"{np.percentile(counts, 50):>9.0f}{np.percentile(counts, 95):>9.0f}{counts.max():>9}"
+              f"{over:>8.2f}{keep:>9.1f}")
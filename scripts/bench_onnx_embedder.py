@@ -0,0 +1,111 @@
+# scripts/bench_onnx_embedder.py
+# ONNX（int8 / fp32）嵌入模型与 PyTorch 模型对比：
+# 1. 同一批文本的向量余弦一致性，以及在现有索引上 top-k 检索结果的重合度
+# 2. CPU 上的单条延迟（p50/p99）与批量吞吐
+
+import sys
+import os
+import time
+import argparse
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault("HUGGINGFACE_HUB_CACHE", ".cache/hf")
+
+from backend.nodes.onnx_embedder import OnnxEmbeddingEncoder
+from backend.rag.vector_store import get_vector_store
+
+SAMPLES = [
+    "发烧两天，咳嗽，是否需要使用抗生素？",
+    "患者自述头痛三天，伴有恶心，无呕吐。",
+    "儿童腹泻一周，大便稀水样，每日五六次。",
+    "高血压患者服用氨氯地平后出现脚踝水肿怎么办？",
+    "喉咙痛，吞咽时加重，扁桃体红肿。",
+]
+
+
+def load_texts(n):
+    """优先从向量库取真实 chunk，没有索引时用内置样例"""
+    try:
+        docs = get_vector_store("chroma").collection.get(limit=n, include=["documents"])["documents"]
+        if docs:
+            return docs
+    except Exception as e:
+        print(f"读取向量库失败，使用内置样例：{e}")
+    return (SAMPLES * (n // len(SAMPLES) + 1))[:n]
+
+
+def latency(model, texts, runs):
+    lat = []
+    for t in texts[:runs]:
+        t0 = time.perf_counter()
+        model.encode([t], normalize_embeddings=True)
+        lat.append(time.perf_counter() - t0)
+    lat = np.array(lat) * 1000
+    return np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+def throughput(model, texts, batch_size):
+    t0 = time.perf_counter()
+    model.encode(texts, normalize_embeddings=True, batch_size=batch_size)
+    return len(texts) / (time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX 嵌入模型一致性与性能检查")
+    parser.add_argument("--model", default="jinaai/jina-embeddings-v3")
+    parser.add_argument("--onnx-dir", default=os.getenv("EMBED_ONNX_DIR", ".cache/onnx/jina-embeddings-v3"))
+    parser.add_argument("--quant", default="int8,fp32", help="逗号分隔：int8 / fp32")
+    parser.add_argument("--texts", type=int, default=256)
+    parser.add_argument("--latency-runs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="平均余弦低于该值时返回非零退出码")
+    args = parser.parse_args()
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    texts = load_texts(args.texts)
+    print(f"样本 {len(texts)} 条")
+    ref_model = SentenceTransformer(args.model, trust_remote_code=True, device="cpu")
+    ref = ref_model.encode(texts, normalize_embeddings=True, batch_size=args.batch_size)
+
+    try:
+        store = get_vector_store()
+        ref_top = store.query(ref, n_results=args.k)["ids"]
+    except Exception:
+        store, ref_top = None, None
+
+    rows = [("torch", ref_model, None, None)]
+    ok = True
+    for quant in [q for q in args.quant.split(",") if q]:
+        model = OnnxEmbeddingEncoder(args.onnx_dir, quant=quant, threads=args.threads)
+        vecs = model.encode(texts, normalize_embeddings=True, batch_size=args.batch_size)
+        cos = (vecs * ref).sum(axis=1)
+        overlap = None
+        if store is not None:
+            got = store.query(vecs, n_results=args.k)["ids"]
+            overlap = np.mean([len(set(a) & set(b)) / len(b) for a, b in zip(got, ref_top) if b])
+        print(f"[onnx-{quant}] 余弦 mean {cos.mean():.5f}  min {cos.min():.5f}  p1 {np.percentile(cos, 1):.5f}"
+              + (f"  top{args.k} 重合 {overlap:.4f}" if overlap is not None else "")
+              + f"  模型 {model.nbytes / 1024 / 1024:.0f}MB")
+        ok = ok and cos.mean() >= args.min_cosine
+        rows.append((f"onnx-{quant}", model, cos, overlap))
+
+    for name, model, _, _ in rows:
+        model.encode(texts[:4], normalize_embeddings=True)  # 预热
+        p50, p99 = latency(model, texts, args.latency_runs)
+        tps = throughput(model, texts, args.batch_size)
+        print(f"[{name}] 单条 p50 {p50:.1f}ms  p99 {p99:.1f}ms  批量 {tps:.1f} 条/秒（batch={args.batch_size}）")
+
+    sys.exit(0 if ok else 1)
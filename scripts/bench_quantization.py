@@ -0,0 +1,94 @@
+# scripts/bench_quantization.py
+# 向量压缩的召回率 / 内存权衡：Matryoshka 截断维度 × 存储精度（float32 / float16 / int8）
+# 以完整维度 float32 的精确检索结果为基准，计算各配置的 recall@k 与向量占用
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from backend.rag.quantization import DTYPES, bytes_per_vector, normalize
+from backend.rag.vector_store import ChromaVectorStore, NumpyVectorStore, iter_chroma, write_numpy_index
+
+
+def load_corpus(chroma_dir):
+    """从 Chroma 读出完整精度的向量与记录"""
+    store = ChromaVectorStore(chroma_dir)
+    ids, vecs, docs, metas = [], [], [], []
+    for page in iter_chroma(store.collection):
+        ids.extend(page["ids"])
+        vecs.extend(page["embeddings"])
+        docs.extend(page["documents"])
+        metas.extend(page["metadatas"])
+    return ids, normalize(vecs), docs, metas
+
+
+def make_queries(vecs, docs, n, noise, seed, embed_text):
+    """默认用随机 chunk 的向量加噪声作为查询，--embed-text 时用文本前 50 字重新编码"""
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(vecs), size=min(n, len(vecs)), replace=False)
+    if embed_text:
+        from backend.nodes.embedding_node import JinaEmbeddingNode
+        node = JinaEmbeddingNode()
+        node.dim = None  # 基准查询取完整维度，由索引按自身维度截断
+        return node.encode([docs[i][:50] for i in picks])
+    q = vecs[picks] + rng.normal(scale=noise, size=(len(picks), vecs.shape[1])).astype(np.float32)
+    return normalize(q)
+
+
+def topk_ids(store, queries, k):
+    res = store.query(queries, n_results=k)
+    return res["ids"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="向量截断 / 量化的召回率与内存基准")
+    parser.add_argument("--chroma-dir", default=os.getenv("CHROMA_PERSIST", "rag_store"))
+    parser.add_argument("--dims", default="1024,768,512,256,128", help="逗号分隔的截断维度")
+    parser.add_argument("--dtypes", default=",".join(DTYPES), help="逗号分隔的存储精度")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embed-text", action="store_true", help="用嵌入模型编码真实文本作为查询")
+    args = parser.parse_args()
+
+    ids, vecs, docs, metas = load_corpus(args.chroma_dir)
+    if not ids:
+        print(f"Chroma 集合为空（{args.chroma_dir}），请先运行 build_rag_index.py")
+        sys.exit(0)
+    full_dim = vecs.shape[1]
+    print(f"已读取 {len(ids)} 条向量（{full_dim} 维）")
+    queries = make_queries(vecs, docs, args.queries, args.noise, args.seed, args.embed_text)
+
+    dims = [d for d in (int(x) for x in args.dims.split(",")) if d <= full_dim]
+    dtypes = [t for t in args.dtypes.split(",") if t]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 基准：完整维度 float32 精确检索
+        write_numpy_index(os.path.join(tmp, "base"), ids, vecs, docs, metas, dtype="float32")
+        baseline = topk_ids(NumpyVectorStore(os.path.join(tmp, "base")), queries, args.k)
+
+        print(f"{'dim':>6} {'dtype':>8} {'B/vec':>7} {'MB':>8} {'ratio':>6} {'recall@' + str(args.k):>9} {'ms/q':>7}")
+        for dim in sorted(dims, reverse=True):
+            for dtype in dtypes:
+                out = os.path.join(tmp, f"{dim}-{dtype}")
+                write_numpy_index(out, ids, vecs, docs, metas, dim=dim, dtype=dtype)
+                store = NumpyVectorStore(out)
+                t0 = time.perf_counter()
+                got = topk_ids(store, queries, args.k)
+                ms = (time.perf_counter() - t0) * 1000 / len(queries)
+                recall = np.mean([len(set(g) & set(b)) / len(b) for g, b in zip(got, baseline) if b])
+                per_vec = bytes_per_vector(dim, dtype)
+                mb = per_vec * len(ids) / 1024 / 1024
+                ratio = bytes_per_vector(full_dim, "float32") / per_vec
+                print(f"{dim:>6} {dtype:>8} {per_vec:>7} {mb:>8.1f} {ratio:>5.1f}x {recall:>9.4f} {ms:>7.2f}")
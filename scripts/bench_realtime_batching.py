@@ -0,0 +1,96 @@
+# scripts/bench_realtime_batching.py
+# 对比 realtime_advice 在 batch=1 与连续批处理两种模式下的 CPU 吞吐
+
+import sys
+import os
+import time
+import argparse
+import threading
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from backend.nodes.llm_doctor_node import LLMDoctorAdviceNode
+from backend.nodes.generation_scheduler import GenerationScheduler
+
+SAMPLES = [
+    ("患者说自己这两天发烧38度并咳嗽。", "普通感冒通常不需要抗生素，可物理降温和多喝水。"),
+    ("患者主诉头痛三天，夜间加重。", "紧张性头痛常与睡眠不足、压力相关。"),
+    ("孩子腹泻两天，一天五六次稀便。", "儿童腹泻需注意补液，预防脱水。"),
+    ("患者最近喉咙痛，吞咽时明显。", "急性咽炎多为病毒感染，可含服润喉片。"),
+    ("老人血压160/100，有点头晕。", "高血压患者应规律服药并监测血压。"),
+    ("患者皮肤起红疹，很痒。", "荨麻疹可口服抗组胺药物缓解瘙痒。"),
+]
+
+
+def run_mode(node, prompts, batch_size, concurrency):
+    """用 concurrency 个线程并发提交 prompts，返回 (总耗时, 各请求延迟, 调度器统计)"""
+    scheduler = GenerationScheduler(
+        node.model, node.tokenizer, node.device, node.gen_kwargs("realtime_advice"),
+        max_batch_size=batch_size, max_wait_ms=10 if batch_size > 1 else 0,
+    )
+    latencies = []
+    lock = threading.Lock()
+    it = iter(prompts)
+
+    def client():
+        while True:
+            with lock:
+                prompt = next(it, None)
+            if prompt is None:
+                return
+            t0 = time.perf_counter()
+            scheduler.generate(prompt)
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - started, sorted(latencies), scheduler.stats()
+
+
+def report(name, total, latencies, stats):
+    n = len(latencies)
+    print(f"\n[{name}]")
+    print(f"请求数: {n}，总耗时: {total:.2f}s，吞吐: {n / total:.3f} req/s，"
+          f"{stats['generated_tokens'] / total:.1f} tok/s")
+    print(f"延迟 p50: {latencies[n // 2]:.2f}s，p99: {latencies[min(n - 1, int(n * 0.99))]:.2f}s")
+    print(f"平均 batch 行数: {stats['avg_batch_rows']}，prefill 次数: {stats['prefills']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="realtime_advice 连续批处理吞吐基准")
+    parser.add_argument("--requests", type=int, default=24, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发客户端数（模拟诊室数）")
+    parser.add_argument("--batch-size", type=int, default=8, help="批处理模式下的最大 batch")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU 线程数")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    node = LLMDoctorAdviceNode()
+    prompts = [
+        node.build_prompt("realtime_advice", *SAMPLES[i % len(SAMPLES)])
+        for i in range(args.requests)
+    ]
+
+    # 预热，避免首次调用的开销计入结果
+    run_mode(node, prompts[:1], 1, 1)
+
+    total, lat, stats = run_mode(node, prompts, 1, args.concurrency)
+    report("batch=1（串行）", total, lat, stats)
+    base = len(lat) / total
+
+    total, lat, stats = run_mode(node, prompts, args.batch_size, args.concurrency)
+    report(f"连续批处理（max_batch={args.batch_size}）", total, lat, stats)
+    print(f"\n吞吐提升: {len(lat) / total / base:.2f}x")
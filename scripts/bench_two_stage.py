@@ -0,0 +1,98 @@
+# scripts/bench_two_stage.py
+# 两阶段（粗排 + 精排）检索基准：不同语料规模下的 recall@k 与 p50/p99 延迟
+# 基准为同一索引上关闭粗排的精确检索；语料规模超过现有索引时用加噪声的副本扩充
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from backend.rag.quantization import DTYPES, normalize
+from backend.rag.vector_store import ChromaVectorStore, NumpyVectorStore, iter_chroma, write_numpy_index
+
+
+def load_base(chroma_dir, synthetic_dim, seed):
+    """真实索引的向量；--synthetic-dim 时改用随机向量"""
+    if synthetic_dim:
+        rng = np.random.default_rng(seed)
+        return normalize(rng.normal(size=(1000, synthetic_dim)))
+    vecs = []
+    for page in iter_chroma(ChromaVectorStore(chroma_dir).collection):
+        vecs.extend(page["embeddings"])
+    return normalize(vecs)
+
+
+def grow(base, size, noise, rng):
+    """把语料扩充到 size 条：在原向量上加噪声生成相近但不重复的向量"""
+    if size <= len(base):
+        return base[:size]
+    extra = base[rng.integers(0, len(base), size - len(base))]
+    extra = extra + rng.normal(scale=noise, size=extra.shape).astype(np.float32)
+    return np.concatenate([base, normalize(extra)])
+
+
+def timed(store, queries, k):
+    lat, ids = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = store.query(q[None, :], n_results=k)
+        lat.append(time.perf_counter() - t0)
+        ids.append(res["ids"][0])
+    return np.array(lat) * 1000, ids
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="两阶段向量检索基准")
+    parser.add_argument("--chroma-dir", default=os.getenv("CHROMA_PERSIST", "rag_store"))
+    parser.add_argument("--synthetic-dim", type=int, default=0, help="不读索引，用该维度的随机向量")
+    parser.add_argument("--sizes", default="4000,20000,100000", help="逗号分隔的语料规模")
+    parser.add_argument("--dtype", choices=DTYPES, default="float16", help="精排矩阵精度")
+    parser.add_argument("--coarse-dim", type=int, default=256)
+    parser.add_argument("--coarse-dtype", choices=DTYPES, default="int8")
+    parser.add_argument("--candidates", default="20,50,100,200", help="逗号分隔的候选数")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    base = load_base(args.chroma_dir, args.synthetic_dim, args.seed)
+    if not len(base):
+        print(f"Chroma 集合为空（{args.chroma_dir}），请先运行 build_rag_index.py 或使用 --synthetic-dim")
+        sys.exit(0)
+    print(f"基础向量 {len(base)} 条（{base.shape[1]} 维），精排 {args.dtype}，"
+          f"粗排 {args.coarse_dim} 维 {args.coarse_dtype}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(x) for x in args.sizes.split(",")):
+            vecs = grow(base, size, args.noise, rng)
+            ids = [str(i) for i in range(len(vecs))]
+            out = os.path.join(tmp, str(size))
+            write_numpy_index(out, ids, vecs, [""] * len(ids), [{}] * len(ids), dtype=args.dtype,
+                              coarse_dim=args.coarse_dim, coarse_dtype=args.coarse_dtype)
+            picks = rng.choice(len(vecs), size=min(args.queries, len(vecs)), replace=False)
+            queries = normalize(vecs[picks] + rng.normal(scale=args.noise, size=(len(picks), vecs.shape[1])))
+
+            exact = NumpyVectorStore(out, two_stage=False)
+            exact.query(queries[:1], n_results=args.k)
+            lat, truth = timed(exact, queries, args.k)
+            print(f"\n[N={len(vecs)}] 精确检索        recall@{args.k} 1.0000  "
+                  f"p50 {np.percentile(lat, 50):.2f}ms  p99 {np.percentile(lat, 99):.2f}ms")
+
+            for cand in (int(x) for x in args.candidates.split(",")):
+                store = NumpyVectorStore(out, two_stage=True, candidates=cand)
+                store.query(queries[:1], n_results=args.k)
+                lat, got = timed(store, queries, args.k)
+                recall = np.mean([len(set(g) & set(t)) / len(t) for g, t in zip(got, truth)])
+                print(f"[N={len(vecs)}] 两阶段 cand={cand:<5} recall@{args.k} {recall:.4f}  "
+                      f"p50 {np.percentile(lat, 50):.2f}ms  p99 {np.percentile(lat, 99):.2f}ms")
@@ -10,61 +10,40 @@ load_dotenv(find_dotenv())
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 sys.path.insert(0, project_root)
 
-print(os.getenv("CHROMA_PERSIST"))
-print(os.getenv("HUGGINGFACE_HUB_CACHE"))
-
 from backend.database.session import SessionLocal
 from backend.database.models import MedicalKnowledge
-import random
+from sqlalchemy import select
 
-# 从数据库加载医学知识数据
-# 先尝试2000条，后续可调整
-def load_knowledge_from_db():
-    """从数据库加载医学知识数据"""
+# 从数据库流式读取医学知识：服务端游标 + yield_per，内存占用与表大小无关
+def iter_knowledge_from_db(batch_size=500, limit=None):
+    """逐行产出医学知识（只取建索引用到的列）"""
+    stmt = select(
+        MedicalKnowledge.title,
+        MedicalKnowledge.content_text,
+        MedicalKnowledge.source_url,
+        MedicalKnowledge.source_type,
+    ).order_by(MedicalKnowledge.doc_id).execution_options(yield_per=batch_size)
+    if limit:
+        stmt = stmt.limit(limit)
     db = SessionLocal()
     try:
-        records = db.query(MedicalKnowledge).limit(4000).all()
-        data = []
-        if not records:
-            print("数据库返回空集，请检查数据库是否为空")
-            return []
-        else:
-            for record in records:
-                data.append({
-                    "title": record.title,
-                    "content_text": record.content_text,
-                    "source_url": record.source_url,
-                    "created_at": record.created_at,
-                    "source_type": record.source_type
-                })
+        for row in db.execute(stmt):
+            yield row._asdict()
     finally:
         db.close()
-    return data
-
-import re
-
-# 对文本进行 chunking
-def chunk_text(text, chunk_size=500, overlap=80):
-    """将文本分块，默认每块500字符，重叠80字符"""
-    
-    # 简单按标点符号分句
-    sents = re.split(r'(?<=[。！？\n])', text)
-    chunks, current = [], ""
-    for sent in sents:
-        if len(current) + len(sent) > chunk_size:
-            chunks.append(current.strip())
-            current = current[-overlap:].strip() + sent  # 保留重叠部分
-        else:
-            current += sent
-    if current:
-        chunks.append(current.strip())
-    # 丢掉太短的块
-    return [(i, c) for i, c in enumerate(chunks) if len(c) > 10]
+
+# 对文本进行 chunking：原有按字符切块（CHUNKER=char）与按 token 切块（默认）
+from backend.rag.chunker import (
+    CHAR_CHUNK_SIGNATURE, chunk_signature, chunk_text_chars as chunk_text, make_chunker, stable_chunk_id,
+)
 
 from backend.nodes.embedding_node import JinaEmbeddingNode
-import chromadb
-from tqdm import tqdm
-import gc
+from backend.rag.vector_store import get_vector_store, iter_chroma
+from backend.rag.bm25_index import BM25Index, build_from_store
+from backend.rag.retrieval_cache import bump_index_version
+from backend.rag.index_manifest import IndexManifest, batched, chunk_hash
+from backend.rag.ingest_pipeline import StreamPipeline, batches, embed_length_sorted
+import time
 
 import hashlib
 def make_id(title, i, source_type):
@@ -73,84 +52,267 @@ def make_id(title, i, source_type):
     return f"{source_type}-{h}-{i}"
 
 
+def iter_chunks(rows, chunker=None, batch_size=64):
+    """
+    逐篇文档切块，产出待写入的 chunk 记录。
+    chunker 为 TokenChunker 时每 batch_size 篇一起分词，chunk id 由正文内容决定；
+    为 None 时沿用按字符切块与按序号编号的 id
+    """
+    for group in batches(rows, batch_size):
+        if chunker is None:
+            pieces = [chunk_text(row["content_text"]) for row in group]
+        else:
+            pieces = chunker.chunk_many([row["content_text"] or "" for row in group])
+        for row, chunks in zip(group, pieces):
+            for i, chunk in chunks:
+                if chunker is None:
+                    cid = make_id(row["title"], i, row["source_type"])
+                else:
+                    cid = stable_chunk_id(row["source_type"], row["title"], chunk)
+                yield {
+                    "id": cid,
+                    "doc": chunk,
+                    "meta": {
+                        "title": row["title"],
+                        "source_type": row["source_type"],
+                        "source_url": row["source_url"],
+                        "chunk_index": i
+                    }
+                }
+
+
+def embed_signature():
+    """嵌入配置签名：模型、推理后端、截断维度任一变化，已有向量都不能再复用"""
+    backend = os.getenv("EMBED_BACKEND", "torch")
+    if backend == "onnx":
+        backend += "-" + os.getenv("EMBED_ONNX_QUANT", "int8")
+    return f"jinaai/jina-embeddings-v3|{backend}|dim={os.getenv('EMBED_DIM', '0')}"
+
+
+class LocalEncoder:
+    """当前进程内的嵌入模型（带向量缓存；批次已由调用方组好，关闭微批处理）"""
+
+    def __init__(self):
+        # 构建时只有嵌入阶段这一个调用方，批次已按长度排序、凑满 --embed-batch：
+        # 微批处理没有别的请求可合并，只会多等一个时间窗口，并把排好序的批次重新拆分
+        os.environ["EMBED_BATCHING"] = "0"
+        self.node = JinaEmbeddingNode()
+
+    def map(self, batches):
+        for texts in batches:
+            yield self.node.encode(texts)
+
+    def encode(self, texts):
+        return self.node.encode(texts)
+
+    def close(self):
+        if self.node.cache is not None:
+            self.node.cache.flush()
+            print("向量缓存统计：", self.node.cache.stats())
+
+
+_worker_node = None
+
+
+def _init_worker(threads):
+    """进程池 worker：各自加载一份模型，平分 CPU 线程；磁盘缓存不跨进程共享，关闭"""
+    global _worker_node
+    os.environ["EMBED_BATCHING"] = "0"  # 同 LocalEncoder：每个 worker 一次只处理一个已组好的批次
+    os.environ["EMBED_CACHE"] = "0"
+    os.environ["EMBED_ONNX_THREADS"] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_node = JinaEmbeddingNode()
+
+
+def _embed_batch(texts):
+    return _worker_node.encode(texts)
+
+
+class PoolEncoder:
+    """多进程嵌入：批次轮流分给各 worker，结果按提交顺序返回"""
+
+    def __init__(self, workers):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        threads = max(1, (os.cpu_count() or workers) // workers)
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_init_worker, initargs=(threads,))
+        print(f"嵌入进程池：{workers} 个进程，每个 {threads} 线程")
+
+    def map(self, batches):
+        return self.pool.map(_embed_batch, batches)
+
+    def encode(self, texts):
+        return self.pool.submit(_embed_batch, texts).result()
+
+    def close(self):
+        self.pool.shutdown()
+
+
 if __name__ == "__main__": 
-    # 初始化 Node 和 Chroma
-    embedder = JinaEmbeddingNode()
+    import argparse
+    parser = argparse.ArgumentParser(description="构建 RAG 向量索引")
+    parser.add_argument("--embed-batch", type=int, default=64, help="每次 encode 的 chunk 数（EMBED_MAX_BATCH）")
+    parser.add_argument("--group-size", type=int, default=4096, help="每凑够多少个 chunk 排序分批一次")
+    parser.add_argument("--workers", type=int, default=1, help="嵌入进程数（>1 时每个进程各加载一份模型）")
+    parser.add_argument("--write-batch", type=int, default=500, help="每次写入 Chroma 的 chunk 数（也是清单的提交粒度）")
+    parser.add_argument("--read-batch", type=int, default=500, help="数据库游标每次取的行数")
+    parser.add_argument("--queue-size", type=int, default=256, help="各阶段之间队列的容量（条）")
+    parser.add_argument("--limit", type=int, default=None, help="只处理前 N 条知识（调试用，默认全部）")
+    parser.add_argument("--report-every", type=float, default=10.0, help="每隔多少秒输出一次各阶段吞吐与队列深度")
+    parser.add_argument("--chunker", choices=["token", "char"], default=os.getenv("CHUNKER", "token"),
+                        help="切块方式：token 按嵌入模型 token 数（CHUNK_TOKENS / CHUNK_OVERLAP_TOKENS），char 为原有按字符切块；"
+                             "与已有索引的切块方式不同时需加 --full")
+    parser.add_argument("--full", action="store_true", help="忽略清单，全部重新嵌入")
+    parser.add_argument("--dry-run", action="store_true", help="只统计新增 / 变更 / 删除的 chunk，不写入")
+    args = parser.parse_args()
+    os.environ["EMBED_MAX_BATCH"] = str(args.embed_batch)
+
     chroma_dir = os.getenv("CHROMA_PERSIST", "rag_store")
-    client = chromadb.PersistentClient(path=chroma_dir)
-    collection = client.get_or_create_collection("medical_knowledge")
+    store = get_vector_store("chroma", chroma_dir)
+    collection = store.collection
 
-    # 加载数据
-    data = load_knowledge_from_db()
-    if not data:
-        print("数据库返回空集，请检查数据或 offset")
-        sys.exit(0)
-    print(f"已載入 {len(data)} 条医学知识，写入目录：{chroma_dir}")
-
-    # 逐条构建向量
-    batch_size = 100
-    buffer = []
-    for row in tqdm(data, desc="Processing documents"):
-        chunks = chunk_text(row["content_text"])
-        if not chunks:
-            continue
-
-        texts = [c for _, c in chunks]
-
-        embeddings = []
-        for text_chunk in texts:
-            res = embedder.run({"texts": [text_chunk]})
-            # 检查返回结果是否有效
-            if res and res.get("embeddings") and res["embeddings"]:
-                embeddings.extend(res["embeddings"])
-            else:
-                embeddings.append(None) # 添加一個佔位符，保持长度一致
-
-        for i, (chunk, emb) in enumerate(zip(texts, embeddings)):
-            # 跳过嵌入失敗或为空的块
-            if not emb or len(emb) < 100:
-                continue
-            buffer.append({
-                "id": make_id(row["title"], i, row["source_type"]),
-                "doc": chunk,
-                "emb": emb,
-                "meta": {
-                    "title": row["title"],
-                    "source_type": row["source_type"],
-                    "source_url": row["source_url"],
-                    "chunk_index": i
-                }
-            })
+    # 清单：记录已写入的 chunk id -> 内容 hash；嵌入配置变化时必须全部重算
+    # 试运行不改动清单与向量库：需要清空或首次登记时，改为与内存中的临时清单比对
+    manifest = IndexManifest()
+    signature = embed_signature()
+    chunker = make_chunker(args.chunker)
+    chunk_sig = chunk_signature(chunker)
+    # 切块配置变化时 chunk id 全部改变，增量比对等于删掉整个索引再重算：不自动进行，要求显式 --full
+    # 没有记录切块签名的清单、以及首次登记的已有向量库，都是原有按字符切块建的
+    indexed_chunk_sig = manifest.get_state("chunk_signature") or CHAR_CHUNK_SIGNATURE
+    if not args.full and (len(manifest) or collection.count()) and indexed_chunk_sig != chunk_sig:
+        print(f"切块配置与已有索引不一致（{indexed_chunk_sig} -> {chunk_sig}），所有 chunk id 都会变化。"
+              "请加 --full 全量重建，或用 --chunker 指定已有索引的切块方式")
+        sys.exit(1)
+    if args.full or (len(manifest) and manifest.get_state("embed_signature") != signature):
+        print("全量重建：清空清单与向量库" + ("" if args.full else f"（嵌入配置变化 -> {signature}）"))
+        if args.dry_run:
+            manifest = IndexManifest(":memory:")
+        else:
+            # 先删向量库再清空清单：中途被中断时清单仍是旧签名，重跑会再次全量重建
+            store.reset()
+            collection = store.collection
+            manifest.reset()
+    elif not len(manifest) and collection.count():
+        # 首次启用清单：按库中已有的正文与元数据登记，避免把现有向量重算一遍
+        if args.dry_run:
+            manifest = IndexManifest(":memory:")
+        for page in iter_chroma(collection, include=("documents", "metadatas")):
+            manifest.record((cid, chunk_hash(doc, meta))
+                            for cid, doc, meta in zip(page["ids"], page["documents"], page["metadatas"]))
+        print(f"已从现有向量库登记 {len(manifest)} 条 chunk 到清单（如需按当前模型重算请加 --full）")
+        if not args.dry_run:
+            manifest.set_state("embed_signature", signature)
+            manifest.set_state("chunk_signature", chunk_sig)
+    manifest.begin_scan(partial=bool(args.limit))
+
+    # 流水线：读库 -> 切块并与清单比对 -> 按长度排序批量嵌入 -> 批量 upsert 并提交清单
+    # 各阶段各占一个线程，由有界队列相连，读库 / 切块与嵌入、写入同时进行
+    signed = (manifest.get_state("embed_signature") == signature
+              and manifest.get_state("chunk_signature") == chunk_sig)
+    state = {"encoder": None, "written": 0, "signed": signed}
+
+    def chunk_stage(rows):
+        """只放行新增 / 变更的 chunk"""
+        for group in batches(iter_chunks(rows, chunker), args.write_batch):
+            yield from manifest.diff(group)
+
+    def embed_stage(chunks):
+        for group in batches(chunks, args.group_size):
+            if state["encoder"] is None:
+                # 有需要嵌入的 chunk 时才加载模型
+                state["encoder"] = PoolEncoder(args.workers) if args.workers > 1 else LocalEncoder()
+            # 按长度排序分批嵌入，再恢复为切块顺序写入
+            yield embed_length_sorted(group, state["encoder"].map, args.embed_batch)
 
-        # 写入 ChromaDB
-        if len(buffer) >= batch_size:
-            collection.add(
+    def write_stage(embedded):
+        """写入向量库后立刻提交清单：中断重跑时这些 chunk 不会再算"""
+        for buffer in batches((c for batch in embedded for c in batch), args.write_batch):
+            store.upsert(
                 ids=[b["id"] for b in buffer],
                 documents=[b["doc"] for b in buffer],
-                embeddings=[b["emb"] for b in buffer],
+                embeddings=[b["emb"].tolist() for b in buffer],
                 metadatas=[b["meta"] for b in buffer]
             )
-            print(f"\n写入 {len(buffer)} 条 chunk（当前总计: {collection.count()}）")
-            buffer.clear()
-
-        # 在处理完一篇大文章的所有 chunks 后，呼叫垃圾回收
-        gc.collect()
-
-    # 处理剩余的 buffer
-    if buffer:
-        collection.add(
-            ids=[b["id"] for b in buffer],
-            documents=[b["doc"] for b in buffer],
-            embeddings=[b["emb"] for b in buffer],
-            metadatas=[b["meta"] for b in buffer],
-        )
-        print(f"\n最后一批写入 {len(buffer)} 条 chunk（总计: {collection.count()}）")
+            manifest.record((b["id"], b["hash"]) for b in buffer)
+            if not state["signed"]:
+                # 第一批按当前配置切块、嵌入的向量写入成功后才记下签名
+                manifest.set_state("embed_signature", signature)
+                manifest.set_state("chunk_signature", chunk_sig)
+                state["signed"] = True
+            state["written"] += len(buffer)
+            yield len(buffer)
+
+    def report(stats):
+        print(" | ".join(
+            f"{name} {s['out']}条 {s['out_per_s']}/s 忙碌{s['busy_ratio']:.0%}"
+            + (f" 队列{s['queue_depth']}/{s['queue_max']}" if s.get("queue_depth") is not None else "")
+            for name, s in stats.items()))
+
+    started = time.perf_counter()
+    source = iter_knowledge_from_db(args.read_batch, args.limit)
+    pipeline = StreamPipeline(source, queue_size=args.queue_size).stage("chunk", chunk_stage)
+    if not args.dry_run:
+        pipeline.stage("embed", embed_stage).stage("write", write_stage)
+    stats = pipeline.run(report_every=args.report_every, report=report)
+
+    delta = manifest.delta
+    print(f"已读取 {stats['source']['out']} 条医学知识，写入目录：{chroma_dir}")
+    print(f"chunk 共 {delta['total']} 条：新增 {delta['new']}，变更 {delta['changed']}，"
+          f"未变 {delta['unchanged']}，重复 id {delta['duplicates']}")
+    if not stats["source"]["out"]:
+        print("数据库返回空集，请检查数据库是否为空")
+        sys.exit(0)
+
+    # 源数据中已不存在的 chunk：从向量库和清单中删除（--limit 只读了部分数据，无法判断，不删除）
+    removed = manifest.unseen_ids()
+    if args.limit:
+        print(f"--limit {args.limit} 只处理了部分知识，跳过删除")
+    else:
+        print(f"待删除 {len(removed)} 条")
+    if args.dry_run:
+        sys.exit(0)
+    for ids in batched(removed, args.write_batch):
+        store.delete(ids)
+        manifest.forget(ids)
+
+    elapsed = time.perf_counter() - started
+    encoder, n_chunks = state["encoder"], state["written"]
+    embed_rate = n_chunks / max(stats["embed"]["busy_s"], 1e-9)
+    print(f"共写入 {n_chunks} 条、删除 {len(removed)} 条 chunk，总用时 {elapsed:.1f}s，"
+          f"{n_chunks / max(elapsed, 1e-9):.1f} chunks/s（嵌入阶段 {embed_rate:.1f} chunks/s）")
+    report(stats)
+    print("当前向量条数：", collection.count())
+    manifest.close()
+    if encoder is None and not removed:
+        print("索引无变化")
+        sys.exit(0)
 
     # 测试查询
     query = "发烧两天 咳嗽 是否需要用抗生素"
-    q_vec = embedder.run({"texts": [query]})["embeddings"]
-    res = collection.query(query_embeddings=q_vec, n_results=3)
-    for m, d in zip(res["metadatas"][0], res["documents"][0]):
-        print(f"[{m['source_type']}] {m['title']} → {d[:80]}...")
+    if encoder is not None:
+        q_vec = encoder.encode([query])
+        res = store.query(q_vec, n_results=3)
+        for m, d in zip(res["metadatas"][0], res["documents"][0]):
+            print(f"[{m['source_type']}] {m['title']} → {d[:80]}...")
+        encoder.close()
 
-    print("当前向量条数：", collection.count())
+    # 对同一批 chunk 重建 BM25 倒排索引（混合检索用）
+    bm25_dir = os.getenv("BM25_INDEX_DIR", "rag_store_bm25")
+    t0 = time.perf_counter()
+    n_docs = build_from_store(store, bm25_dir)
+    print(f"BM25 索引已写入 {bm25_dir}：{n_docs} 个 chunk，用时 {time.perf_counter() - t0:.2f}s")
+    bm25 = BM25Index(bm25_dir)
+    bm25.search(query, 10)
+    t0 = time.perf_counter()
+    for _ in range(100):
+        bm25.search(query, 10)
+    print(f"BM25 单次查询平均 {(time.perf_counter() - t0) * 10:.3f}ms")
+
+    # 更新索引版本号，服务端的检索缓存据此整体失效
+    print("索引版本：", bump_index_version())
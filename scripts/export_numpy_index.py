@@ -0,0 +1,48 @@
+# scripts/export_numpy_index.py
+# 把 build_rag_index.py 写入 Chroma 的向量导出为 NumPy / mmap 索引（VECTOR_BACKEND=numpy 使用）
+
+import sys
+import os
+import time
+import argparse
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from backend.rag.vector_store import ChromaVectorStore, NumpyVectorStore, iter_chroma, write_numpy_index
+from backend.rag.retrieval_cache import bump_index_version
+from backend.rag.quantization import DTYPES
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 Chroma 索引为 NumPy mmap 索引")
+    parser.add_argument("--chroma-dir", default=os.getenv("CHROMA_PERSIST", "rag_store"))
+    parser.add_argument("--out", default=os.getenv("NUMPY_INDEX_DIR", "rag_store_np"))
+    parser.add_argument("--dim", type=int, default=None, help="Matryoshka 截断维度（默认保留完整维度）")
+    parser.add_argument("--dtype", choices=DTYPES, default="float16", help="向量存储精度")
+    parser.add_argument("--coarse-dim", type=int, default=None, help="两阶段检索粗排矩阵的截断维度（如 256）")
+    parser.add_argument("--coarse-dtype", choices=DTYPES, default=None, help="粗排矩阵精度（默认 int8）")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = ChromaVectorStore(args.chroma_dir)
+    ids, embeddings, documents, metadatas = [], [], [], []
+    for page in iter_chroma(store.collection):
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+
+    if not ids:
+        print(f"Chroma 集合为空（{args.chroma_dir}），请先运行 build_rag_index.py")
+        sys.exit(0)
+
+    write_numpy_index(args.out, ids, embeddings, documents, metadatas, dim=args.dim, dtype=args.dtype,
+                      coarse_dim=args.coarse_dim, coarse_dtype=args.coarse_dtype)
+    bump_index_version()
+    stats = NumpyVectorStore(args.out).stats()
+    print(f"已导出 {len(ids)} 条向量到 {args.out}（{stats['dim']} 维 {stats['dtype']}，{stats['vector_mb']}MB），"
+          f"用时 {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,95 @@
+# scripts/export_onnx_embedder.py
+# 把 jina-embeddings-v3 的 transformer 导出为 ONNX，并做动态 int8 量化（EMBED_BACKEND=onnx 使用）
+
+import sys
+import os
+import json
+import time
+import argparse
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+os.environ.setdefault("HUGGINGFACE_HUB_CACHE", ".cache/hf")
+
+import torch
+from sentence_transformers import SentenceTransformer
+
+from backend.nodes.onnx_embedder import MODEL_FILES
+
+
+class HiddenStates(torch.nn.Module):
+    """只输出 last_hidden_state，池化放在 ONNX 之外用 numpy 做"""
+
+    def __init__(self, auto_model):
+        super().__init__()
+        self.auto_model = auto_model
+
+    def forward(self, input_ids, attention_mask):
+        return self.auto_model(input_ids=input_ids, attention_mask=attention_mask)[0]
+
+
+def export(model, out_dir, opset):
+    path = os.path.join(out_dir, MODEL_FILES["fp32"])
+    wrapper = HiddenStates(model[0].auto_model).eval()
+    sample = model.tokenizer(["发烧两天，咳嗽"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (sample["input_ids"], sample["attention_mask"]),
+            path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=opset,
+        )
+    return path
+
+
+def quantize(fp32_path, out_dir):
+    """动态量化：权重离线转 int8，激活在推理时按批计算 scale"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    path = os.path.join(out_dir, MODEL_FILES["int8"])
+    quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8, per_channel=True)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="导出 ONNX 嵌入模型")
+    parser.add_argument("--model", default="jinaai/jina-embeddings-v3")
+    parser.add_argument("--out", default=os.getenv("EMBED_ONNX_DIR", ".cache/onnx/jina-embeddings-v3"))
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--max-seq-length", type=int, default=512, help="推理时的最大 token 数")
+    parser.add_argument("--no-quantize", action="store_true", help="只导出 fp32 模型")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    model = SentenceTransformer(args.model, trust_remote_code=True, device="cpu")
+    model.tokenizer.save_pretrained(args.out)
+
+    t0 = time.perf_counter()
+    fp32_path = export(model, args.out, args.opset)
+    print(f"fp32 模型已导出：{fp32_path}，用时 {time.perf_counter() - t0:.1f}s")
+
+    if not args.no_quantize:
+        t0 = time.perf_counter()
+        int8_path = quantize(fp32_path, args.out)
+        print(f"int8 模型已导出：{int8_path}（{os.path.getsize(int8_path) / 1024 / 1024:.0f}MB），"
+              f"用时 {time.perf_counter() - t0:.1f}s")
+
+    with open(os.path.join(args.out, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "model_name": args.model,
+            "pooling": model[1].get_pooling_mode_str(),
+            "max_seq_length": args.max_seq_length,
+            "dim": model.get_sentence_embedding_dimension(),
+        }, f, ensure_ascii=False)
+    print("下一步：python scripts/bench_onnx_embedder.py 检查与 PyTorch 模型的一致性")
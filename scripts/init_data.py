@@ -12,50 +12,37 @@ sys.path.insert(0, project_root)
 
 from backend.database.session import SessionLocal
 from backend.database.models import MedicalKnowledge
+from backend.database.bulk_import import clean_batch, iter_arrow_batches, make_writer
 
 from datasets import load_from_disk
 from datetime import datetime
 
+import argparse
 import logging
+import time
 
 def clean_data(dataset, src):
-    """清洗数据集，去除空问答对，映射字段"""
-    # 去除空的问答对
-    dataset = [x for x in dataset if x.get('questions') and x.get('answers')]
-
-    # 结构映射成 title/content/source_url
-    mapped_data = []
-    for x in dataset:
-        q = x.get('question') or x.get('questions') or ""
-        a = x.get('answer') or x.get('answers') or ""
-
-        # 如果是 list（或 list of list），取最内层元素
-        if isinstance(q, list):
-            q = q[0] if q and isinstance(q[0], str) else (q[0][0] if q and isinstance(q[0], list) else "")
-        if isinstance(a, list):
-            a = a[0] if a and isinstance(a[0], str) else (a[0][0] if a and isinstance(a[0], list) else "")
-
-        question = str(q).replace("\n", " ").strip()
-        answer = str(a).replace("\n", " ").strip()
-        if not question or not answer:
-            continue
-        mapped_data.append({
-            "title": question,
-            "content_text": f"问题:{question}\n回答:{answer}",
-            "source_url": f"huatuo://{src}",
-            "created_at": datetime.now(),
-            "source_type": src
-        }) 
-    return mapped_data
+    """清洗数据集，去除空问答对，映射字段（与 bulk 模式相同的列式清洗，返回字典列表）"""
+    table = dataset.with_format("arrow")[:]
+    return clean_batch(table, src, datetime.now()).to_pylist()
 
-def main():
+
+# orm 模式未指定 --limit-* 时每个数据集导入的行数
+ORM_DEFAULT_LIMIT = 2000
+
+
+def main_orm(limits, data_dir):
+    """清洗后逐行构造 ORM 对象批量 add_all（原有方式，适合小样本）"""
     # 加载数据集
-    ds_ency = load_from_disk("data/huatuo/huatuo_encyclopedia")
-    ds_kg = load_from_disk("data/huatuo/huatuo_knowledge_graph")
+    ds_ency = load_from_disk(os.path.join(data_dir, "huatuo_encyclopedia"))
+    ds_kg = load_from_disk(os.path.join(data_dir, "huatuo_knowledge_graph"))
+
+    def head(split, limit):
+        return split.select(range(min(limit, len(split)))) if limit else split
 
     # 清洗空字段/映射字段
-    data_ency = clean_data(ds_ency['train'].select(range(2000)), "ency")
-    data_kg = clean_data(ds_kg['train'].select(range(2000)), "kg")
+    data_ency = clean_data(head(ds_ency['train'], limits["ency"]), "ency")
+    data_kg = clean_data(head(ds_kg['train'], limits["kg"]), "kg")
 
     # 合并两个数据集
     KNOWLEDGE_DATA = data_ency + data_kg
@@ -91,6 +78,54 @@ def main():
         # 关闭数据库连接
         db.close()
         print("数据库连接已关闭。")
-        
+
+
+def main_bulk(limits, data_dir, batch_size, method):
+    """流式读取 Arrow record batch -> 列式清洗 -> Core executemany / COPY"""
+    from backend.database.session import engine
+
+    MedicalKnowledge.__table__.create(bind=engine, checkfirst=True)
+    writer, method = make_writer(engine, method)
+    print(f"批量导入：写入方式 {method}，每批 {batch_size} 行")
+    created_at = datetime.now()
+    grand_total, started_all = 0, time.perf_counter()
+    for src, name in (("ency", "huatuo_encyclopedia"), ("kg", "huatuo_knowledge_graph")):
+        split = load_from_disk(os.path.join(data_dir, name))["train"]
+        started = time.perf_counter()
+        read = written = 0
+        for table in iter_arrow_batches(split, batch_size, limits[src]):
+            read += table.num_rows
+            cleaned = clean_batch(table, src, created_at)
+            if cleaned.num_rows:
+                writer.write(cleaned)
+            written += cleaned.num_rows
+            elapsed = time.perf_counter() - started
+            print(f"[{src}] 读取 {read} 行，写入 {written} 行，{written / max(elapsed, 1e-9):.0f} 行/秒")
+        grand_total += written
+        print(f"[{src}] 完成：{written}/{read} 行有效，用时 {time.perf_counter() - started:.1f}s")
+    print(f"数据初始化完成：共写入 {grand_total} 条，用时 {time.perf_counter() - started_all:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导入华佗医学知识数据集")
+    parser.add_argument("--mode", choices=["bulk", "orm"], default="bulk",
+                        help="bulk：Arrow 流式 + 批量写入；orm：逐行清洗 + ORM（原有方式）")
+    parser.add_argument("--data-dir", default="data/huatuo")
+    parser.add_argument("--limit-ency", type=int, default=None,
+                        help=f"百科数据集最多导入的行数（默认：bulk 全部，orm {ORM_DEFAULT_LIMIT}）")
+    parser.add_argument("--limit-kg", type=int, default=None,
+                        help=f"知识图谱数据集最多导入的行数（默认：bulk 全部，orm {ORM_DEFAULT_LIMIT}）")
+    parser.add_argument("--batch-size", type=int, default=20000, help="bulk 模式每批行数")
+    parser.add_argument("--method", choices=["auto", "executemany", "copy"], default="auto",
+                        help="bulk 模式的写入方式：auto 在 PostgreSQL 上用 COPY，其他数据库用 executemany")
+    args = parser.parse_args()
+
+    limits = {"ency": args.limit_ency, "kg": args.limit_kg}
+    if args.mode == "orm":
+        # orm 模式逐行构造对象，保持原来每个数据集 2000 条的默认值
+        main_orm({k: v or ORM_DEFAULT_LIMIT for k, v in limits.items()}, args.data_dir)
+    else:
+        main_bulk(limits, args.data_dir, args.batch_size, args.method)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+# scripts/rag_snapshot.py
+# 单文件索引快照（VECTOR_BACKEND=snapshot 使用）：
+#   export  构建机上把 Chroma 索引导出为一个快照文件
+#   import  服务端校验 checksum 后原子替换到 RAG_SNAPSHOT，并报告加载耗时；可选还原成 Chroma 目录
+#   info    查看快照头部、校验并测量加载耗时
+
+import sys
+import os
+import time
+import shutil
+import argparse
+import numpy as np
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+# 将项目根目录添加到 sys.path 中
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, project_root)
+
+from backend.rag.snapshot import Snapshot, SnapshotVectorStore, write_snapshot
+from backend.rag.vector_store import ChromaVectorStore, iter_chroma
+from backend.rag.retrieval_cache import bump_index_version, read_index_version
+from backend.rag.quantization import DTYPES
+
+
+def measure_load(path, verify):
+    """打开快照 + 第一次查询（随机单位向量，不加载嵌入模型）的耗时"""
+    t0 = time.perf_counter()
+    store = SnapshotVectorStore(path, verify=verify)
+    opened = time.perf_counter() - t0
+    first = 0.0
+    if store.count():
+        q = np.random.default_rng(0).normal(size=(1, store.dim)).astype(np.float32)
+        t0 = time.perf_counter()
+        store.query(q, n_results=3)
+        first = time.perf_counter() - t0
+    return store, opened, first
+
+
+def cmd_export(args):
+    started = time.perf_counter()
+    store = ChromaVectorStore(args.chroma_dir)
+    ids, embeddings, documents, metadatas = [], [], [], []
+    for page in iter_chroma(store.collection):
+        ids.extend(page["ids"])
+        embeddings.extend(page["embeddings"])
+        documents.extend(page["documents"])
+        metadatas.extend(page["metadatas"])
+    read_s = time.perf_counter() - started
+    if not ids:
+        print(f"Chroma 集合为空（{args.chroma_dir}），请先运行 build_rag_index.py")
+        sys.exit(0)
+
+    t0 = time.perf_counter()
+    header = write_snapshot(args.out, ids, embeddings, documents, metadatas, dim=args.dim, dtype=args.dtype,
+                            coarse_dim=args.coarse_dim, coarse_dtype=args.coarse_dtype,
+                            index_version=read_index_version())
+    write_s = time.perf_counter() - t0
+    size_mb = os.path.getsize(args.out) / 1024 / 1024
+    print(f"已导出 {len(ids)} 条到 {args.out}（{header['fine']['dim']} 维 {header['fine']['dtype']}"
+          + (f"，粗排 {header['coarse']['dim']} 维 {header['coarse']['dtype']}" if header["coarse"] else "")
+          + f"，{size_mb:.1f}MB）")
+    print(f"构建用时：读取 Chroma {read_s:.2f}s，写入快照 {write_s:.2f}s，共 {time.perf_counter() - started:.2f}s")
+
+
+def cmd_import(args):
+    # 先在源文件上校验，损坏的快照不会替换掉正在使用的那份
+    t0 = time.perf_counter()
+    Snapshot(args.snapshot, verify=True)
+    print(f"校验通过（{time.perf_counter() - t0:.2f}s）")
+
+    if os.path.abspath(args.snapshot) != os.path.abspath(args.out):
+        tmp = f"{args.out}.tmp"
+        shutil.copyfile(args.snapshot, tmp)
+        os.replace(tmp, args.out)
+    store, opened, first = measure_load(args.out, verify=False)
+    print(f"已安装到 {args.out}：{store.count()} 条，加载 {opened * 1000:.2f}ms，首次查询 {first * 1000:.2f}ms")
+
+    if args.to_chroma:
+        # 还原成 Chroma 目录：向量为快照中的精度，低于 float32 或截断过维度时与原索引不完全一致
+        if store.dtype != "float32":
+            print(f"注意：快照向量为 {store.dtype}，还原后的 Chroma 向量有精度损失")
+        chroma = ChromaVectorStore(args.to_chroma)
+        for start in range(0, store.count(), args.batch_size):
+            rows = np.arange(start, min(start + args.batch_size, store.count()))
+            chroma.upsert(ids=[store.ids[i] for i in rows], documents=[store.documents[i] for i in rows],
+                          embeddings=store.embeddings(rows), metadatas=[store.metadatas[i] for i in rows])
+        print(f"已还原到 Chroma 目录 {args.to_chroma}：{chroma.count()} 条")
+
+    # 更新索引版本号：服务端据此重新打开快照（替换后旧实例仍指向旧文件），检索缓存整体失效
+    print("索引版本：", bump_index_version())
+
+
+def cmd_info(args):
+    snap = Snapshot(args.snapshot)
+    header = snap.header
+    print(f"{args.snapshot}：{snap.nbytes / 1024 / 1024:.1f}MB，{header['count']} 条，"
+          f"创建于 {header['created_at']}，索引版本 {header['index_version'] or '-'}")
+    print(f"精排 {header['fine']}，粗排 {header['coarse']}")
+    for name, info in header["sections"].items():
+        print(f"  {name:<20}{info['dtype']:>6} {str(tuple(info['shape'])):>18}  @ {info['offset']}")
+    t0 = time.perf_counter()
+    snap.verify()
+    print(f"校验通过（{time.perf_counter() - t0:.2f}s）")
+    _, opened, first = measure_load(args.snapshot, verify=False)
+    print(f"加载 {opened * 1000:.2f}ms，首次查询 {first * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="单文件索引快照导出 / 导入")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Chroma 索引 -> 快照文件")
+    p.add_argument("--chroma-dir", default=os.getenv("CHROMA_PERSIST", "rag_store"))
+    p.add_argument("--out", default=os.getenv("RAG_SNAPSHOT", "rag_store.snap"))
+    p.add_argument("--dim", type=int, default=None, help="Matryoshka 截断维度（默认保留完整维度）")
+    p.add_argument("--dtype", choices=DTYPES, default="float16", help="向量存储精度")
+    p.add_argument("--coarse-dim", type=int, default=None, help="两阶段检索粗排矩阵的截断维度（如 256）")
+    p.add_argument("--coarse-dtype", choices=DTYPES, default=None, help="粗排矩阵精度（默认 int8）")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("import", help="校验并安装快照文件")
+    p.add_argument("snapshot", help="构建机导出的快照文件")
+    p.add_argument("--out", default=os.getenv("RAG_SNAPSHOT", "rag_store.snap"), help="服务端读取的快照路径")
+    p.add_argument("--to-chroma", default=None, help="同时还原成 Chroma 目录（供仍使用 chroma 后端的服务）")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("info", help="查看快照并测量加载耗时")
+    p.add_argument("snapshot", nargs="?", default=os.getenv("RAG_SNAPSHOT", "rag_store.snap"))
+    p.set_defaults(func=cmd_info)
+
+    args = parser.parse_args()
+    args.func(args)
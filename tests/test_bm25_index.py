@@ -0,0 +1,49 @@
+# tests/test_bm25_index.py
+
+from backend.rag.bm25_index import BM25IndexBuilder, BM25Index, hybrid_fuse
+
+
+class SpaceTokenizer:
+    """测试用：按空格切词，避免加载 jieba 词典"""
+
+    def tokenize(self, text):
+        return text.lower().split()
+
+
+def build(tmp_path):
+    tok = SpaceTokenizer()
+    builder = BM25IndexBuilder(tok)
+    builder.add("c1", "阿莫西林 胶囊 用于 细菌 感染")
+    builder.add("c2", "布洛芬 用于 发热 头痛")
+    builder.add("c3", "发热 咳嗽 多喝水 发热")
+    builder.write(str(tmp_path))
+    return BM25Index(str(tmp_path), tok)
+
+
+def test_exact_term_lookup(tmp_path):
+    index = build(tmp_path)
+    assert len(index) == 3
+    hits = index.search("阿莫西林", 5)
+    assert [cid for cid, _ in hits] == ["c1"]
+
+
+def test_ranking_by_tf(tmp_path):
+    index = build(tmp_path)
+    hits = index.search("发热", 5)
+    assert [cid for cid, _ in hits] == ["c3", "c2"]
+    assert index.search("不存在的词", 5) == []
+
+
+def test_hybrid_fuse():
+    fused = hybrid_fuse([("a", 0.9), ("b", 0.5)], [("c", 12.0), ("a", 3.0)], alpha=0.5)
+    # a 在两路都出现：向量第一 + BM25 最低分（floor），高于只在 BM25 第一的 c
+    assert [cid for cid, _ in fused] == ["a", "c", "b"]
+    assert fused[2][1] > 0  # 向量最低分不等同于未出现
+
+
+def test_hybrid_fuse_tie_is_deterministic():
+    # x / y 融合分相同：按向量分数高者在前，再按 id
+    fused = hybrid_fuse([("y", 1.0), ("x", 1.0)], [("x", 5.0), ("y", 5.0)], alpha=0.5)
+    assert [cid for cid, _ in fused] == ["x", "y"]
+    fused = hybrid_fuse([("a", 1.0), ("b", 0.0)], [("b", 1.0), ("a", 0.0)], alpha=0.5)
+    assert [cid for cid, _ in fused] == ["a", "b"]
@@ -0,0 +1,48 @@
+# tests/test_bulk_import.py
+
+from datetime import datetime
+
+import pyarrow as pa
+from sqlalchemy import create_engine, select
+
+from backend.database.bulk_import import TITLE_MAX, CoreWriter, _first_text, clean_batch
+from backend.database.models import MedicalKnowledge
+
+
+def test_first_text_unwraps_nested_lists():
+    col = pa.array([[["头痛\n两天 "]], [[]], [], None, [["发热"], ["咳嗽"]]],
+                   pa.list_(pa.list_(pa.string())))
+    assert _first_text(col).to_pylist() == ["头痛 两天", None, None, None, "发热"]
+    assert _first_text(pa.array([" 多喝水\n"])).to_pylist() == ["多喝水"]
+
+
+def test_clean_batch_filters_and_maps():
+    created = datetime(2024, 1, 1)
+    table = pa.table({
+        "questions": [["发热怎么办"], [""], ["长" * 300], []],
+        "answers": [["多喝水\n注意休息"], ["无问题"], ["回答"], ["没有问题的回答"]],
+    })
+    out = clean_batch(table, "kg", created)
+    rows = out.to_pylist()
+    assert len(rows) == 2
+    assert rows[0] == {
+        "title": "发热怎么办",
+        "content_text": "问题:发热怎么办\n回答:多喝水 注意休息",
+        "source_url": "huatuo://kg",
+        "created_at": created,
+        "source_type": "kg",
+    }
+    # title 截断到列长度，正文保留完整问题
+    assert len(rows[1]["title"]) == TITLE_MAX
+    assert rows[1]["content_text"].startswith("问题:" + "长" * 300)
+
+
+def test_core_writer_inserts_into_sqlite():
+    engine = create_engine("sqlite://")
+    MedicalKnowledge.__table__.create(bind=engine)
+    table = pa.table({"question": ["头痛", "咳嗽"], "answer": ["休息", "多喝水"]})
+    CoreWriter(engine).write(clean_batch(table, "ency", datetime(2024, 1, 1)))
+    with engine.connect() as conn:
+        rows = conn.execute(select(MedicalKnowledge.title, MedicalKnowledge.source_type)
+                            .order_by(MedicalKnowledge.doc_id)).all()
+    assert [tuple(r) for r in rows] == [("头痛", "ency"), ("咳嗽", "ency")]
@@ -0,0 +1,87 @@
+# tests/test_chunker.py
+
+import pytest
+
+from backend.rag.chunker import CHAR_CHUNK_SIGNATURE, TokenChunker, chunk_signature, chunk_text_chars, stable_chunk_id
+
+
+class PairTokenizer:
+    """每两个字符一个 token（空白单独跳过），返回 offset_mapping，模拟 fast tokenizer"""
+
+    def _offsets(self, text):
+        offsets, i = [], 0
+        while i < len(text):
+            if text[i].isspace():
+                i += 1
+                continue
+            j = min(i + 2, len(text))
+            if text[j - 1].isspace():
+                j -= 1
+            offsets.append((i, j))
+            i = j
+        return offsets
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False, **_):
+        offsets = [self._offsets(t) for t in texts]
+        out = {"input_ids": [[0] * len(o) for o in offsets]}
+        if return_offsets_mapping:
+            out["offset_mapping"] = offsets
+        return out
+
+
+def test_chunks_respect_token_budget_and_overlap():
+    text = "".join(f"第{i:02d}句内容比较长一些。" for i in range(40))
+    tok = PairTokenizer()
+    chunker = TokenChunker(tok, chunk_tokens=30, overlap_tokens=5)
+    chunks = chunker.chunk(text)
+    assert len(chunks) > 1
+    assert [i for i, _ in chunks] == list(range(len(chunks)))
+    counts = chunker.token_counts([c for _, c in chunks])
+    assert counts.max() <= 30
+    for (_, a), (_, b) in zip(chunks, chunks[1:]):
+        assert a.endswith("。")          # 在句末断开
+        assert b[:4] in a               # 与上一块有重叠
+    # 所有块拼起来覆盖全文
+    assert chunks[0][1].startswith("第00句") and chunks[-1][1].endswith("第39句内容比较长一些。")
+
+
+def test_hard_cut_without_punctuation_and_batch_consistency():
+    tok = PairTokenizer()
+    chunker = TokenChunker(tok, chunk_tokens=20, overlap_tokens=4)
+    long = "无标点" * 60
+    short = "很短"
+    many = chunker.chunk_many([long, short, ""])
+    assert many[0] == chunker.chunk(long)
+    assert all(len(c) <= 40 for _, c in many[0])
+    assert many[1] == [] and many[2] == []  # 短于 min_chars 的块丢弃
+
+
+def test_stable_ids_survive_prefix_insertion():
+    tok = PairTokenizer()
+    chunker = TokenChunker(tok, chunk_tokens=30, overlap_tokens=0)
+    body = "".join(f"第{i:02d}句内容比较长一些。" for i in range(40))
+    before = {stable_chunk_id("kg", "t", c) for _, c in chunker.chunk(body)}
+    after = {stable_chunk_id("kg", "t", c) for _, c in chunker.chunk("新增一句。" * 12 + body)}
+    assert before & after
+    assert stable_chunk_id("kg", "t", "x") != stable_chunk_id("ency", "t", "x")
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        TokenChunker(PairTokenizer(), chunk_tokens=10, overlap_tokens=10)
+
+
+def test_char_chunker_unchanged():
+    text = "句子。" * 300
+    chunks = chunk_text_chars(text)
+    assert all(len(c) <= 500 + 80 for _, c in chunks)
+    assert chunks[0][0] == 0
+
+
+def test_chunk_signature_tracks_config():
+    tok = PairTokenizer()
+    assert chunk_signature(None) == CHAR_CHUNK_SIGNATURE
+    a = chunk_signature(TokenChunker(tok, chunk_tokens=8, overlap_tokens=2))
+    assert a != CHAR_CHUNK_SIGNATURE
+    assert a == chunk_signature(TokenChunker(tok, chunk_tokens=8, overlap_tokens=2))
+    assert a != chunk_signature(TokenChunker(tok, chunk_tokens=8, overlap_tokens=3))
@@ -0,0 +1,68 @@
+# tests/test_context_packer.py
+
+from backend.nodes.context_packer import ContextPacker, dedupe_hits, hits_from_context
+
+
+class CharTokenizer:
+    """每个字符一个 token"""
+
+    def __call__(self, texts, add_special_tokens=False):
+        return {"input_ids": [[ord(c) for c in t] for t in texts]}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(i) for i in ids)
+
+
+def hit(doc, score, title="t", chunk=0):
+    return {"id": f"{title}-{chunk}", "document": doc, "score": score, "title": title,
+            "source_type": "kg", "chunk_index": chunk}
+
+
+def test_dedupe_removes_contained_and_overlap():
+    a = "甲" * 50 + "乙" * 30
+    b = "乙" * 30 + "丙" * 40  # 与 a 的结尾重叠 30 字
+    hits = [hit(a, 1.0), hit(a[10:40], 0.9), hit(b, 0.8, chunk=1)]
+    out = dedupe_hits(hits)
+    assert [h["document"] for h in out] == [a, "丙" * 40]
+    assert hits[2]["document"] == b  # 不修改传入的命中
+
+
+def test_pack_prioritizes_score_and_respects_budget():
+    packer = ContextPacker(CharTokenizer(), {"realtime_advice": 100}, transcript_share=0.5,
+                           min_passage_tokens=10)
+    transcript = "\n".join(f"第{i}句话" for i in range(20))
+    hits = [hit("低" * 40, 0.1, "low"), hit("高" * 40, 0.9, "high"), hit("中" * 40, 0.5, "mid")]
+    t, ctx, report = packer.pack("realtime_advice", transcript, hits)
+
+    # 实时建议保留最近的话
+    assert t.endswith("第19句话") and "第0句话" not in t
+    assert ctx.startswith("[kg] high")
+    assert "低" not in ctx
+    assert report["tokens_after"] <= 100
+    assert report["tokens_saved"] == report["tokens_before"] - report["tokens_after"] > 0
+    assert packer.stats()["requests"] == 1
+
+
+def test_report_mode_keeps_transcript_head():
+    packer = ContextPacker(CharTokenizer(), {"final_report": 60}, transcript_share=1.0)
+    transcript = "\n".join(f"第{i}句话" for i in range(30))
+    t, _, _ = packer.pack("final_report", transcript, [])
+    lines = t.split("\n")
+    assert lines[0] == "第0句话" and lines[-1] == "第29句话" and "……" in lines
+
+
+def test_single_long_line_is_truncated_and_counted():
+    packer = ContextPacker(CharTokenizer(), {"realtime_advice": 50}, transcript_share=1.0)
+    transcript = "甲" * 20 + "乙" * 80
+    t, ctx, report = packer.pack("realtime_advice", transcript, [hit("丙" * 20, 0.9)])
+    assert t == "乙" * 50  # 保留这一句的末尾
+    assert ctx == ""
+    assert report["tokens_after"] == 50
+    assert report["tokens_saved"] == report["tokens_before"] - 50
+    assert packer.stats()["tokens_after"] == 50
+
+
+def test_context_lines_fallback_keeps_order():
+    hits = hits_from_context("[kg] a → x\n\n[kg] b → y")
+    assert [h["document"] for h in hits] == ["[kg] a → x", "[kg] b → y"]
+    assert hits[0]["score"] > hits[1]["score"]
@@ -0,0 +1,62 @@
+# tests/test_embedding_batcher.py
+
+import threading
+import numpy as np
+
+from backend.nodes.embedding_batcher import EmbeddingBatcher
+
+
+def fake_encode(texts):
+    """用文本长度当作向量，便于校验分发顺序"""
+    return np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+
+
+def test_concurrent_requests_are_merged():
+    """窗口内的并发请求合并成一次 encode，结果按调用方分发"""
+    calls = []
+
+    def encode(texts):
+        calls.append(len(texts))
+        return fake_encode(texts)
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=64, max_wait_ms=50)
+    results = {}
+
+    def worker(k):
+        results[k] = batcher.encode(["x" * k, "y" * k])
+
+    threads = [threading.Thread(target=worker, args=(k,)) for k in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for k, vecs in results.items():
+        assert vecs.shape == (2, 2)
+        assert vecs[0][0] == k and vecs[1][0] == k
+    assert sum(calls) == 16
+    assert len(calls) < 8
+    assert batcher.stats()["requests"] == 8
+
+
+def test_error_is_propagated():
+    """encode 失败时异常抛回调用方"""
+    def encode(texts):
+        raise RuntimeError("boom")
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=4, max_wait_ms=1)
+    try:
+        batcher.encode(["a"])
+        assert False, "应抛出异常"
+    except RuntimeError as e:
+        assert "boom" in str(e)
+
+
+def test_row_count_mismatch_fails_whole_batch():
+    """encode 少返回了行时整批报错，不按偏移把错位的向量分给调用方"""
+    batcher = EmbeddingBatcher(lambda texts: fake_encode(texts)[:-1], max_batch_size=4, max_wait_ms=1)
+    try:
+        batcher.encode(["a", "b"])
+        assert False, "应抛出异常"
+    except ValueError as e:
+        assert "1 行" in str(e)
@@ -0,0 +1,64 @@
+# tests/test_embedding_cache.py
+
+import numpy as np
+
+from backend.nodes.embedding_cache import EmbeddingCache, cache_key, normalize_text
+
+
+def test_normalize_text():
+    assert normalize_text("  发烧\t两天 ") == normalize_text("发烧 两天")
+    assert normalize_text("ＡＢＣ") == "ABC"
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    """内存层命中、磁盘层在新实例中仍可命中"""
+    cache = EmbeddingCache("m", memory_items=2, disk_dir=str(tmp_path), disk_items=8)
+    assert cache.get_many(["a", "b"]) == [None, None]
+    cache.put_many(["a", "b"], np.eye(2, 4, dtype=np.float32))
+    hit = cache.get_many(["a"])[0]
+    assert np.allclose(hit, [1, 0, 0, 0])
+    cache.flush()
+
+    reopened = EmbeddingCache("m", memory_items=2, disk_dir=str(tmp_path), disk_items=8)
+    vec = reopened.get_many(["b"])[0]
+    assert np.allclose(vec, [0, 1, 0, 0])
+    stats = reopened.stats()
+    assert stats["disk_hits"] == 1 and stats["misses"] == 0
+
+
+def test_size_cap_evicts_least_recent(tmp_path):
+    """超过容量时淘汰最久未使用的条目"""
+    cache = EmbeddingCache("m", memory_items=1, disk_dir=str(tmp_path), disk_items=2)
+    vecs = np.ones((3, 4), dtype=np.float32)
+    cache.put_many(["a"], vecs[:1])
+    cache.put_many(["b"], vecs[1:2])
+    cache.get_many(["a"])           # a 更新为最近使用
+    cache.put_many(["c"], vecs[2:])  # 淘汰 b
+    assert cache.get_many(["b"])[0] is None
+    assert cache.get_many(["a"])[0] is not None
+    assert cache.stats()["disk_evictions"] == 1
+
+
+def test_second_instance_on_same_dir_is_read_only(tmp_path):
+    """同一目录只有一个写入者；只读实例不分配槽位，槽位被改写后不会返回别的键的向量"""
+    writer = EmbeddingCache("m", memory_items=1, disk_dir=str(tmp_path), disk_items=2)
+    vecs = np.eye(3, 4, dtype=np.float32)
+    writer.put_many(["a", "b"], vecs[:2])
+    writer.flush()
+
+    reader = EmbeddingCache("m", memory_items=1, disk_dir=str(tmp_path), disk_items=2)
+    assert writer.stats()["disk_writable"] and not reader.stats()["disk_writable"]
+    reader.put_many(["x"], vecs[2:])  # 只进内存层
+    assert writer.get_many(["x"])[0] is None
+
+    # 写入者淘汰最久未用的 a，在它的槽位写入 c：只读实例的槽位表已过期，核对键后判为未命中
+    writer.put_many(["c"], vecs[2:])
+    assert reader.get_many(["a"])[0] is None
+    assert np.allclose(reader._disk.get(cache_key("m", "b")), vecs[1])
+
+
+def test_model_name_is_part_of_key(tmp_path):
+    a = EmbeddingCache("m1", disk_dir=None)
+    a.put_many(["x"], np.ones((1, 4), dtype=np.float32))
+    b = EmbeddingCache("m2", disk_dir=None)
+    assert b.get_many(["x"])[0] is None
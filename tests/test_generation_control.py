@@ -0,0 +1,195 @@
+# tests/test_generation_control.py
+
+import threading
+
+import torch
+
+from backend.nodes.generation_control import (
+    CancelStoppingCriteria, CompletionStoppingCriteria, GenerationControl, StopChecker, SuppressTokensProcessor,
+    visible_prefix,
+)
+from backend.nodes.llm_doctor_node import IncrementalCleaner, LLMDoctorAdviceNode
+
+EOS = 0
+
+
+class CharTokenizer:
+    """每个字符一个 token（id 为码位），0 为结束符；<think> / </think> 各占一个 id"""
+
+    SPECIAL = {1: "<think>", 2: "</think>"}
+
+    def get_vocab(self):
+        return {v: k for k, v in self.SPECIAL.items()}
+
+    def encode(self, text):
+        ids, i = [], 0
+        while i < len(text):
+            for k, v in self.SPECIAL.items():
+                if text.startswith(v, i):
+                    ids.append(k)
+                    i += len(v)
+                    break
+            else:
+                ids.append(ord(text[i]))
+                i += 1
+        return ids
+
+    def __call__(self, text, add_special_tokens=False):
+        return {"input_ids": self.encode(text)}
+
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(self.SPECIAL.get(i, "" if i == EOS else chr(i)) for i in ids)
+
+
+def make_node():
+    return LLMDoctorAdviceNode.__new__(LLMDoctorAdviceNode)
+
+
+def feed_until_stop(checker, tok, text):
+    for n, t in enumerate(tok.encode(text), 1):
+        if checker.feed(t):
+            return n
+    return None
+
+
+def test_visible_prefix_hides_unfinished_blocks():
+    assert visible_prefix("<think>想一想</think>多喝水") == "多喝水"
+    assert visible_prefix("多喝水<think>还在想") == "多喝水"
+    assert visible_prefix("建议{\"a\": 1") == "建议"
+
+
+def test_realtime_stops_after_first_sentence():
+    node, tok = make_node(), CharTokenizer()
+    checker = StopChecker(tok, node._realtime_end, ignore_ids={EOS})
+    raw = "<think>患者发热</think>建议多喝水，注意休息。如果持续发热请就医。"
+    n = feed_until_stop(checker, tok, raw)
+    assert checker.stopped
+    assert checker.result().endswith("注意休息。")
+    assert n < len(tok.encode(raw))
+    assert node._clean_realtime(checker.result()) == node._clean_realtime(raw)
+
+
+def test_realtime_does_not_stop_on_cleaned_away_sentence():
+    node, tok = make_node(), CharTokenizer()
+    checker = StopChecker(tok, node._realtime_end)
+    # 第一行会被"以下…"规则整行清掉，不能在这里停
+    assert feed_until_stop(checker, tok, "以下是建议。\n") is None
+    assert feed_until_stop(checker, tok, "多喝温水。") is not None
+    assert node._clean_realtime(checker.result()) == "多喝温水"
+
+
+def test_report_stops_at_end_of_advice():
+    node, tok = make_node(), CharTokenizer()
+    report = ("【主诉】：发热两天伴咳嗽，最高体温38度。\n"
+              "【诊断】：急性上呼吸道感染，病毒感染可能性大。\n"
+              "【处方】：对乙酰氨基酚 0.5g，发热时口服，每日不超过4次。\n"
+              "【医嘱】：多饮水，注意休息，三天不退热请复诊。\n\n")
+    raw = report + "【备注】：以上仅供参考，祝早日康复。" * 20
+    checker = StopChecker(tok, node._report_end, ignore_ids={EOS})
+    n = feed_until_stop(checker, tok, raw)
+    assert checker.stopped and n <= len(report) + 1  # 读到下一个"【"即停止
+    assert node._clean_report(checker.result()) == node._clean_report(raw)
+
+    # 医嘱还没出现前三段时不停
+    early = StopChecker(tok, node._report_end)
+    assert feed_until_stop(early, tok, "【医嘱】：多休息。\n\n【主诉】：发热。") is None
+
+
+def test_report_keeps_advice_after_blank_line():
+    node, tok = make_node(), CharTokenizer()
+    raw = ("【主诉】：发热两天。\n【诊断】：急性上呼吸道感染。\n【处方】：对乙酰氨基酚 0.5g。\n"
+           "【医嘱】：1. 多饮水，注意休息。\n\n2. 三天不退热请复诊。\n\n【备注】：祝早日康复。")
+    checker = StopChecker(tok, node._report_end, ignore_ids={EOS})
+    assert feed_until_stop(checker, tok, raw) is not None
+    clean = node._clean_report(checker.result())
+    assert "三天不退热请复诊" in clean
+    assert clean == node._clean_report(raw)
+
+
+def test_stopping_criteria_and_suppression():
+    node, tok = make_node(), CharTokenizer()
+    prompt = [ord("问")] * 3
+    criteria = CompletionStoppingCriteria(lambda: StopChecker(tok, node._realtime_end), len(prompt))
+    ids = list(prompt)
+    stopped_at = None
+    for t in tok.encode("多喝水。再说一句。"):
+        ids.append(t)
+        if criteria(torch.tensor([ids]), None)[0]:
+            stopped_at = len(ids) - len(prompt)
+            break
+    assert stopped_at == 4  # 生成到"。"即停止，不再解码后一句
+
+    scores = torch.zeros((1, 10))
+    out = SuppressTokensProcessor([1, 2])(torch.tensor([[5]]), scores)
+    assert torch.isinf(out[0, 1]) and torch.isinf(out[0, 2]) and out[0, 3] == 0
+
+
+def test_stopping_criteria_stops_report_before_closing_remarks():
+    node, tok = make_node(), CharTokenizer()
+    report = ("【主诉】：发热两天。\n【诊断】：急性上呼吸道感染。\n【处方】：对乙酰氨基酚 0.5g。\n"
+              "【医嘱】：1. 多饮水，注意休息。\n\n2. 三天不退热请复诊。")
+    raw = report + "\n\n祝您早日康复，以上建议仅供参考。" * 10
+    prompt = [ord("问")] * 3
+    criteria = CompletionStoppingCriteria(lambda: StopChecker(tok, node._report_end, ignore_ids={EOS}), len(prompt))
+    ids = list(prompt)
+    stopped_at = None
+    for t in tok.encode(raw):
+        ids.append(t)
+        if criteria(torch.tensor([ids]), None)[0]:
+            stopped_at = len(ids) - len(prompt)
+            break
+    # 空行后出现结束语即停止，不再生成后面的客套话
+    assert stopped_at == len(report) + 3
+    result = criteria.checkers[0].result()
+    assert result == report
+    assert node._clean_report(result) == node._clean_report(raw)
+    assert node._clean_report(raw).endswith("三天不退热请复诊。")
+
+
+def test_realtime_stops_at_length_cap():
+    node, tok = make_node(), CharTokenizer()
+    checker = StopChecker(tok, node._realtime_end)
+    raw = "多" * 80 + "。"
+    assert feed_until_stop(checker, tok, raw) == 50
+    assert node._clean_realtime(checker.result()) == node._clean_realtime(raw)
+
+
+def test_report_counts_generated_and_kept():
+    tok = CharTokenizer()
+    control = GenerationControl(tok, {}, eos_ids=[EOS])
+    assert control.suppress_ids == [1, 2]
+    out = control.report("realtime_advice", tok.encode("多喝水。再说一句。") + [EOS], "多喝水",
+                         stopped=False, max_new_tokens=80)
+    assert out == {"generated_tokens": 10, "kept_tokens": 3, "discarded_tokens": 7, "stop_reason": "eos"}
+    control.report("realtime_advice", [5] * 80, "x", stopped=False, max_new_tokens=80)
+    stats = control.stats()["modes"]["realtime_advice"]
+    assert stats["requests"] == 2 and stats["stop_reasons"] == {"eos": 1, "max_new_tokens": 1}
+
+
+def test_cancel_stops_whole_batch():
+    cancel = threading.Event()
+    criteria = CancelStoppingCriteria(cancel)
+    ids = torch.ones((2, 5), dtype=torch.long)
+    assert not criteria(ids, None).any()
+    cancel.set()
+    assert criteria(ids, None).all()
+
+    control = GenerationControl(CharTokenizer(), {}, eos_ids=[EOS])
+    kwargs, _ = control.generate_kwargs("final_report", 5, cancel=cancel)
+    assert any(isinstance(c, CancelStoppingCriteria) for c in kwargs["stopping_criteria"])
+
+
+def test_incremental_cleaner_matches_clean_report():
+    node = make_node()
+    raw = ("<think>先整理症状</think>好的，报告如下：\n"
+           "【主诉】：**发热**两天伴咳嗽，最高体温38度。\n"
+           "【诊断】：急性上呼吸道感染。\n"
+           "【处方】：对乙酰氨基酚 0.5g，发热时口服。\n"
+           "【医嘱】：多饮水，注意休息。\n三天不退热请复诊。\n\n【备注】：仅供参考。")
+    expected = node._clean_report(raw)
+    for size in (1, 3, 7):
+        cleaner = IncrementalCleaner(node, "final_report")
+        deltas = [cleaner.feed(raw[i:i + size]) for i in range(0, len(raw), size)]
+        streamed = "".join(deltas)
+        assert len(streamed) > len(expected) // 2  # 生成过程中已经输出了大部分内容
+        assert streamed + cleaner.rest(cleaner.finish()) == expected
@@ -0,0 +1,62 @@
+# tests/test_index_manifest.py
+
+from backend.rag.index_manifest import IndexManifest, chunk_hash
+
+
+def chunk(cid, doc, title="t"):
+    return {"id": cid, "doc": doc, "meta": {"title": title, "chunk_index": 0}}
+
+
+def test_delta_against_manifest(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "m.sqlite"))
+    changed = manifest.diff([chunk("a", "甲"), chunk("b", "乙"), chunk("c", "丙")])
+    assert manifest.delta["new"] == 3 and not manifest.unseen_ids()
+    manifest.record((c["id"], c["hash"]) for c in changed)
+
+    manifest.begin_scan()
+    changed = manifest.diff([chunk("a", "甲"), chunk("b", "乙乙")]) + manifest.diff([chunk("d", "丁")])
+    assert sorted(c["id"] for c in changed) == ["b", "d"]
+    assert manifest.unseen_ids() == ["c"]
+    d = manifest.delta
+    assert (d["new"], d["changed"], d["unchanged"]) == (1, 1, 1)
+
+
+def test_resume_after_partial_build(tmp_path):
+    path = str(tmp_path / "m.sqlite")
+    chunks = [chunk(str(i), f"文档{i}") for i in range(10)]
+    manifest = IndexManifest(path)
+    changed = manifest.diff(chunks)
+    # 只提交了前 4 条就被中断
+    manifest.record((c["id"], c["hash"]) for c in changed[:4])
+    manifest.close()
+
+    resumed = IndexManifest(path)
+    changed = resumed.diff(chunks)
+    assert [c["id"] for c in changed] == [str(i) for i in range(4, 10)]
+    assert resumed.delta["unchanged"] == 4
+
+
+def test_partial_scan_deletes_nothing(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "m.sqlite"))
+    changed = manifest.diff([chunk(str(i), f"文档{i}") for i in range(10)])
+    manifest.record((c["id"], c["hash"]) for c in changed)
+
+    # 只读了前 2 条（--limit）：其余 chunk 没见到，但不能当作已删除
+    manifest.begin_scan(partial=True)
+    manifest.diff([chunk("0", "文档0"), chunk("1", "文档1")])
+    assert manifest.unseen_ids() == []
+    manifest.begin_scan()
+    manifest.diff([chunk("0", "文档0"), chunk("1", "文档1")])
+    assert len(manifest.unseen_ids()) == 8
+
+
+def test_duplicate_ids_in_one_scan(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "m.sqlite"))
+    changed = manifest.diff([chunk("a", "甲"), chunk("a", "乙")])
+    assert [c["doc"] for c in changed] == ["甲"]
+    assert manifest.delta["duplicates"] == 1
+
+
+def test_metadata_change_counts_as_change():
+    assert chunk_hash("x", {"title": "a"}) != chunk_hash("x", {"title": "b"})
+    assert chunk_hash("x", {"a": 1, "b": 2}) == chunk_hash("x", {"b": 2, "a": 1})
@@ -0,0 +1,54 @@
+# tests/test_inference_executor.py
+
+import asyncio
+import threading
+import pytest
+
+from backend.serving.inference_executor import (
+    InferenceLane, QueueFullError, ExecutorUnavailableError,
+)
+
+
+def test_lane_runs_and_counts():
+    """正常执行并统计完成数"""
+    lane = InferenceLane("t", max_workers=1, max_pending=2, deadline=5)
+    try:
+        assert asyncio.run(lane.run(lambda x: x * 2, 21)) == 42
+        assert lane.stats()["completed"] == 1
+        assert lane.stats()["pending"] == 0
+    finally:
+        lane.shutdown()
+
+
+def test_lane_rejects_when_full():
+    """排队已满时直接拒绝"""
+    lane = InferenceLane("t", max_workers=1, max_pending=1, deadline=5)
+    gate = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(lane.run(gate.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(QueueFullError):
+            await lane.run(lambda: None)
+        gate.set()
+        await first
+
+    try:
+        asyncio.run(scenario())
+        assert lane.stats()["rejected"] == 1
+    finally:
+        gate.set()
+        lane.shutdown()
+
+
+def test_lane_deadline():
+    """超过截止时间返回不可用"""
+    lane = InferenceLane("t", max_workers=1, max_pending=2, deadline=0.05)
+    gate = threading.Event()
+    try:
+        with pytest.raises(ExecutorUnavailableError):
+            asyncio.run(lane.run(gate.wait))
+        assert lane.stats()["timeouts"] == 1
+    finally:
+        gate.set()
+        lane.shutdown()
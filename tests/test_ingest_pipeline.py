@@ -0,0 +1,93 @@
+# tests/test_ingest_pipeline.py
+
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.rag.ingest_pipeline import StreamPipeline, batches, embed_length_sorted, length_sorted_batches
+
+
+def test_stages_preserve_order_and_flush_tail():
+    written = []
+    pipe = (StreamPipeline(range(103), queue_size=2)
+            .stage("double", lambda items: (x * 2 for x in items))
+            .stage("batch", lambda items: batches(items, 10))
+            .stage("write", lambda items: (written.extend(b) or len(b) for b in items)))
+    stats = pipe.run()
+    assert written == [x * 2 for x in range(103)]
+    assert stats["batch"]["in"] == 103 and stats["batch"]["out"] == 11
+    assert stats["write"]["queue_max"] <= 2
+
+
+def test_bounded_queue_limits_read_ahead():
+    produced = []
+    lead = []
+
+    def source():
+        for i in range(200):
+            produced.append(i)
+            yield i
+
+    def slow(items):
+        for x in items:
+            time.sleep(0.001)
+            lead.append(len(produced) - x)
+            yield x
+
+    StreamPipeline(source(), queue_size=4).stage("slow", slow).run()
+    # 源最多领先消费者：队列容量 + 各自手里的一项
+    assert max(lead) <= 4 + 2
+
+
+def test_stage_error_propagates():
+    def boom(items):
+        for x in items:
+            if x == 5:
+                raise ValueError("bad item")
+            yield x
+
+    with pytest.raises(ValueError, match="bad item"):
+        StreamPipeline(range(100), queue_size=2).stage("boom", boom).run()
+
+
+def test_length_sorted_batches():
+    texts = ["x" * n for n in (5, 1, 9, 3, 7, 2, 8)]
+    out = length_sorted_batches(texts, 3)
+    assert [len(b) for b in out] == [3, 3, 1]
+    lengths = [len(texts[i]) for b in out for i in b]
+    assert lengths == sorted(lengths)
+    assert sorted(i for b in out for i in b) == list(range(len(texts)))
+
+
+class FakePoolEncoder:
+    """多个线程并发编码、完成顺序随机；map 按提交顺序返回，向量为 [文本长度, 文本首字符码位]"""
+
+    def __init__(self, workers=3):
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.seen = []
+
+    def _encode(self, texts):
+        self.seen.append(texts)
+        time.sleep(random.random() * 0.01)
+        return [[len(t), ord(t[0])] for t in texts]
+
+    def map(self, batches):
+        return self.pool.map(self._encode, batches)
+
+
+def test_embed_length_sorted_restores_input_order():
+    random.seed(0)
+    chunks = [{"id": i, "doc": chr(0x4e00 + i) * random.randint(1, 40)} for i in range(50)]
+    encoder = FakePoolEncoder()
+    out = embed_length_sorted(chunks, encoder.map, 8)
+    assert [c["id"] for c in out] == list(range(50))
+    assert all(c["emb"] == [len(c["doc"]), ord(c["doc"][0])] for c in out)
+    # 每批送进编码器的文本按长度排好序
+    assert all(len(b[0]) <= len(b[-1]) for b in encoder.seen) and len(encoder.seen) == 7
+
+
+def test_embed_length_sorted_rejects_wrong_row_count():
+    with pytest.raises(ValueError):
+        embed_length_sorted([{"doc": "a"}, {"doc": "b"}], lambda bs: [[[0.0]] for _ in bs], 2)
@@ -0,0 +1,92 @@
+# tests/test_lifecycle.py
+
+from backend.serving.lifecycle import ModelLoader
+
+
+class StubRegistry:
+    """llm 前 fail_times 次构建失败，其余资源直接返回占位对象"""
+
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.llm_calls = 0
+
+    def embedder(self):
+        return "embed"
+
+    def rag(self):
+        return "rag"
+
+    def llm(self):
+        self.llm_calls += 1
+        if self.llm_calls <= self.fail_times:
+            raise RuntimeError("显存不足")
+        return "llm"
+
+
+class StubLoader(ModelLoader):
+    """不初始化数据库、不构建图、不预热"""
+
+    def _init_db(self):
+        pass
+
+    def _build_graphs(self):
+        self.realtime_agent = self.summary_agent = self.summary_streamer = object()
+
+    def _warmup(self):
+        pass
+
+
+def wait_done(loader):
+    loader._thread.join(5)
+    assert not loader._thread.is_alive()
+
+
+def test_ready_after_transient_failure():
+    loader = StubLoader(StubRegistry(fail_times=1), max_attempts=3, retry_delay=0)
+    assert loader.state == "pending" and not loader.ready
+    loader.start()
+    assert loader.wait(5)
+    stats = loader.stats()
+    assert stats["state"] == "ready" and stats["attempts"] == 2 and stats["error"] is None
+    assert loader.nodes == {"embed": "embed", "rag": "rag", "llm": "llm"}
+
+
+def test_failed_after_all_attempts_then_restart():
+    registry = StubRegistry(fail_times=2)
+    loader = StubLoader(registry, max_attempts=2, retry_delay=0)
+    loader.start()
+    wait_done(loader)
+    stats = loader.stats()
+    assert stats["state"] == "failed" and stats["attempts"] == 2
+    assert "显存不足" in stats["error"] and not loader.ready
+
+    # 重新开始一轮：这次成功
+    loader.start()
+    assert loader.wait(5) and loader.state == "ready"
+    loader.start()  # 已就绪时不会再加载
+    assert registry.llm_calls == 3
+
+
+def test_health_endpoints(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from backend import main
+
+    loader = StubLoader(StubRegistry(fail_times=1), max_attempts=1, retry_delay=0)
+    monkeypatch.setattr(main, "loader", loader)
+    client = TestClient(main.app)  # 不进入 lifespan，加载由测试控制
+
+    assert client.get("/healthz").json() == {"ok": True}
+    res = client.get("/readyz")
+    assert res.status_code == 503 and res.json()["detail"]["state"] == "pending"
+
+    loader.start()
+    wait_done(loader)
+    assert client.get("/healthz").status_code == 200
+    res = client.get("/readyz")
+    assert res.status_code == 503 and res.json()["detail"]["state"] == "failed"
+
+    # 失败后的探测触发新一轮加载
+    assert loader.wait(5)
+    res = client.get("/readyz")
+    assert res.status_code == 200 and res.json()["state"] == "ready"
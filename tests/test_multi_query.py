@@ -0,0 +1,53 @@
+# tests/test_multi_query.py
+
+import numpy as np
+
+from backend.rag.multi_query import split_windows, fuse_results, mmr
+
+
+def test_split_windows_overlap():
+    transcript = "\n".join(f"患者：第{i}句描述症状" for i in range(10))
+    windows = split_windows(transcript, window_chars=30, overlap_lines=1)
+    assert len(windows) > 1
+    # 相邻窗口重叠一行
+    assert windows[0].split("\n")[-1] == windows[1].split("\n")[0]
+    assert all(len(w) <= 30 for w in windows)
+
+
+def test_split_windows_long_line():
+    windows = split_windows("咳" * 70, window_chars=30, overlap_lines=0)
+    assert [len(w) for w in windows] == [30, 30, 10]
+
+
+def test_split_windows_long_lines_stay_within_limit():
+    transcript = "\n".join(["咳" * 25, "热" * 25, "痛" * 10, "晕" * 10])
+    windows = split_windows(transcript, window_chars=30, overlap_lines=1)
+    assert all(len(w.replace("\n", "")) <= 30 for w in windows)
+    # 重叠行加上新一行超过 30 字时不带重叠行（旧实现会得到 50、35 字的窗口）
+    assert windows == ["咳" * 25, "热" * 25, "痛" * 10 + "\n" + "晕" * 10]
+
+
+def test_split_windows_counts_separators():
+    lines = [f"{i}" + "咳" * (i % 4) for i in range(200)]
+    windows = split_windows("\n".join(lines), window_chars=20, overlap_lines=2)
+    # 大量短行时换行符也计入窗口长度
+    assert all(len(w) <= 20 for w in windows)
+    assert {line for w in windows for line in w.split("\n")} == set(lines)
+
+
+def test_fuse_dedup_and_mmr():
+    e = np.eye(3, dtype=np.float32)
+    results = {
+        "ids": [["a", "b"], ["a", "c"]],
+        "documents": [["A", "B"], ["A", "C"]],
+        "metadatas": [[{"t": 1}, {"t": 2}], [{"t": 1}, {"t": 3}]],
+        "distances": [[0.1, 0.4], [0.2, 0.5]],
+        "embeddings": [[e[0], e[0]], [e[0], e[2]]],
+    }
+    hits = fuse_results(results)
+    assert [h["id"] for h in hits][0] == "a"
+    assert len(hits) == 3
+    assert hits[0]["windows"] == 2
+    # b 与 a 向量相同，MMR 应优先选择更多样的 c
+    picked = mmr(hits, 2, lambda_mult=0.5)
+    assert [h["id"] for h in picked] == ["a", "c"]
@@ -0,0 +1,64 @@
+# tests/test_prefix_cache.py
+
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+
+from backend.nodes.prefix_cache import PrefixKVCache
+
+
+class CharTokenizer:
+    """每个字符一个 token；merge=True 时 "ab" 合成一个 token，模拟 BPE 在前后缀交界处的合并"""
+
+    def __init__(self, merge=False):
+        self.merge = merge
+
+    def __call__(self, text, return_tensors=None, add_special_tokens=True):
+        ids, i = [], 0
+        while i < len(text):
+            if self.merge and text.startswith("ab", i):
+                ids.append(1)
+                i += 2
+            else:
+                ids.append(2 + ord(text[i]) % 60)
+                i += 1
+        return {"input_ids": torch.tensor([ids])}
+
+
+def tiny_model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=64, n_positions=128, n_embd=32, n_layer=2, n_head=2)
+    return GPT2LMHeadModel(config).eval()
+
+
+def greedy(model, **inputs):
+    with torch.no_grad():
+        out = model.generate(**inputs, max_new_tokens=8, do_sample=False, pad_token_id=0)
+    return out[0, inputs["input_ids"].shape[1]:].tolist()
+
+
+def test_cached_matches_uncached_greedy():
+    model, tok = tiny_model(), CharTokenizer()
+    cache = PrefixKVCache(model, tok, "cpu")
+    prefix = "你是一名医生助理，只输出一句建议。\n"
+    for suffix in ("【对话】发热两天", "【对话】咳嗽三天，夜间加重"):
+        input_ids, mask, past = cache.prepare(prefix, suffix)
+        assert past is not None
+        expected = greedy(model, input_ids=tok(prefix + suffix)["input_ids"])
+        assert greedy(model, input_ids=input_ids, attention_mask=mask, past_key_values=past) == expected
+
+    # 共享的前缀 cache 没有被 generate 改写
+    prefix_ids, stored = cache._entries[prefix]
+    assert stored.get_seq_length() == prefix_ids.shape[1]
+    stats = cache.stats()
+    assert (stats["builds"], stats["reuses"], stats["fallbacks"]) == (1, 1, 0)
+    assert stats["prefill_tokens_saved"] == prefix_ids.shape[1]
+
+
+def test_token_boundary_mismatch_falls_back():
+    model, tok = tiny_model(), CharTokenizer(merge=True)
+    cache = PrefixKVCache(model, tok, "cpu")
+    # 前缀以 a 结尾、后缀以 b 开头：整体分词时合成一个 token，与单独分词的前缀对不上
+    input_ids, _, past = cache.prepare("xya", "bc")
+    assert past is None
+    assert input_ids.tolist() == tok("xyabc")["input_ids"].tolist()
+    assert cache.stats()["fallbacks"] == 1
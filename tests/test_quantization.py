@@ -0,0 +1,44 @@
+# tests/test_quantization.py
+
+import numpy as np
+
+from backend.rag.quantization import bytes_per_vector, compress, dequantize_int8, quantize_int8, truncate
+from backend.rag.vector_store import NumpyVectorStore, write_numpy_index
+
+
+def random_vectors(n=50, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_truncate_renormalizes():
+    vecs = random_vectors()
+    out = truncate(vecs, 16)
+    assert out.shape == (50, 16)
+    assert np.allclose(np.linalg.norm(out, axis=1), 1.0, atol=1e-5)
+    assert np.allclose(truncate(vecs, None), vecs, atol=1e-6)
+
+
+def test_int8_roundtrip_error_small():
+    vecs = random_vectors()
+    codes, scales = quantize_int8(vecs)
+    assert codes.dtype == np.int8 and scales.shape == (50,)
+    assert np.abs(dequantize_int8(codes, scales) - vecs).max() < 0.01
+    assert bytes_per_vector(64, "int8") == 68
+    assert compress(vecs, 32, "float16")[0].dtype == np.float16
+
+
+def test_compressed_index_search(tmp_path):
+    vecs = random_vectors()
+    ids = [f"kg-{i}" for i in range(50)]
+    metas = [{"title": str(i), "source_type": "kg"} for i in range(50)]
+    for dtype in ("float32", "float16", "int8"):
+        out = tmp_path / dtype
+        write_numpy_index(str(out), ids, vecs, ids, metas, dim=32, dtype=dtype)
+        store = NumpyVectorStore(str(out))
+        assert store.stats()["dim"] == 32 and store.stats()["dtype"] == dtype
+        # 完整维度的查询向量会被截断到索引维度
+        res = store.query(vecs[[4, 9]], n_results=3, include_embeddings=True)
+        assert [r[0] for r in res["ids"]] == ["kg-4", "kg-9"]
+        assert res["embeddings"][0].shape == (3, 32)
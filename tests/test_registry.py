@@ -0,0 +1,88 @@
+# tests/test_registry.py
+
+import threading
+import time
+
+import pytest
+
+from backend.nodes.registry import NodeRegistry
+
+
+class FakeTensor:
+    def __init__(self, n, size=2):
+        self.n, self.size = n, size
+
+    def numel(self):
+        return self.n
+
+    def element_size(self):
+        return self.size
+
+
+class FakeModule:
+    def parameters(self):
+        return [FakeTensor(1024 * 1024), FakeTensor(1024 * 1024)]
+
+    def buffers(self):
+        return [FakeTensor(512 * 1024, 4)]
+
+
+class FakeStore:
+    def stats(self):
+        return {"backend": "numpy", "count": 3}
+
+
+def test_concurrent_get_builds_once():
+    registry = NodeRegistry()
+    built = []
+
+    def factory():
+        built.append(1)
+        time.sleep(0.05)  # 构建期间其他线程也在请求同一资源
+        return object()
+
+    barrier = threading.Barrier(8)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(registry._get("llm", factory))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(built) == 1
+    assert all(r is results[0] for r in results) and len(results) == 8
+    assert registry.loaded() == ["llm"]
+
+
+def test_failed_build_is_not_cached():
+    registry = NodeRegistry()
+
+    def broken():
+        raise RuntimeError("加载失败")
+
+    with pytest.raises(RuntimeError):
+        registry._get("rag", broken)
+    assert registry.loaded() == []
+    assert registry._get("rag", lambda: "rag") == "rag"
+
+
+def test_memory_footprint_reports_registered_nodes():
+    registry = NodeRegistry()
+    assert registry.memory_footprint()["loaded"] == []
+
+    embed = type("Embed", (), {"model": type("Onnx", (), {"nbytes": 3 * 1024 * 1024})()})()
+    llm = type("LLM", (), {"model": FakeModule()})()
+    rag = type("RAG", (), {"store": FakeStore(), "client_count": lambda self: 1})()
+    for name, node in (("embed", embed), ("llm", llm), ("rag", rag)):
+        registry._get(name, lambda node=node: node)
+
+    out = registry.memory_footprint()
+    assert out["loaded"] == ["embed", "llm", "rag"]
+    assert out["embedding_model_mb"] == 3.0
+    assert out["llm_mb"] == 6.0
+    assert out["vector_stores_open"] == 1 and out["vector_store"]["count"] == 3
+    assert out["rss_mb"] > 0
@@ -0,0 +1,36 @@
+# tests/test_result_cache.py
+
+import time
+
+from backend.serving.result_cache import MemoryResultBackend, ResultCache, result_key
+
+
+def test_key_depends_on_prompt_and_params():
+    k1 = result_key("qwen", "p", {"temperature": 0.2})
+    assert k1 == result_key("qwen", "p", {"temperature": 0.2})
+    assert k1 != result_key("qwen", "p", {"temperature": 0.3})
+    assert k1 != result_key("qwen", "p2", {"temperature": 0.2})
+
+
+def test_hit_rate_and_saved_time():
+    cache = ResultCache(MemoryResultBackend(ttl=60, max_items=4), ["realtime_advice"])
+    key = result_key("qwen", "p", {})
+    assert cache.get(key) is None
+    report = {"generated_tokens": 12, "kept_tokens": 8, "discarded_tokens": 4, "stop_reason": "complete"}
+    cache.put(key, "多喝水，注意休息", 1.5, report)
+    # 命中时连同生成报告一起返回
+    assert cache.get(key) == ("多喝水，注意休息", report)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["saved_generation_s"] == 1.5
+    assert cache.enabled_for("realtime_advice") and not cache.enabled_for("final_report")
+
+
+def test_ttl_and_capacity():
+    backend = MemoryResultBackend(ttl=0.05, max_items=2)
+    for k in ("a", "b", "c"):
+        backend.set(k, k, 0.1)
+    assert backend.get("a") is None
+    assert backend.get("c") == ("c", 0.1, {})
+    time.sleep(0.1)
+    assert backend.get("c") is None
@@ -0,0 +1,58 @@
+# tests/test_retrieval_cache.py
+
+import numpy as np
+
+from backend.rag.retrieval_cache import IndexVersionWatch, RetrievalCache, bump_index_version, query_key
+
+
+def test_near_identical_queries_share_key():
+    v = np.full((1, 8), 0.25, dtype=np.float32)
+    assert query_key(v, 3) == query_key(v + 1e-4, 3)
+    assert query_key(v, 3) != query_key(v, 5)
+    assert query_key(v, 3) != query_key(v + 0.1, 3)
+
+
+def test_invalidated_on_version_bump(tmp_path):
+    path = str(tmp_path / "index.version")
+    bump_index_version(path)
+    cache = RetrievalCache(check_interval=0, version_path=path)
+    cache.put("k", "context")
+    assert cache.get("k") == "context"
+    bump_index_version(path)
+    assert cache.get("k") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_memory_cap_evicts_lru(tmp_path):
+    cache = RetrievalCache(max_bytes=300, check_interval=1e9, version_path=str(tmp_path / "v"))
+    for i in range(5):
+        cache.put(f"k{i}", "x" * 60)
+    stats = cache.stats()
+    assert stats["bytes"] <= 300
+    assert stats["evictions"] > 0
+    assert cache.get("k4") is not None
+    assert cache.get("k0") is None
+
+
+def test_version_watch_throttles_reads(tmp_path):
+    path = str(tmp_path / "index.version")
+    first = bump_index_version(path)
+    watch = IndexVersionWatch(check_interval=1e9, version_path=path)
+    bump_index_version(path)
+    assert watch.current() == first  # 间隔内不重读
+    watch.check_interval = 0
+    assert watch.current() != first
+
+
+def test_cache_follows_shared_watch(tmp_path):
+    """与向量库共用同一个 IndexVersionWatch：watch 读到新版本时缓存随之作废"""
+    path = str(tmp_path / "index.version")
+    bump_index_version(path)
+    watch = IndexVersionWatch(check_interval=1e9, version_path=path)
+    cache = RetrievalCache(watch=watch)
+    cache.put("k", "context")
+    bump_index_version(path)
+    assert cache.get("k") == "context"  # watch 尚未重读
+    watch.check_interval = 0
+    assert cache.get("k") is None
+    assert cache.stats()["index_version"] == watch.current()
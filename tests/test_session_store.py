@@ -0,0 +1,56 @@
+# tests/test_session_store.py
+
+import threading
+import time
+
+from backend.serving.session_store import InMemorySessionStore, window_transcript, merge_contexts
+
+
+def test_append_and_get():
+    """按句追加话语、向量和上下文"""
+    store = InMemorySessionStore(ttl=60)
+    assert store.get("s1") is None
+    store.append("s1", ["我发烧两天了"], [[0.1, 0.2]], "[ency] 发热 → ...")
+    store.append("s1", ["还有点咳嗽"], [[0.3, 0.4]], "[kg] 咳嗽 → ...")
+    sess = store.get("s1")
+    assert sess["utterances"] == ["我发烧两天了", "还有点咳嗽"]
+    assert sess["embeddings"] == [[0.1, 0.2], [0.3, 0.4]]
+    assert len(sess["contexts"]) == 2
+
+
+def test_ttl_eviction():
+    """超过 ttl 未访问的会话被清除"""
+    store = InMemorySessionStore(ttl=0.05)
+    store.append("s1", ["你好"])
+    time.sleep(0.1)
+    assert store.get("s1") is None
+
+
+def test_window_and_merge():
+    assert window_transcript(["a", "b", "c"], 2) == "b\nc"
+    assert merge_contexts(["x\ny", "y\nz"]) == "x\ny\nz"
+
+
+def test_concurrent_append_utterances():
+    """同一会话并发追加：不丢句，每个请求读到的都是包含自己话语的一致前缀"""
+    store = InMemorySessionStore(ttl=60)
+    barrier = threading.Barrier(8)
+    seen = {}
+
+    def worker(i):
+        barrier.wait()
+        for j in range(50):
+            seen[(i, j)] = store.append_utterances("s1", [f"{i}-{j}"])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    final = store.get("s1")["utterances"]
+    assert sorted(final) == sorted(f"{i}-{j}" for i in range(8) for j in range(50))
+    for (i, j), utterances in seen.items():
+        assert utterances[-1] == f"{i}-{j}"
+        assert utterances == final[:len(utterances)]
+    assert len({len(u) for u in seen.values()}) == len(seen)
@@ -0,0 +1,72 @@
+# tests/test_snapshot.py
+
+import numpy as np
+import pytest
+
+from backend.rag.bm25_index import build_from_store
+from backend.rag.snapshot import Snapshot, SnapshotVectorStore, write_snapshot
+from backend.rag.vector_store import NumpyVectorStore, write_numpy_index
+
+
+def make_data(n=50, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"kg-{i}" for i in range(n)]
+    docs = [f"文档{i}：发热咳嗽" for i in range(n)]
+    metas = [{"title": f"标题{i}", "source_type": "kg", "chunk_index": i % 3} for i in range(n)]
+    return ids, vecs, docs, metas
+
+
+def test_snapshot_matches_numpy_store(tmp_path):
+    ids, vecs, docs, metas = make_data()
+    write_numpy_index(str(tmp_path / "np"), ids, vecs, docs, metas, dtype="int8", coarse_dim=8)
+    path = str(tmp_path / "index.snap")
+    header = write_snapshot(path, ids, vecs, docs, metas, dtype="int8", coarse_dim=8, index_version="v1")
+    assert header["count"] == 50 and header["coarse"] == {"dim": 8, "dtype": "int8"}
+
+    ref = NumpyVectorStore(str(tmp_path / "np"), candidates=20)
+    snap = SnapshotVectorStore(path, candidates=20, verify=True)
+    assert snap.count() == 50 and snap.dim == 16
+    res_ref = ref.query(vecs[[4, 31]], n_results=5, include_embeddings=True)
+    res = snap.query(vecs[[4, 31]], n_results=5, include_embeddings=True)
+    assert res["ids"] == res_ref["ids"]
+    assert res["documents"] == res_ref["documents"]
+    assert res["metadatas"] == res_ref["metadatas"]
+    assert np.allclose(res["distances"], res_ref["distances"])
+    assert np.allclose(res["embeddings"][0], res_ref["embeddings"][0])
+
+    got = snap.get(["kg-7", "missing"])
+    assert got["ids"] == ["kg-7"] and got["metadatas"][0]["title"] == "标题7"
+    assert snap.stats()["index_version"] == "v1"
+
+
+def test_snapshot_iterates_for_bm25(tmp_path):
+    ids, vecs, docs, metas = make_data(n=10)
+    path = str(tmp_path / "index.snap")
+    write_snapshot(path, ids, vecs, docs, metas)
+    store = SnapshotVectorStore(path)
+    assert list(store.ids) == ids and list(store.documents) == docs
+    assert build_from_store(store, str(tmp_path / "bm25")) == 10
+
+
+def test_empty_snapshot(tmp_path):
+    path = str(tmp_path / "empty.snap")
+    write_snapshot(path, [], [], [], [], dim=16)
+    store = SnapshotVectorStore(path, verify=True)
+    assert store.count() == 0
+    assert store.query(np.ones((1, 16), np.float32), n_results=3)["ids"] == [[]]
+
+
+def test_corruption_detected(tmp_path):
+    ids, vecs, docs, metas = make_data(n=10)
+    path = tmp_path / "index.snap"
+    write_snapshot(str(path), ids, vecs, docs, metas)
+    raw = bytearray(path.read_bytes())
+    raw[len(raw) // 2] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    Snapshot(str(path))  # 不校验时照常打开
+    with pytest.raises(ValueError):
+        Snapshot(str(path), verify=True)
+    path.write_bytes(b"not a snapshot")
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
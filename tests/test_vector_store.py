@@ -0,0 +1,108 @@
+# tests/test_vector_store.py
+
+import os
+
+import numpy as np
+import pytest
+
+from backend.rag import retrieval_cache
+from backend.rag.retrieval_cache import IndexVersionWatch, bump_index_version
+from backend.rag.vector_store import (
+    NumpyVectorStore, ReadOnlyStoreError, VectorStore, get_vector_store, write_numpy_index,
+)
+
+
+def make_index(path, n=20, dim=8, seed=0):
+    rng = np.random.default_rng(seed)
+    vecs = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"kg-{i}" for i in range(n)]
+    docs = [f"文档{i}" for i in range(n)]
+    metas = [{"title": f"标题{i}", "source_type": "kg", "chunk_index": 0} for i in range(n)]
+    write_numpy_index(str(path), ids, vecs, docs, metas)
+    return vecs / np.linalg.norm(vecs, axis=1, keepdims=True)
+
+
+def test_exact_search_matches_bruteforce(tmp_path):
+    vecs = make_index(tmp_path)
+    store = NumpyVectorStore(str(tmp_path))
+    assert store.count() == 20
+
+    res = store.query([vecs[3], vecs[7]], n_results=3)
+    assert res["ids"][0][0] == "kg-3"
+    assert res["ids"][1][0] == "kg-7"
+    assert res["documents"][0][0] == "文档3"
+    # 与 Chroma 的 l2 距离一致：自身距离接近 0，且按距离升序
+    assert abs(res["distances"][0][0]) < 1e-2
+    assert res["distances"][0] == sorted(res["distances"][0])
+
+
+def test_get_by_ids(tmp_path):
+    make_index(tmp_path)
+    store = NumpyVectorStore(str(tmp_path))
+    got = store.get(["kg-2", "missing", "kg-5"])
+    assert got["ids"] == ["kg-2", "kg-5"]
+    assert got["metadatas"][1]["title"] == "标题5"
+
+
+def test_two_stage_matches_exact(tmp_path):
+    rng = np.random.default_rng(1)
+    vecs = rng.normal(size=(200, 64)).astype(np.float32)
+    ids = [f"kg-{i}" for i in range(200)]
+    metas = [{"title": str(i), "source_type": "kg"} for i in range(200)]
+    write_numpy_index(str(tmp_path), ids, vecs, ids, metas, dtype="float32", coarse_dim=16)
+
+    exact = NumpyVectorStore(str(tmp_path), two_stage=False)
+    staged = NumpyVectorStore(str(tmp_path), two_stage=True, candidates=40)
+    assert staged.stats()["coarse_dim"] == 16 and staged.stats()["coarse_dtype"] == "int8"
+    queries = vecs[[3, 50, 120]]
+    a = exact.query(queries, n_results=3)
+    b = staged.query(queries, n_results=3)
+    # 查询就是库中向量时，粗排必能把它留在候选里，精排后的首位与精确检索一致
+    assert [r[0] for r in b["ids"]] == [r[0] for r in a["ids"]] == ["kg-3", "kg-50", "kg-120"]
+    assert np.allclose(b["distances"][0][0], a["distances"][0][0], atol=1e-5)
+
+    # 重新导出不带粗排矩阵时，旧的 coarse/ 被清掉
+    write_numpy_index(str(tmp_path), ids, vecs, ids, metas)
+    assert "coarse_dim" not in NumpyVectorStore(str(tmp_path)).stats()
+
+
+def test_reopened_after_version_bump(tmp_path, monkeypatch):
+    version = str(tmp_path / "index.version")
+    monkeypatch.setattr(retrieval_cache, "_watch", IndexVersionWatch(check_interval=0, version_path=version))
+    bump_index_version(version)
+    make_index(tmp_path / "np", n=20)
+    store = get_vector_store("numpy", str(tmp_path / "np"))
+    assert get_vector_store("numpy", str(tmp_path / "np")) is store
+
+    # 重建索引并更新版本号后，拿到的是新打开的实例
+    make_index(tmp_path / "np", n=30, seed=1)
+    bump_index_version(version)
+    reopened = get_vector_store("numpy", str(tmp_path / "np"))
+    assert reopened is not store and reopened.count() == 30
+
+
+def test_rewrite_does_not_touch_open_index(tmp_path):
+    """重新导出写到新的版本目录再切换 CURRENT：已打开的实例不受影响，只保留当前与上一版本"""
+    make_index(tmp_path / "np", n=20)
+    old = NumpyVectorStore(str(tmp_path / "np"))
+    make_index(tmp_path / "np", n=30, seed=1)
+    assert NumpyVectorStore(str(tmp_path / "np")).count() == 30
+    assert old.count() == 20
+    assert old.query(old.embeddings([3]), n_results=1)["ids"][0][0] == "kg-3"
+
+    make_index(tmp_path / "np", n=10, seed=2)
+    entries = os.listdir(tmp_path / "np")
+    assert len([e for e in entries if e.startswith("gen-")]) == 2
+    assert {e for e in entries if not e.startswith("gen-")} == {"CURRENT"}
+    assert NumpyVectorStore(str(tmp_path / "np")).count() == 10
+
+
+def test_numpy_store_is_read_only(tmp_path):
+    make_index(tmp_path)
+    store = NumpyVectorStore(str(tmp_path))
+    with pytest.raises(ReadOnlyStoreError):
+        store.upsert(["kg-0"], ["文档"], [[0.0] * 8], [{}])
+    with pytest.raises(PermissionError):
+        store.delete(["kg-0"])
+    with pytest.raises(TypeError):
+        VectorStore()